@@ -0,0 +1,221 @@
+"""
+Activity log pipeline.
+
+Signal handlers build ActivityLog rows from data already on the instance
+and hand them to record(). Views using ActorMixin make the requesting
+user the actor of the events their writes cause (see current_actor()).
+How events reach the database depends on settings.ACTIVITY_LOG_MODE:
+
+* 'sync'   - written immediately with bulk_create (tests and benchmarks).
+* 'thread' - buffered in-process once the surrounding transaction commits
+             and flushed with bulk_create by a background thread.
+* 'queue'  - written to the ActivityQueue outbox inside the caller's
+             transaction and moved into ActivityLog by the
+             process_activity_queue command.
+
+Event ids are assigned when the event is built, so a batch that is
+delivered twice is de-duplicated by bulk_create(ignore_conflicts=True).
+That gives the queue mode an at-least-once guarantee across crashes; the
+thread mode retries failed flushes but loses whatever is buffered if the
+process dies.
+"""
+import atexit
+import logging
+import threading
+import uuid
+from contextvars import ContextVar
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .cache import bump_project_version
+from .models import ActivityLog, ActivityQueue, Project
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+_actor = ContextVar('activity_actor', default=None)
+
+def activity_mode():
+    return getattr(settings, 'ACTIVITY_LOG_MODE', 'sync')
+
+def current_actor():
+    """Id of the user making the current request, or None outside one"""
+    return _actor.get()
+
+class ActorMixin:
+    """Make the authenticated user the actor of activity logged while a
+    viewset handles the request"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        self._actor_token = _actor.set(user.id if user.is_authenticated else None)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_actor_token', None)
+        if token is not None:
+            _actor.reset(token)
+            self._actor_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+def build_event(project_id, actor_id, verb, target_type, target_id, meta=None, field=''):
+    """Unsaved ActivityLog built from ids only, so no related rows are loaded"""
+    return ActivityLog(
+        id=uuid.uuid4(),
+        project_id=project_id,
+        actor_id=actor_id,
+        verb=verb,
+        target_type=target_type,
+        target_id=str(target_id),
+        field=field,
+        meta=meta or {},
+        created_at=timezone.now(),
+    )
+
+def to_payload(event):
+    return {
+        'id': str(event.id),
+        'project_id': str(event.project_id),
+        'actor_id': event.actor_id,
+        'verb': event.verb,
+        'target_type': event.target_type,
+        'target_id': event.target_id,
+        'field': event.field,
+        'meta': event.meta,
+        'created_at': event.created_at.isoformat(),
+    }
+
+def from_payload(payload):
+    return ActivityLog(
+        id=uuid.UUID(payload['id']),
+        project_id=payload['project_id'],
+        actor_id=payload['actor_id'],
+        verb=payload['verb'],
+        target_type=payload['target_type'],
+        target_id=payload['target_id'],
+        field=payload.get('field', ''),
+        meta=payload['meta'],
+        created_at=parse_datetime(payload['created_at']),
+    )
+
+def write_events(events):
+    """Insert events, skipping any that were already delivered.
+
+    Buffered events can outlive their project or actor; if the batch hits
+    a foreign key error those events are dropped and the rest retried.
+    """
+    if not events:
+        return
+    try:
+        with transaction.atomic():
+            ActivityLog.objects.bulk_create(events, ignore_conflicts=True)
+        _bump_versions(events)
+    except IntegrityError:
+        live = live_events(events)
+        if len(live) < len(events):
+            write_events(live)
+        else:
+            raise
+
+def live_events(events):
+    """The events whose project and actor still exist, logging the rest"""
+    projects = set(Project.objects.filter(id__in={e.project_id for e in events}).values_list('id', flat=True))
+    actors = set(User.objects.filter(id__in={e.actor_id for e in events}).values_list('id', flat=True))
+    live = [e for e in events if uuid.UUID(str(e.project_id)) in projects and e.actor_id in actors]
+    if len(live) < len(events):
+        logger.warning('Dropping %d activity event(s) for deleted projects or users', len(events) - len(live))
+    return live
+
+def _bump_versions(events):
+    # Events can land after the write that caused them, so cached feeds
+    # are invalidated again once they are stored (and committed)
+    for project_id in {str(event.project_id) for event in events}:
+        transaction.on_commit(lambda project_id=project_id: bump_project_version(project_id))
+
+def record(*events):
+    """Send activity events down the configured pipeline"""
+    events = [event for event in events if event is not None]
+    if not events:
+        return
+    mode = activity_mode()
+    if mode == 'thread':
+        transaction.on_commit(lambda: activity_buffer.add(events))
+    elif mode == 'queue':
+        ActivityQueue.objects.bulk_create([ActivityQueue(payload=to_payload(event)) for event in events])
+    elif len(events) == 1:
+        # A plain INSERT avoids the BEGIN/COMMIT bulk_create wraps around it
+        events[0].save(force_insert=True)
+        _bump_versions(events)
+    else:
+        write_events(events)
+
+class ActivityBuffer:
+    """In-process buffer drained by a daemon thread in bulk_create batches"""
+
+    def __init__(self):
+        self._events = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 200)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'ACTIVITY_LOG_FLUSH_INTERVAL', 1.0)
+
+    def add(self, events):
+        with self._lock:
+            self._events.extend(events)
+            pending = len(self._events)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+                self._thread.start()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write everything buffered so far; failed batches are kept for retry"""
+        with self._lock:
+            events, self._events = self._events, []
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            try:
+                write_events(batch)
+            except Exception:
+                logger.exception('Activity flush failed, re-queueing %d event(s)', len(events) - start)
+                with self._lock:
+                    self._events[:0] = events[start:]
+                return False
+        return True
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+activity_buffer = ActivityBuffer()
+atexit.register(activity_buffer.flush)
+
+def drain_queue(batch_size=500):
+    """Move one batch from the ActivityQueue outbox into ActivityLog.
+
+    Returns the number of events moved. Rows are only deleted in the same
+    transaction that wrote them, so a crash mid-batch re-delivers it.
+    Events whose project or actor was deleted meanwhile are dropped up
+    front: inside this transaction a foreign key error would only surface
+    at commit (SQLite defers the check), failing the batch on every run.
+    """
+    with transaction.atomic():
+        rows = list(ActivityQueue.objects.order_by('id')[:batch_size])
+        if not rows:
+            return 0
+        write_events(live_events([from_payload(row.payload) for row in rows]))
+        ActivityQueue.objects.filter(id__in=[row.id for row in rows]).delete()
+    return len(rows)
@@ -1,11 +1,25 @@
 from django.contrib import admin
-from .models import Project, ProjectMember, Task, Comment, Notification, ActivityLog
+from .models import Project, ProjectMember, Task, Comment, Notification, ActivityLog, ImportJob
+from . import search
+
+class IndexedSearchMixin:
+    """Add full-text index matches to the changelist search, so long text
+    columns are not scanned with LIKE '%term%'"""
+    search_kind = None
+    
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results = results | queryset.filter(id__in=search.matching_ids(self.search_kind, search_term))
+        return results, may_have_duplicates
 
 @admin.register(Project)
-class ProjectAdmin(admin.ModelAdmin):
+class ProjectAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_kind = 'project'
     list_display = ['name', 'owner', 'members_count', 'is_archived', 'created_at']
+    list_select_related = ['owner', 'stats']
     list_filter = ['is_archived', 'created_at']
-    search_fields = ['name', 'description', 'owner__email']
+    search_fields = ['name', 'owner__email']
     readonly_fields = ['id', 'created_at', 'updated_at']
 
 @admin.register(ProjectMember)
@@ -15,17 +29,19 @@ class ProjectMemberAdmin(admin.ModelAdmin):
     search_fields = ['project__name', 'user__email']
 
 @admin.register(Task)
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_kind = 'task'
     list_display = ['title', 'project', 'assignee', 'status', 'priority', 'due_date', 'created_at']
     list_filter = ['status', 'priority', 'created_at']
-    search_fields = ['title', 'description', 'project__name', 'assignee__email']
+    search_fields = ['title', 'project__name', 'assignee__email']
     readonly_fields = ['id', 'created_at', 'updated_at']
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_kind = 'comment'
     list_display = ['project', 'task', 'author', 'created_at']
     list_filter = ['created_at']
-    search_fields = ['body', 'author__email', 'project__name']
+    search_fields = ['author__email', 'project__name']
     readonly_fields = ['id', 'created_at', 'updated_at']
 
 @admin.register(Notification)
@@ -36,6 +52,14 @@ class NotificationAdmin(admin.ModelAdmin):
 
 @admin.register(ActivityLog)
 class ActivityLogAdmin(admin.ModelAdmin):
-    list_display = ['project', 'actor', 'verb', 'target_type', 'created_at']
-    list_filter = ['verb', 'target_type', 'created_at']
-    search_fields = ['actor__email', 'project__name']
\ No newline at end of file
+    list_display = ['project', 'actor', 'verb', 'target_type', 'field', 'created_at']
+    list_filter = ['verb', 'target_type', 'field', 'created_at']
+    search_fields = ['actor__email', 'project__name']
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ['source_name', 'project', 'created_by', 'status', 'rows_processed', 'created_at']
+    list_select_related = ['project', 'created_by']
+    list_filter = ['status', 'format', 'created_at']
+    search_fields = ['source_name', 'created_by__email', 'project__name']
+    readonly_fields = ['id', 'created_at', 'updated_at', 'finished_at']
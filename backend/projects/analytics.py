@@ -0,0 +1,244 @@
+"""
+Daily task analytics per project: burndown, throughput and cycle time.
+
+Task writes fold into ProjectDailyStats rows as they happen, from the
+signal handlers, the bulk writers and the importer: tasks created,
+completed and reopened per day, the net change in each status count, and
+a histogram of cycle times (creation to completion). A Rollup gathers a
+write's increments per (project, day) and adds them with one upsert per
+row, so reports read one row per day however many tasks changed.
+
+project_report() serves /api/projects/{id}/analytics/ from those rows.
+Status counts on past days are worked back from the current ProjectStats
+counters, so they stay right for projects whose history predates the
+rollups. backfill() replays ActivityLog history, archived days included,
+into the rollups.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import ActivityLog, Project, ProjectDailyStats, ProjectStats
+from .retention import archived_events
+from .stats import STATUSES, rebuild_project_stats
+
+def analytics_max_days():
+    return getattr(settings, 'ANALYTICS_MAX_DAYS', 365)
+
+def _day(at):
+    return timezone.localdate(at) if timezone.is_aware(at) else at.date()
+
+class Rollup:
+    """Counter increments per (project, day), written by save()"""
+
+    def __init__(self):
+        self.rows = defaultdict(Counter)
+
+    def created(self, project_id, status, at, count_completion=True):
+        """A task created at `at`; one created as done also counts as completed
+        unless count_completion is False (e.g. imported history)"""
+        row = self.rows[project_id, _day(at)]
+        row['created'] += 1
+        row[ProjectDailyStats.delta_field(status)] += 1
+        if status == 'done' and count_completion:
+            self._completed(row, 0)
+
+    def transition(self, project_id, old_status, new_status, at, created_at=None):
+        """A task moving from old_status to new_status at `at`"""
+        if old_status == new_status:
+            return
+        row = self.rows[project_id, _day(at)]
+        row[ProjectDailyStats.delta_field(old_status)] -= 1
+        row[ProjectDailyStats.delta_field(new_status)] += 1
+        if new_status == 'done':
+            self._completed(row, (at - created_at).total_seconds() if created_at else None)
+        elif old_status == 'done':
+            row['reopened'] += 1
+
+    def adjust(self, project_id, status, at, delta):
+        """Tasks in status joining (delta > 0) or leaving the project other than
+        by creation, e.g. deleted or moved between projects"""
+        self.rows[project_id, _day(at)][ProjectDailyStats.delta_field(status)] += delta
+
+    def _completed(self, row, seconds):
+        row['completed'] += 1
+        if seconds is not None:
+            seconds = max(seconds, 0)
+            row['cycle_time_total'] += seconds
+            row[ProjectDailyStats.cycle_field(seconds)] += 1
+
+    def save(self):
+        for (project_id, day), counters in self.rows.items():
+            add(project_id, day, counters)
+        self.rows.clear()
+
+def _counter_fields():
+    return [field.attname for field in ProjectDailyStats._meta.concrete_fields
+            if field.attname not in ('id', 'project_id', 'date')]
+
+def add(project_id, day, counters):
+    """Add counters ({column: increment}) to a project's row for day"""
+    counters = {field: value for field, value in counters.items() if value}
+    if not project_id or not counters:
+        return
+    if connection.vendor in ('sqlite', 'postgresql'):
+        _upsert(project_id, day, counters)
+        return
+    with transaction.atomic():
+        rows = ProjectDailyStats.objects.filter(project_id=project_id, date=day)
+        if rows.update(**{field: F(field) + value for field, value in counters.items()}):
+            return
+        try:
+            with transaction.atomic():
+                ProjectDailyStats.objects.create(project_id=project_id, date=day, **counters)
+        except IntegrityError:
+            # Another writer created the row first
+            rows.update(**{field: F(field) + value for field, value in counters.items()})
+
+def _upsert(project_id, day, counters):
+    """One INSERT ... ON CONFLICT DO UPDATE statement; both SQLite and
+    PostgreSQL accept this form"""
+    meta = ProjectDailyStats._meta
+    table = connection.ops.quote_name(meta.db_table)
+    fields = _counter_fields()
+    columns = ['project_id', 'date'] + fields
+    params = [
+        meta.get_field('project').get_db_prep_value(project_id, connection),
+        meta.get_field('date').get_db_prep_value(day, connection),
+    ] + [counters.get(field, 0) for field in fields]
+    quoted = [connection.ops.quote_name(column) for column in columns]
+    updates = ', '.join(
+        f'{name} = {table}.{name} + excluded.{name}'
+        for name in (connection.ops.quote_name(field) for field in fields if field in counters)
+    )
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quoted)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT ({quoted[0]}, {quoted[1]}) DO UPDATE SET {updates}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+def _current_counts(project):
+    stats = project.get_stats()
+    if stats is None:
+        rebuild_project_stats([project.id])
+        stats = ProjectStats.objects.get(project_id=project.id)
+    return {status: getattr(stats, ProjectStats.status_field(status)) for status in STATUSES}
+
+def _percentile(buckets, count, fraction):
+    """Upper bound in days of the bucket holding the given fraction of
+    completions; None when it falls in the open-ended last bucket"""
+    seen = 0
+    for bound, n in buckets:
+        seen += n
+        if seen >= count * fraction:
+            return bound
+    return None
+
+def project_report(project, start, end):
+    """Burndown, throughput and cycle times of a project from start to end (dates)"""
+    delta_fields = [ProjectDailyStats.delta_field(status) for status in STATUSES]
+    rows = {row['date']: row for row in ProjectDailyStats.objects.filter(
+        project=project, date__gte=start, date__lte=end
+    ).values()}
+    later = ProjectDailyStats.objects.filter(project=project, date__gt=end).aggregate(
+        **{field: Sum(field) for field in delta_fields}
+    )
+
+    # Counts at the end of `end`, then of each earlier day, undoing deltas
+    counts = _current_counts(project)
+    for status in STATUSES:
+        counts[status] -= later[ProjectDailyStats.delta_field(status)] or 0
+    days = []
+    cycle = Counter()
+    day = end
+    while day >= start:
+        row = rows.get(day, {})
+        days.append({
+            'date': day,
+            'created': row.get('created', 0),
+            'completed': row.get('completed', 0),
+            'reopened': row.get('reopened', 0),
+            'open': sum(n for status, n in counts.items() if status != 'done'),
+            'by_status': dict(counts),
+        })
+        for status in STATUSES:
+            counts[status] -= row.get(ProjectDailyStats.delta_field(status), 0)
+        for field in ProjectDailyStats.cycle_fields() + ['cycle_time_total']:
+            cycle[field] += row.get(field, 0)
+        day -= timedelta(days=1)
+    days.reverse()
+
+    completed = sum(entry['completed'] for entry in days)
+    bounds = ProjectDailyStats.CYCLE_TIME_BUCKETS + [None]
+    buckets = [(bound, cycle[field]) for bound, field in zip(bounds, ProjectDailyStats.cycle_fields())]
+    timed = sum(n for _, n in buckets)
+    return {
+        'start': start,
+        'end': end,
+        'days': days,
+        'throughput': {
+            'completed': completed,
+            'per_week': round(completed * 7 / len(days), 2),
+        },
+        'cycle_time': {
+            'count': timed,
+            'mean_hours': round(cycle['cycle_time_total'] / timed / 3600, 2) if timed else None,
+            'p50_days': _percentile(buckets, timed, 0.5) if timed else None,
+            'p85_days': _percentile(buckets, timed, 0.85) if timed else None,
+            'histogram': [{'le_days': bound, 'count': n} for bound, n in buckets],
+        },
+    }
+
+def _task_history(project_id, chunk_size):
+    """(target_id, verb, field, meta, created_at) of the project's task
+    events that can carry a status, archived days first, oldest first"""
+    for event in archived_events(project_id):
+        if event.target_type == 'task' and event.field in ('', 'status'):
+            yield event.target_id, event.verb, event.field, event.meta, event.created_at
+    events = ActivityLog.objects.filter(
+        project_id=project_id, target_type='task', field__in=['', 'status']
+    ).order_by('created_at', 'id').values_list('target_id', 'verb', 'field', 'meta', 'created_at')
+    yield from events.iterator(chunk_size=chunk_size)
+
+def _backfill_project(project_id, chunk_size):
+    rollup = Rollup()
+    # Last known status and creation time per task; tasks created before
+    # the activity history began only get a status when first updated
+    tasks = {}
+    for target_id, verb, field, meta, at in _task_history(project_id, chunk_size):
+        # Status changes carry their new value in 'to'; creations (and
+        # updates logged before per-field events) a snapshot with 'status'
+        status = (meta or {}).get('to' if field == 'status' else 'status')
+        if status not in STATUSES:
+            continue
+        known = tasks.get(target_id)
+        if verb == 'created':
+            rollup.created(project_id, status, at)
+            tasks[target_id] = (status, at)
+        elif known is None:
+            tasks[target_id] = (status, None)
+        elif known[0] != status:
+            rollup.transition(project_id, known[0], status, at, created_at=known[1])
+            tasks[target_id] = (status, known[1])
+
+    with transaction.atomic():
+        ProjectDailyStats.objects.filter(project_id=project_id).delete()
+        ProjectDailyStats.objects.bulk_create([
+            ProjectDailyStats(project_id=project_id, date=day, **counters)
+            for (_, day), counters in rollup.rows.items()
+        ], batch_size=chunk_size)
+    return len(rollup.rows)
+
+def backfill(project_ids=None, chunk_size=2000):
+    """Rebuild the rollups of the projects (all when None) from their
+    ActivityLog history, streamed chunk_size events at a time; returns the
+    number of rows written. Writes made during a project's replay are
+    lost, so run it while the projects are quiet."""
+    projects = Project.objects.order_by('id')
+    if project_ids is not None:
+        projects = projects.filter(id__in=project_ids)
+    return sum(_backfill_project(project_id, chunk_size)
+               for project_id in list(projects.values_list('id', flat=True)))
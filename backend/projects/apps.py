@@ -1,8 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 class ProjectsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'projects'
     
     def ready(self):
-        import projects.signals
\ No newline at end of file
+        import projects.signals
+        from .search import setup_index
+        post_migrate.connect(setup_index, sender=self)
+        from .database import configure_sqlite
+        connection_created.connect(configure_sqlite)
@@ -0,0 +1,389 @@
+"""
+Seeded benchmark and query budget checks for the REST API.
+
+Used by the ``benchmark_api`` management command. Every route registered on
+the projects router must have at least one scenario here; each scenario has
+a query budget that the command enforces.
+"""
+import itertools
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import User
+from .models import Project, ProjectMember, Task, Comment, Notification, ActivityLog, ImportJob
+from .analytics import backfill
+from .board import board_snapshot
+from .retention import retire_activity
+from .search import rebuild_documents
+from .stats import rebuild_project_stats
+from .urls import router
+
+SCALES = {
+    'small': {
+        'users': 40, 'projects': 50, 'member_projects': 20, 'members_per_project': 5,
+        'tasks': 2000, 'thread_depth': 15, 'thread_width': 20, 'notifications': 500, 'activities': 2000,
+        'archived_activities': 500,
+    },
+    'large': {
+        'users': 400, 'projects': 2000, 'member_projects': 200, 'members_per_project': 8,
+        'tasks': 100000, 'thread_depth': 60, 'thread_width': 200, 'notifications': 20000, 'activities': 100000,
+        'archived_activities': 20000,
+    },
+}
+
+BATCH_SIZE = 1000
+ARCHIVE_AGE_DAYS = 100
+
+# Items per request in the bulk endpoint scenarios
+BULK_ITEMS = 50
+
+# Tasks (each with one comment) in the import scenarios' input
+IMPORT_TASKS = 20
+
+class Scenario:
+    """One request against a named route, with the query budget it must meet"""
+
+    def __init__(self, route, budget, method='get', build=None, name=None):
+        self.route = route
+        self.budget = budget
+        self.method = method
+        self.build = build or (lambda ctx: {})
+        self.name = name or f'{method.upper()} {route}'
+
+# Budgets are measured against the 'small' scale. Endpoints that still
+# issue per-row queries carry budgets that grow with the seeded volumes.
+SCENARIOS = [
+    Scenario('project-list', 3),
+    Scenario('project-list', 11, method='post', name='POST project-list',
+             build=lambda ctx: {'data': {'name': 'Bench project', 'description': 'x' * 200}}),
+    Scenario('project-detail', 4, build=lambda ctx: {'kwargs': {'pk': ctx['project'].pk}}),
+    Scenario('project-detail', 4, method='patch',
+             build=lambda ctx: {'kwargs': {'pk': ctx['project'].pk}, 'data': {'description': 'updated'}}),
+    Scenario('project-detail', 18, method='delete',
+             build=lambda ctx: {'kwargs': {'pk': _scratch_project(ctx).pk}}),
+    Scenario('project-add-member', 12, method='post',
+             build=lambda ctx: {'kwargs': {'pk': _scratch_project(ctx).pk},
+                                'data': {'user_id': str(ctx['users'][1].pk), 'role': 'member'}}),
+    Scenario('project-export', 3, build=lambda ctx: {'kwargs': {'pk': ctx['project'].pk}, 'params': {'kind': 'tasks'}}),
+    # The seeded project's history spans two export chunks, each resolving its users
+    Scenario('project-export', 4, name='GET project-export activity ndjson gzip',
+             build=lambda ctx: {'kwargs': {'pk': ctx['project'].pk},
+                                'params': {'kind': 'activity', 'output': 'ndjson', 'gzip': 'true'}}),
+    Scenario('project-analytics', 3, build=lambda ctx: {'kwargs': {'pk': ctx['project'].pk}, 'params': {'days': 90}}),
+    Scenario('project-board', 6, build=lambda ctx: {'kwargs': {'pk': ctx['project'].pk}}),
+    Scenario('project-board', 7, name='GET project-board since a version',
+             build=lambda ctx: {'kwargs': {'pk': ctx['project'].pk}, 'params': {'since': _board_version(ctx)}}),
+    Scenario('task-list', 2, build=lambda ctx: {'params': {'project': ctx['project'].pk}}),
+    Scenario('task-list', 2, name='GET task-list board fields, users map',
+             build=lambda ctx: {'params': {'project': ctx['project'].pk, 'users': 'map',
+                                           'fields': 'id,title,status,priority,assignee,order'}}),
+    Scenario('task-list', 10, method='post',
+             build=lambda ctx: {'params': {'project': ctx['project'].pk},
+                                'data': {'project_id': str(ctx['project'].pk), 'title': 'Bench task',
+                                         'assignee_id': str(ctx['users'][1].pk)}}),
+    Scenario('task-detail', 2, build=lambda ctx: {'kwargs': {'pk': ctx['task'].pk},
+                                                  'params': {'project': ctx['project'].pk}}),
+    Scenario('task-detail', 13, method='patch',
+             build=lambda ctx: {'kwargs': {'pk': ctx['task'].pk}, 'params': {'project': ctx['project'].pk},
+                                'data': {'status': random.choice(['todo', 'in_progress', 'done'])}}),
+    Scenario('task-detail', 13, method='delete',
+             build=lambda ctx: {'kwargs': {'pk': _scratch_task(ctx).pk}, 'params': {'project': ctx['project'].pk}}),
+    Scenario('task-mine', 2, build=lambda ctx: {'params': {'status': 'todo,in_progress'}}),
+    Scenario('task-bulk', 14, method='post',
+             build=lambda ctx: {'data': {'project_id': str(ctx['project'].pk), 'tasks': [
+                 {'title': f'Bulk task {i}', 'assignee_id': ctx['users'][1].pk} for i in range(BULK_ITEMS)]}}),
+    Scenario('task-bulk', 18, method='patch',
+             build=lambda ctx: {'data': {'project_id': str(ctx['project'].pk), 'tasks': [
+                 {'id': str(pk), 'status': random.choice(['todo', 'in_progress', 'done']), 'order': i}
+                 for i, pk in enumerate(_board_task_ids(ctx))]}}),
+    Scenario('task-bulk', 15, method='delete',
+             build=lambda ctx: {'data': {'project_id': str(ctx['project'].pk),
+                                         'ids': [str(task.pk) for task in _scratch_tasks(ctx, BULK_ITEMS)]}}),
+    Scenario('task-workload', 4, build=lambda ctx: {'params': {'project': ctx['project'].pk}}),
+    # Includes the inline rebalance when the bulk scenarios left tied keys
+    Scenario('task-reorder', 20, method='post',
+             build=lambda ctx: {'kwargs': {'pk': ctx['task'].pk}, 'params': {'project': ctx['project'].pk},
+                                'data': {'after': str(random.choice(
+                                    [pk for pk in _board_task_ids(ctx) if pk != ctx['task'].pk]))}}),
+    Scenario('task-watch', 5, method='post',
+             build=lambda ctx: {'kwargs': {'pk': ctx['task'].pk}, 'params': {'project': ctx['project'].pk}}),
+    Scenario('comment-list', 6, build=lambda ctx: {'params': {'task': ctx['task'].pk}}),
+    Scenario('comment-list', 12, method='post',
+             build=lambda ctx: {'params': {'project': ctx['project'].pk},
+                                'data': {'project_id': str(ctx['project'].pk), 'task_id': str(ctx['task'].pk),
+                                         'body': 'Bench comment'}}),
+    Scenario('comment-detail', 4, build=lambda ctx: {'kwargs': {'pk': ctx['root_comment'].pk},
+                                                      'params': {'task': ctx['task'].pk}}),
+    Scenario('notification-list', 2),
+    Scenario('notification-detail', 2, build=lambda ctx: {'kwargs': {'pk': ctx['notification'].pk}}),
+    Scenario('notification-detail', 3, method='patch',
+             build=lambda ctx: {'kwargs': {'pk': ctx['notification'].pk}, 'data': {'is_read': True}}),
+    Scenario('notification-unread-count', 1),
+    Scenario('notification-mark-all-read', 2, method='post'),
+    Scenario('activity-list', 2, build=lambda ctx: {'params': {'project': ctx['project'].pk}}),
+    Scenario('activity-list', 2, name='GET activity-list task status changes',
+             build=lambda ctx: {'params': {'project': ctx['project'].pk, 'target_type': 'task',
+                                           'target_id': ctx['task'].pk, 'field': 'status'}}),
+    Scenario('activity-archive', 2, build=lambda ctx: {'params': {'project': ctx['project'].pk,
+                                                                  'date': ctx['archived_day'].isoformat()}}),
+    Scenario('activity-summary', 3, build=lambda ctx: {'params': {'project': ctx['project'].pk}}),
+    Scenario('activity-detail', 2, build=lambda ctx: {'kwargs': {'pk': ctx['activity'].pk},
+                                                     'params': {'project': ctx['project'].pk}}),
+    Scenario('import-list', 1),
+    # Imports run inline under the benchmark, so this includes the whole
+    # import: one new project, a member and IMPORT_TASKS tasks and comments
+    Scenario('import-list', 36, method='post', name='POST import-list',
+             build=lambda ctx: {'format': 'multipart', 'data': {
+                 'file': SimpleUploadedFile('bench.ndjson', _import_input(ctx))}}),
+    Scenario('import-detail', 1, build=lambda ctx: {'kwargs': {'pk': _import_job(ctx).pk}}),
+    Scenario('import-resume', 36, method='post', build=lambda ctx: {'kwargs': {'pk': _failed_import(ctx).pk}}),
+    Scenario('search', 3, build=lambda ctx: {'params': {'q': 'seeded task'}}),
+    Scenario('me', 1),
+    Scenario('profile', 1),
+]
+
+def router_route_names():
+    """Names of all routes registered on the projects router"""
+    return {url.name for url in router.urls if url.name != 'api-root'}
+
+def uncovered_routes(scenarios=SCENARIOS):
+    covered = {scenario.route for scenario in scenarios}
+    return sorted(router_route_names() - covered)
+
+def _scratch_project(ctx):
+    owner = ctx['user']
+    project = Project.objects.create(name='Scratch', owner=owner)
+    ProjectMember.objects.create(project=project, user=owner, role='admin')
+    return project
+
+def _scratch_task(ctx):
+    return Task.objects.create(project=ctx['project'], title='Scratch', reporter=ctx['user'])
+
+def _scratch_tasks(ctx, count):
+    return Task.objects.bulk_create(
+        Task(project=ctx['project'], title=f'Scratch {i}', reporter=ctx['user']) for i in range(count)
+    )
+
+def _board_task_ids(ctx):
+    return Task.objects.filter(project=ctx['project']).order_by('order').values_list('id', flat=True)[:BULK_ITEMS]
+
+def _board_version(ctx):
+    # A version a client has been served, then a change after it
+    version = board_snapshot(ctx['project'].pk)['version']
+    task = Task.objects.filter(project=ctx['project']).order_by('order').first()
+    task.save(update_fields=['updated_at'])
+    return version
+
+def _import_input(ctx):
+    records = [
+        {'type': 'project', 'name': 'Imported project'},
+        {'type': 'member', 'email': ctx['users'][1].email},
+    ]
+    for i in range(IMPORT_TASKS):
+        records.append({'type': 'task', 'ref': f'T{i}', 'title': f'Imported task {i}',
+                        'assignee': ctx['users'][1].email})
+        records.append({'type': 'comment', 'task': f'T{i}', 'body': 'Imported comment'})
+    return ''.join(json.dumps(record) + '\n' for record in records).encode()
+
+def _import_job(ctx):
+    if 'import_job' not in ctx:
+        ctx['import_job'] = ImportJob.objects.create(created_by=ctx['user'], format='ndjson', status='completed')
+    return ctx['import_job']
+
+def _failed_import(ctx):
+    return ImportJob.objects.create(created_by=ctx['user'], format='ndjson', status='failed',
+                                    source=ContentFile(_import_input(ctx), name='bench.ndjson'))
+
+def seed(scale='small', seed_value=0):
+    """Populate the current database and return the context used by scenarios.
+
+    Rows are written with bulk_create, so the denormalized counters and the
+    search documents are rebuilt at the end instead of being maintained by
+    signals.
+    """
+    config = SCALES[scale]
+    rng = random.Random(seed_value)
+    now = timezone.now()
+
+    users = [
+        User(username=f'bench{i}', email=f'bench{i}@example.com', full_name=f'Bench User {i}')
+        for i in range(config['users'])
+    ]
+    User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+    users = list(User.objects.filter(username__startswith='bench').order_by('username'))
+    user = users[0]
+
+    projects = [
+        Project(name=f'Project {i}', description='Seeded project ' * 10, owner=rng.choice(users),
+                created_at=now - timedelta(days=rng.randint(0, 365)))
+        for i in range(config['projects'])
+    ]
+    Project.objects.bulk_create(projects, batch_size=BATCH_SIZE)
+
+    members = []
+    for index, project in enumerate(projects):
+        roster = set(rng.sample(users[1:], min(config['members_per_project'], len(users) - 1)))
+        roster.add(project.owner)
+        if index < config['member_projects']:
+            roster.add(user)
+        for member in roster:
+            role = 'admin' if member in (project.owner, user) else 'member'
+            members.append(ProjectMember(project=project, user=member, role=role))
+    ProjectMember.objects.bulk_create(members, batch_size=BATCH_SIZE)
+
+    statuses = [choice[0] for choice in Task.STATUS_CHOICES]
+    priorities = [choice[0] for choice in Task.PRIORITY_CHOICES]
+    project = projects[0]
+    project_users = [m.user for m in members if m.project_id == project.id]
+    # Half of the tasks land on the benchmark project so its board is large.
+    task_projects = itertools.chain(
+        itertools.repeat(project, config['tasks'] // 2),
+        (rng.choice(projects) for _ in range(config['tasks'] - config['tasks'] // 2)),
+    )
+    tasks = []
+    for i, task_project in enumerate(task_projects):
+        tasks.append(Task(
+            project=task_project, title=f'Task {i}', description='Seeded task description ' * 5,
+            status=rng.choice(statuses), priority=rng.choice(priorities),
+            assignee=rng.choice(project_users) if task_project is project else None,
+            reporter=user, order=float(i),
+            due_date=(now + timedelta(days=rng.randint(-30, 60))).date(),
+        ))
+        if len(tasks) >= BATCH_SIZE:
+            Task.objects.bulk_create(tasks)
+            tasks = []
+    Task.objects.bulk_create(tasks)
+    task = Task.objects.filter(project=project).order_by('order').first()
+
+    # One wide thread plus one deep reply chain on the benchmark task
+    root = Comment.objects.create(project=project, task=task, author=user, body='Thread root')
+    Comment.objects.bulk_create([
+        Comment(project=project, task=task, author=rng.choice(project_users), parent=root, root=root, depth=1,
+                body=f'Reply {i}')
+        for i in range(config['thread_width'])
+    ], batch_size=BATCH_SIZE)
+    parent = root
+    for depth in range(config['thread_depth']):
+        parent = Comment.objects.create(project=project, task=task, author=rng.choice(project_users),
+                                        parent=parent, body=f'Nested reply {depth}')
+
+    types = [choice[0] for choice in Notification.TYPE_CHOICES]
+    Notification.objects.bulk_create([
+        Notification(user=user, type=rng.choice(types), project=project, task=task,
+                     message=f'Notification {i}', is_read=rng.random() < 0.5,
+                     created_at=now - timedelta(minutes=i))
+        for i in range(config['notifications'])
+    ], batch_size=BATCH_SIZE)
+
+    ActivityLog.objects.bulk_create([
+        ActivityLog(project=project, actor=rng.choice(project_users), verb='updated', target_type='task',
+                    target_id=str(task.id), field='status',
+                    meta={'task_title': task.title, 'type': 'choice',
+                          'from': rng.choice(statuses), 'to': rng.choice(statuses)},
+                    created_at=now - timedelta(minutes=i))
+        for i in range(config['activities'])
+    ], batch_size=BATCH_SIZE)
+
+    # A day of older history, retired into a summary and an archive file
+    archived_at = now - timedelta(days=ARCHIVE_AGE_DAYS)
+    ActivityLog.objects.bulk_create([
+        ActivityLog(project=project, actor=rng.choice(project_users), verb='updated', target_type='task',
+                    target_id=str(task.id), field='priority',
+                    meta={'task_title': task.title, 'type': 'choice', 'from': 'low', 'to': 'high'},
+                    created_at=archived_at - timedelta(seconds=i))
+        for i in range(config['archived_activities'])
+    ], batch_size=BATCH_SIZE)
+    retire_activity(archived_at + timedelta(minutes=1), archive=True)
+
+    rebuild_project_stats()
+    rebuild_documents()
+    backfill([project.id])
+
+    return {
+        'user': user,
+        'users': [user] + [u for u in project_users if u != user],
+        'project': project,
+        'task': task,
+        'root_comment': root,
+        'notification': Notification.objects.filter(user=user).first(),
+        'activity': ActivityLog.objects.filter(project=project).first(),
+        'archived_day': timezone.localdate(archived_at),
+    }
+
+class Result:
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.queries = 0
+        self.timings = []
+        self.payload_bytes = 0
+        self.status_codes = set()
+        self.repeated_sql = []
+
+    @property
+    def p50_ms(self):
+        return statistics.median(self.timings) * 1000
+
+    @property
+    def p99_ms(self):
+        if len(self.timings) < 2:
+            return self.timings[0] * 1000
+        return statistics.quantiles(self.timings, n=100, method='inclusive')[98] * 1000
+
+    @property
+    def over_budget(self):
+        return self.queries > self.scenario.budget
+
+    @property
+    def errored(self):
+        return any(code >= 400 for code in self.status_codes)
+
+    def as_dict(self):
+        return {
+            'name': self.scenario.name,
+            'route': self.scenario.route,
+            'queries': self.queries,
+            'budget': self.scenario.budget,
+            'p50_ms': round(self.p50_ms, 2),
+            'p99_ms': round(self.p99_ms, 2),
+            'payload_bytes': self.payload_bytes,
+            'status_codes': sorted(self.status_codes),
+        }
+
+def run_scenario(scenario, ctx, iterations=10):
+    """Issue the scenario's request repeatedly and record the worst query count"""
+    client = APIClient(SERVER_NAME='localhost')
+    client.force_authenticate(ctx['user'])
+    result = Result(scenario)
+    for _ in range(iterations):
+        spec = scenario.build(ctx)
+        url = reverse(scenario.route, kwargs=spec.get('kwargs'))
+        params = spec.get('params')
+        if params:
+            url = f"{url}?{'&'.join(f'{k}={v}' for k, v in params.items())}"
+        request = getattr(client, scenario.method)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = request(url, spec.get('data'), format=spec.get('format', 'json'))
+            # A streaming body runs its queries as it is read
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            result.timings.append(time.perf_counter() - started)
+        result.status_codes.add(response.status_code)
+        result.payload_bytes = max(result.payload_bytes, len(content))
+        if len(captured) >= result.queries:
+            result.queries = len(captured)
+            counts = {}
+            for query in captured.captured_queries:
+                counts[query['sql']] = counts.get(query['sql'], 0) + 1
+            result.repeated_sql = sorted(
+                ((n, sql) for sql, n in counts.items() if n > 1), reverse=True
+            )[:3]
+    return result
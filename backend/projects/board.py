@@ -0,0 +1,114 @@
+"""
+Board snapshots: a whole project in one response.
+
+board_snapshot() returns the project, its member roster, every task
+grouped into status columns in board order, the assignee workload and the
+latest activity, in a fixed number of queries however many tasks there
+are. Users are side-loaded once in a "users" map (as with ?users=map on
+the task list). Snapshots are cached under the project's version stamp,
+which the response carries as "version".
+
+With since=<version> from an earlier response only the tasks changed
+after that snapshot are sent, plus the ordered ids of every column, so
+the client can apply moves and drop deleted tasks. The first time a
+version is served, its wall clock time is remembered in the cache;
+"changed" means updated since then, less settings.BOARD_DELTA_OVERLAP_SECONDS
+to cover writes whose transactions were still open. Versions are
+remembered for settings.BOARD_VERSION_TIMEOUT seconds; an unknown or
+expired one gets a full snapshot ("delta": false).
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from .cache import project_version, response_cache_timeout, versioned_caching, versioned_key
+from .models import ActivityLog, Project, ProjectMember, Task
+from .rows import PROJECT_ROWS, TASK_ROWS
+from .serializers import ActivityLogSerializer, UserBasicSerializer
+from .workload import cached_project_workload
+
+STATUSES = [choice[0] for choice in Task.STATUS_CHOICES]
+BOARD_ORDERING = ['order', '-created_at', 'id']
+
+_datetime = serializers.DateTimeField().to_representation
+
+def board_activity_limit():
+    return getattr(settings, 'BOARD_ACTIVITY_LIMIT', 20)
+
+def board_version_timeout():
+    return getattr(settings, 'BOARD_VERSION_TIMEOUT', 86400)
+
+def board_delta_overlap():
+    return timedelta(seconds=getattr(settings, 'BOARD_DELTA_OVERLAP_SECONDS', 30))
+
+def _seen_key(project_id, version):
+    return f'board-seen:{project_id}:{version}'
+
+def _rows(mapper, queryset, context, *extra):
+    names = list(mapper.fields)
+    columns, _, _ = mapper.plan(names, True)
+    rows = list(queryset.values(*columns, *extra))
+    data, users = mapper.render(rows, names, context, user_map=True)
+    for row, item in zip(rows, data):
+        item.update((name, row[name]) for name in extra)
+    return data, users
+
+def _build(project_id, since_at, context):
+    (project,), owners = _rows(PROJECT_ROWS, Project.objects.filter(id=project_id), context, 'is_archived')
+    members = list(ProjectMember.objects.filter(project_id=project_id).select_related('user').order_by('joined_at', 'id'))
+    tasks = Task.objects.filter(project_id=project_id).order_by(*BOARD_ORDERING)
+    activity = ActivityLog.objects.filter(project_id=project_id).select_related('actor').order_by(
+        '-created_at', '-id'
+    )[:board_activity_limit()]
+
+    if since_at is None:
+        rows, users = _rows(TASK_ROWS, tasks, context)
+        columns = {status: [] for status in STATUSES}
+        for row in rows:
+            columns[row['status']].append(row)
+        snapshot = {'delta': False, 'columns': columns}
+    else:
+        rows, users = _rows(TASK_ROWS, tasks.filter(updated_at__gte=since_at), context)
+        columns = {status: [] for status in STATUSES}
+        for task_id, status in tasks.values_list('id', 'status'):
+            columns[status].append(str(task_id))
+        snapshot = {'delta': True, 'tasks': rows, 'columns': columns}
+
+    users.update(owners)
+    for member in members:
+        users.setdefault(str(member.user_id), UserBasicSerializer(member.user, context=context).data)
+    return {
+        'project': project,
+        'members': [{'user': member.user_id, 'role': member.role, 'joined_at': _datetime(member.joined_at)} for member in members],
+        **snapshot,
+        'workload': cached_project_workload([str(project_id)]),
+        'activity': ActivityLogSerializer(activity, many=True, context=context).data,
+        'users': users,
+    }
+
+def board_snapshot(project_id, since=None, request=None):
+    """The board of a project, or its changes since an earlier version"""
+    project_id = str(project_id)
+    now = timezone.now()
+    version = str(project_version(project_id))
+    # Keep the first time this version was seen; later builds of it may
+    # already include writes made after it
+    cache.add(_seen_key(project_id, version), now.isoformat(), board_version_timeout())
+
+    since_at = None
+    if since:
+        seen = cache.get(_seen_key(project_id, since))
+        if seen is not None:
+            since_at = parse_datetime(seen) - board_delta_overlap()
+
+    if not versioned_caching():
+        return {'version': version, **_build(project_id, since_at, {'request': request})}
+    host = request.get_host() if request is not None else ''
+    key = versioned_key('board', [project_id], since if since_at else '', host)
+    data = cache.get(key)
+    if data is None:
+        data = _build(project_id, since_at, {'request': request})
+        cache.set(key, data, response_cache_timeout())
+    return {'version': version, **data}
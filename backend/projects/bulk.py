@@ -0,0 +1,196 @@
+"""
+Batch task writes behind the bulk endpoints on TaskViewSet.
+
+Every item of a batch is validated up front against a single lookup of
+the project's members. The valid items are then written with bulk_create,
+bulk_update or one DELETE inside a single transaction. Bulk writes skip
+the per-row signal handlers, so this module applies their side effects
+once per batch: search documents, stats counters, the project's cache
+version, activity rows, notifications and realtime events.
+
+Each function returns (written, errors). written lists (index, task)
+pairs and errors lists {'index', 'errors'} dicts. With atomic=True
+nothing is written if any item fails validation.
+"""
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from . import activity, analytics, realtime, search, stats
+from .cache import bump_project_version
+from .membership import normalize_project_id
+from .models import Notification, ProjectMember, Task
+from .notifications import discount_unread, interested_users_many, notify_many, unread_by_user
+from .serializers import TaskCreateUpdateSerializer
+from .signals import TRACKED_TASK_FIELDS, muted, task_activity, task_change_events, task_event
+
+def bulk_max_items():
+    return getattr(settings, 'TASK_BULK_MAX_ITEMS', 500)
+
+def check_batch(items, field):
+    """Reject a batch that is not a list or is too large to write at once"""
+    if not isinstance(items, list) or not items:
+        raise serializers.ValidationError({field: 'Expected a non-empty list.'})
+    if len(items) > bulk_max_items():
+        raise serializers.ValidationError({field: f'At most {bulk_max_items()} items per request.'})
+
+def _serializer_context(project, request):
+    members = set(ProjectMember.objects.filter(project=project).values_list('user_id', flat=True))
+    return {'request': request, 'project_id': str(project.id), 'project_members': members}
+
+def _find_tasks(project, ids):
+    """Resolve raw ids to the project's tasks, one query for the batch.
+
+    Returns the task (or None) for each id in order, plus an error per
+    index for ids that are malformed, unknown or repeated.
+    """
+    normalized = [normalize_project_id(task_id) for task_id in ids]
+    found = Task.objects.filter(project=project, id__in={pk for pk in normalized if pk}).in_bulk()
+    found = {str(pk): task for pk, task in found.items()}
+    tasks, errors, seen = [], {}, set()
+    for index, pk in enumerate(normalized):
+        task = found.get(pk)
+        if task is None:
+            errors[index] = {'id': ['Task not found in this project.']}
+        elif pk in seen:
+            errors[index] = {'id': ['Task appears more than once in the batch.']}
+            task = None
+        else:
+            seen.add(pk)
+        tasks.append(task)
+    return tasks, errors
+
+def _publish(project_id, event_type, tasks):
+    channel = realtime.project_channel(project_id)
+    for task in tasks:
+        realtime.publish(channel, event_type, task_event(task))
+
+def _assigned(project, task):
+    return ('task_assigned', f'You were assigned task "{task.title}" in project "{project.name}"',
+            project, task, None, {task.assignee_id})
+
+def create_tasks(project, user, items, request=None, atomic=False):
+    """Validate and insert a batch of new tasks reported by user"""
+    context = _serializer_context(project, request)
+    written, errors = [], []
+    for index, item in enumerate(items):
+        serializer = TaskCreateUpdateSerializer(data=item, context=context)
+        if serializer.is_valid():
+            written.append((index, Task(project=project, reporter=user, **serializer.validated_data)))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+    if not written or (atomic and errors):
+        return [], errors
+
+    tasks = [task for _, task in written]
+    with transaction.atomic():
+        Task.objects.bulk_create(tasks)
+        search.index_documents([search.task_document(task) for task in tasks])
+        stats.apply_task_deltas(project.id, Counter(task.status for task in tasks))
+        rollup = analytics.Rollup()
+        for task in tasks:
+            rollup.created(project.id, task.status, task.created_at)
+        rollup.save()
+        # Only once committed, or a read in between caches the old rows under the new stamp
+        transaction.on_commit(lambda: bump_project_version(project.id))
+        activity.record(*(task_activity(task, user.id, 'created') for task in tasks))
+        notify_many([_assigned(project, task) for task in tasks if task.assignee_id], actor=user)
+        _publish(project.id, 'task.created', tasks)
+    return written, errors
+
+def update_tasks(project, user, items, request=None, atomic=False):
+    """Validate and apply a batch of partial task updates (e.g. a board move).
+
+    Each item carries the task's "id" plus the fields to change.
+    """
+    ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+    tasks, errors = _find_tasks(project, ids)
+    context = _serializer_context(project, request)
+    written, changes = [], []
+    for index, (item, task) in enumerate(zip(items, tasks)):
+        if task is None:
+            continue
+        serializer = TaskCreateUpdateSerializer(task, data=item, partial=True, context=context)
+        if not serializer.is_valid():
+            errors[index] = serializer.errors
+            continue
+        changed = {field: value for field, value in serializer.validated_data.items()
+                   if getattr(task, field) != value}
+        written.append((index, task))
+        if changed:
+            changes.append((task, changed, task.status, task.assignee_id))
+    errors = [{'index': index, 'errors': errors[index]} for index in sorted(errors)]
+    if atomic and errors:
+        return [], errors
+    if not changes:
+        return written, errors
+
+    now = timezone.now()
+    fields = {'updated_at'}
+    status_deltas = Counter()
+    logged = []
+    for task, changed, old_status, old_assignee_id in changes:
+        attnames = [Task._meta.get_field(field).attname for field in changed]
+        old = {attname: getattr(task, attname) for attname in attnames if attname in TRACKED_TASK_FIELDS}
+        for field, value in changed.items():
+            setattr(task, field, value)
+        logged.extend(task_change_events(task, user.id, [
+            (attname, value, getattr(task, attname)) for attname, value in old.items()
+            if value != getattr(task, attname)
+        ]))
+        task.updated_at = now
+        fields.update(changed)
+        status_deltas[old_status] -= 1
+        status_deltas[task.status] += 1
+
+    changed_tasks = [task for task, _, _, _ in changes]
+    status_changed = [task for task, _, old_status, _ in changes if task.status != old_status]
+    reassigned = [task for task, _, _, old_assignee_id in changes
+                  if task.assignee_id and task.assignee_id != old_assignee_id]
+    with transaction.atomic():
+        Task.objects.bulk_update(changed_tasks, sorted(fields))
+        search.index_documents([search.task_document(task) for task, changed, _, _ in changes
+                                if changed.keys() & {'title', 'description'}])
+        stats.apply_task_deltas(project.id, status_deltas)
+        rollup = analytics.Rollup()
+        for task, _, old_status, _ in changes:
+            rollup.transition(project.id, old_status, task.status, now, created_at=task.created_at)
+        rollup.save()
+        transaction.on_commit(lambda: bump_project_version(project.id))
+        activity.record(*logged)
+        followers = interested_users_many(status_changed)
+        notify_many([_assigned(project, task) for task in reassigned] + [
+            ('task_updated', f'Task "{task.title}" status changed to {task.get_status_display()}',
+             project, task, None, followers[task.id])
+            for task in status_changed
+        ], actor=user)
+        _publish(project.id, 'task.updated', changed_tasks)
+    return written, errors
+
+def delete_tasks(project, ids, atomic=False):
+    """Delete a batch of the project's tasks with their comments"""
+    tasks, errors = _find_tasks(project, ids)
+    errors = [{'index': index, 'errors': errors[index]} for index in sorted(errors)]
+    written = [(index, task) for index, task in enumerate(tasks) if task is not None]
+    if not written or (atomic and errors):
+        return [], errors
+
+    task_ids = [task.id for _, task in written]
+    with transaction.atomic():
+        # Unread notifications about these tasks go with them
+        unread = unread_by_user(Notification.objects.filter(task_id__in=task_ids))
+        with muted():
+            Task.objects.filter(id__in=task_ids).delete()
+        removed = Counter(task.status for _, task in written)
+        stats.apply_task_deltas(project.id, {status: -n for status, n in removed.items()})
+        rollup = analytics.Rollup()
+        for status, n in removed.items():
+            rollup.adjust(project.id, status, timezone.now(), -n)
+        rollup.save()
+        transaction.on_commit(lambda: bump_project_version(project.id))
+        channel = realtime.project_channel(project.id)
+        for task_id in task_ids:
+            realtime.publish(channel, 'task.deleted', {'id': str(task_id)})
+    discount_unread(unread)
+    return written, errors
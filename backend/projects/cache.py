@@ -0,0 +1,126 @@
+"""
+Per-project version stamps and the caches keyed on them.
+
+Every write to a project's data bumps its stamp (see projects.signals),
+so anything cached under a versioned_key() is invalidated without
+tracking individual entries.
+
+A bump is a cache incr, and two workers bumping at once must not lose
+one, or payloads from before a write stay current. Backends whose incr
+is a plain get-then-set (the file and database caches) cannot promise
+that, so with them nothing is cached under stamps (see versioned_caching()).
+"""
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_TIMEOUT = None  # version stamps never expire on their own
+
+# Backends with an atomic incr; local memory only within one process
+ATOMIC_INCR_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django_redis.cache.RedisCache',
+}
+
+def versioned_caching():
+    """Whether the default cache can keep stamps (and the membership and
+    unread counters) exact, so payloads may be cached under them"""
+    return settings.CACHES['default']['BACKEND'] in ATOMIC_INCR_BACKENDS
+
+def _version_key(project_id):
+    return f'project-version:{project_id}'
+
+def _fresh_version():
+    # Seeded from the clock so a stamp evicted from the cache never restarts
+    # at a value an older cached payload was stored under.
+    return time.time_ns()
+
+def project_versions(project_ids):
+    """Current version stamp of each project, creating missing stamps"""
+    keys = {_version_key(pid): str(pid) for pid in project_ids}
+    found = cache.get_many(keys.keys())
+    versions = {}
+    for key, pid in keys.items():
+        if key not in found:
+            version = _fresh_version()
+            if not cache.add(key, version, VERSION_TIMEOUT):
+                version = cache.get(key, version)
+            found[key] = version
+        versions[pid] = found[key]
+    return versions
+
+def project_version(project_id):
+    return project_versions([project_id])[str(project_id)]
+
+def bump_project_version(project_id):
+    """Invalidate everything cached under the project's current version"""
+    key = _version_key(project_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _fresh_version()
+        cache.set(key, version, VERSION_TIMEOUT)
+        return version
+
+def versioned_key(prefix, project_ids, *parts):
+    """Cache key that changes whenever any of the projects changes"""
+    versions = project_versions(project_ids)
+    stamp = '.'.join(f'{pid}@{versions[pid]}' for pid in sorted(versions))
+    suffix = ':'.join(str(part) for part in parts)
+    digest = hashlib.md5(f'{stamp}:{suffix}'.encode()).hexdigest()
+    return f'{prefix}:{digest}'
+
+def response_cache_timeout():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+class CachedResponseMixin:
+    """Serve list and retrieve GETs of a viewset from the cache.
+
+    A viewset declares what a response depends on in cache_scope(): the
+    projects whose stamps key it, plus extra key parts for anything
+    that varies per user. Permission checks still run first on every
+    request. The ETag is derived from the key, so a matching
+    If-None-Match gets a 304 before any queryset or serializer runs.
+    """
+
+    def cache_scope(self):
+        """(project ids, extra key parts) for this request, or None to bypass the cache"""
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        scope = self.cache_scope() if versioned_caching() else None
+        if scope is None:
+            return handler(request, *args, **kwargs)
+        project_ids, parts = scope
+        key = versioned_key(
+            f'response:{self.basename}:{self.action}', project_ids,
+            *parts, request.accepted_renderer.format, request.get_host(), request.get_full_path(),
+        )
+        etag = '"%s"' % key.rsplit(':', 1)[1]
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        data = cache.get(key)
+        if data is not None:
+            return Response(data, headers=headers)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, response_cache_timeout())
+            for header, value in headers.items():
+                response[header] = value
+        return response
@@ -0,0 +1,22 @@
+"""
+Per-connection database tuning, connected to connection_created in
+ProjectsConfig.ready(). Settings are read when each connection opens.
+"""
+from django.conf import settings
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Apply the SQLITE_* settings to a new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        journal_mode = getattr(settings, 'SQLITE_JOURNAL_MODE', 'WAL')
+        if journal_mode:
+            # Persistent in the database file; a no-op for in-memory databases
+            cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+        synchronous = getattr(settings, 'SQLITE_SYNCHRONOUS', 'NORMAL')
+        if synchronous:
+            # NORMAL is durable across application crashes in WAL mode and
+            # skips an fsync on every commit
+            cursor.execute(f'PRAGMA synchronous = {synchronous}')
+        timeout = getattr(settings, 'SQLITE_BUSY_TIMEOUT', 20.0)
+        cursor.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
@@ -0,0 +1,153 @@
+"""
+Streaming exports of a project's tasks, comments and activity history.
+
+export_rows() walks one kind of row with .iterator(chunk_size=...) and
+resolves the users each chunk refers to with one query per chunk, so
+memory stays bounded by the chunk size however large the project is.
+export_stream() renders those chunks as CSV or NDJSON bytes, optionally
+gzipped, for a StreamingHttpResponse or the export_project command.
+Under ASGI, Django reads a sync streaming body into a list before it
+sends anything, so views hand ASGI servers the stream through
+async_blocks() instead.
+"""
+import csv
+import io
+import json
+import zlib
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.text import slugify
+from .models import ActivityLog, Comment, Task
+
+User = get_user_model()
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+class ExportKind:
+    """The rows of one model exported for a project. Every `<name>_id`
+    field in `users` gets a `<name>` column holding the user's display name."""
+
+    def __init__(self, model, fields, users, ordering):
+        self.model = model
+        self.fields = fields
+        self.users = users
+        self.ordering = ordering
+
+    @property
+    def columns(self):
+        columns = []
+        for field in self.fields:
+            columns.append(field)
+            if field in self.users:
+                columns.append(field[:-len('_id')])
+        return columns
+
+    def queryset(self, project_id):
+        return self.model.objects.filter(project_id=project_id).order_by(*self.ordering).values(*self.fields)
+
+EXPORTS = {
+    'tasks': ExportKind(
+        Task,
+        ['id', 'title', 'description', 'status', 'priority', 'assignee_id', 'reporter_id',
+         'due_date', 'order', 'created_at', 'updated_at'],
+        users=['assignee_id', 'reporter_id'],
+        # Board order, served by the (project, order, -created_at, id) index
+        ordering=['order', '-created_at', 'id'],
+    ),
+    'comments': ExportKind(
+        Comment,
+        ['id', 'task_id', 'parent_id', 'depth', 'author_id', 'body', 'created_at', 'updated_at'],
+        users=['author_id'],
+        ordering=['created_at', 'id'],
+    ),
+    'activity': ExportKind(
+        ActivityLog,
+        ['id', 'actor_id', 'verb', 'target_type', 'target_id', 'field', 'meta', 'created_at'],
+        users=['actor_id'],
+        ordering=['created_at', 'id'],
+    ),
+}
+
+def export_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+def export_filename(project, kind, format, compress=False):
+    name = f"{slugify(project.name) or project.id}-{kind}.{format}"
+    return f'{name}.gz' if compress else name
+
+def export_rows(project_id, kind, chunk_size=None):
+    """Yield the project's rows of one kind as lists of dicts, chunk_size at a time"""
+    spec = EXPORTS[kind]
+    chunk_size = chunk_size or export_chunk_size()
+    rows = spec.queryset(project_id).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        user_ids = {row[field] for row in chunk for field in spec.users} - {None}
+        names = {
+            pk: full_name or username
+            for pk, username, full_name in User.objects.filter(id__in=user_ids).values_list('id', 'username', 'full_name')
+        } if user_ids else {}
+        for row in chunk:
+            for field in spec.users:
+                row[field[:-len('_id')]] = names.get(row[field])
+        yield chunk
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+def _csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(row[column]) for column in columns] for row in chunk)
+        yield buffer.getvalue().encode()
+
+def _ndjson(chunks, columns):
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps({column: row[column] for column in columns}, cls=DjangoJSONEncoder) + '\n'
+            for row in chunk
+        ).encode()
+
+def _gzip(data):
+    # wbits=31 writes a gzip container rather than a bare zlib stream
+    compressor = zlib.compressobj(wbits=31)
+    for block in data:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_stream(project_id, kind, format='csv', compress=False, chunk_size=None):
+    """The export of one kind of row as an iterator of bytes"""
+    render = _csv if format == 'csv' else _ndjson
+    data = render(export_rows(project_id, kind, chunk_size), EXPORTS[kind].columns)
+    return _gzip(data) if compress else data
+
+async def async_blocks(blocks):
+    """An async iterator over a sync one, advanced a block at a time on the
+    thread sync views run on, which holds the iterator's database cursor"""
+    blocks = iter(blocks)
+    try:
+        while True:
+            block = await sync_to_async(next)(blocks, None)
+            if block is None:
+                return
+            yield block
+    finally:
+        await sync_to_async(blocks.close)()
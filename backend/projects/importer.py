@@ -0,0 +1,527 @@
+"""
+Bulk import of a project's members, tasks and comments.
+
+The input is CSV (with a header row) or NDJSON, one record per row or
+line, each with a `type`:
+
+* project - name, description. Must come first when the import does not
+  target an existing project; the importing user becomes its owner.
+* member  - email, role (admin or member).
+* task    - ref, title, description, status, priority, assignee, reporter
+  (emails), due_date, order, created_at.
+* comment - ref, task (a task ref), parent (a comment ref), author (an
+  email), body, created_at. Replies inherit their parent's task.
+
+Records are parsed incrementally and written chunk by chunk: each chunk
+resolves its users by email and checks its references with a handful of
+queries, then bulk_creates its rows, search documents, stats deltas and
+the job's progress in one transaction. bulk_create sends no signals, so
+the per-row activity log is replaced by one 'imported' entry at the end.
+Users referenced by tasks and comments are added to the project.
+
+Tasks and comments get ids derived from the job and their ref, so
+references resolve across chunks without a map in memory. A failed
+import resumes after the records its committed chunks covered, as does
+one that stalled because its process died (see ImportRunner).
+"""
+import csv
+import io
+import json
+import logging
+import threading
+import uuid
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from . import activity, analytics, membership, search, stats
+from .cache import bump_project_version
+from .models import Comment, ImportJob, Project, ProjectMember, Task
+from .ordering import ORDER_STEP
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+RECORD_TYPES = ('project', 'member', 'task', 'comment')
+STATUSES = {choice[0] for choice in Task.STATUS_CHOICES}
+PRIORITIES = {choice[0] for choice in Task.PRIORITY_CHOICES}
+ROLES = {choice[0] for choice in ProjectMember.ROLE_CHOICES}
+
+class ImportFailed(Exception):
+    """The input cannot be imported at all"""
+
+def import_chunk_size():
+    return getattr(settings, 'IMPORT_CHUNK_SIZE', 500)
+
+def import_max_errors():
+    return getattr(settings, 'IMPORT_MAX_ERRORS', 100)
+
+def import_stale_seconds():
+    return getattr(settings, 'IMPORT_STALE_SECONDS', 600)
+
+def _stale_cutoff():
+    # Running jobs save their progress after every chunk; one that has not
+    # for this long was left behind by a process that died
+    return timezone.now() - timedelta(seconds=import_stale_seconds())
+
+def _stalled():
+    return Q(status__in=('pending', 'running'), updated_at__lt=_stale_cutoff())
+
+def is_resumable(job):
+    """Whether a job failed, or stalled with its process gone"""
+    return job.status == 'failed' or (job.status in ('pending', 'running') and job.updated_at < _stale_cutoff())
+
+def guess_format(filename):
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+def parse_records(stream, format):
+    """(number, record, error) for every row of a binary stream, numbered
+    from 1. Blank lines yield no record and no error."""
+    if format == 'csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        for number, row in enumerate(csv.DictReader(text), 1):
+            yield number, {key: value for key, value in row.items() if key and value not in ('', None)}, None
+        return
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            yield number, None, None
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, 'Not valid JSON'
+            continue
+        if isinstance(record, dict):
+            yield number, {key: value for key, value in record.items() if value not in ('', None)}, None
+        else:
+            yield number, None, 'Expected a JSON object'
+
+def object_id(job, kind, ref):
+    return uuid.uuid5(job.id, f'{kind}:{ref}')
+
+def _email(value):
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+def _timestamp(record, errors):
+    if 'created_at' not in record:
+        return timezone.now()
+    value = parse_datetime(str(record['created_at']))
+    if value is None:
+        errors.append('created_at is not a valid datetime')
+        return None
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+class _Chunk:
+    """The rows built from one chunk of records, before they are written"""
+
+    def __init__(self):
+        self.errors = []
+        self.skipped = 0
+        self.members = {}
+        self.tasks = []
+        self.comments = []
+
+    def error(self, number, message, skipped=True):
+        self.errors.append({'record': number, 'error': message})
+        if skipped:
+            self.skipped += 1
+
+class Importer:
+    """Runs one job over a stream of its input"""
+
+    def __init__(self, job, chunk_size=None, progress=None):
+        self.job = job
+        self.chunk_size = chunk_size or import_chunk_size()
+        self.progress = progress
+
+    def run(self, stream):
+        records = islice(parse_records(stream, self.job.format), self.job.rows_processed, None)
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                break
+            self.import_chunk(chunk)
+            if self.progress:
+                self.progress(self.job)
+        if self.job.project_id is None:
+            raise ImportFailed('The input has no project record')
+
+    def import_chunk(self, records):
+        job = self.job
+        chunk = _Chunk()
+        emails = set()
+        for _, record, _ in records:
+            if record:
+                emails.update(filter(None, (_email(record.get(field))
+                                            for field in ('email', 'assignee', 'reporter', 'author'))))
+        users = dict(User.objects.filter(email__in=emails).values_list('email', 'id')) if emails else {}
+
+        with transaction.atomic():
+            for number, record, error in records:
+                if error:
+                    chunk.error(number, error)
+                elif record:
+                    self._build(chunk, number, record, users)
+            self._check_references(chunk)
+            self._write(chunk)
+            job.rows_processed += len(records)
+            job.rows_skipped += chunk.skipped
+            errors = sorted(chunk.errors, key=lambda error: error['record'])
+            job.errors = (job.errors + errors)[:import_max_errors()]
+            job.save(update_fields=['project', 'rows_processed', 'rows_skipped', 'members_created',
+                                    'tasks_created', 'comments_created', 'errors', 'updated_at'])
+
+    def _build(self, chunk, number, record, users):
+        kind = record.get('type')
+        if kind not in RECORD_TYPES:
+            chunk.error(number, f"type must be one of: {', '.join(RECORD_TYPES)}")
+        elif kind == 'project':
+            self._build_project(chunk, number, record)
+        elif self.job.project_id is None:
+            raise ImportFailed(f'Record {number}: the first record must describe the project')
+        elif kind == 'member':
+            self._build_member(chunk, number, record, users)
+        elif kind == 'task':
+            self._build_task(chunk, number, record, users)
+        else:
+            self._build_comment(chunk, number, record, users)
+
+    def _user(self, chunk, number, record, field, users, fallback=None):
+        email = _email(record.get(field))
+        if email is None:
+            return fallback
+        user_id = users.get(email)
+        if user_id is None:
+            fallen_back = 'the importing user' if fallback else 'nobody'
+            chunk.error(number, f'Unknown {field} {email}; set to {fallen_back}', skipped=False)
+            return fallback
+        chunk.members.setdefault(user_id, 'member')
+        return user_id
+
+    def _build_project(self, chunk, number, record):
+        job = self.job
+        if job.project_id is not None:
+            chunk.error(number, 'Only the first record may describe the project')
+            return
+        name = str(record.get('name', '')).strip()
+        if not name:
+            raise ImportFailed(f'Record {number}: the project needs a name')
+        # Written at once (with its signals) so the records after it can
+        # refer to it; it commits with the rest of the chunk.
+        project = Project.objects.create(
+            owner_id=job.created_by_id, name=name[:255], description=str(record.get('description', '')),
+        )
+        ProjectMember.objects.create(project=project, user_id=job.created_by_id, role='admin')
+        job.project = project
+
+    def _build_member(self, chunk, number, record, users):
+        email = _email(record.get('email'))
+        role = record.get('role', 'member')
+        if email is None or email not in users:
+            chunk.error(number, f'Unknown user {email}' if email else 'email is required')
+        elif role not in ROLES:
+            chunk.error(number, f"role must be one of: {', '.join(sorted(ROLES))}")
+        else:
+            # An explicit role wins over the default given to referenced users
+            chunk.members[users[email]] = role
+
+    def _build_task(self, chunk, number, record, users):
+        errors = []
+        title = str(record.get('title', '')).strip()
+        if not title:
+            errors.append('title is required')
+        status = record.get('status', 'todo')
+        if status not in STATUSES:
+            errors.append(f"status must be one of: {', '.join(sorted(STATUSES))}")
+        priority = record.get('priority', 'medium')
+        if priority not in PRIORITIES:
+            errors.append(f"priority must be one of: {', '.join(sorted(PRIORITIES))}")
+        due_date = None
+        if 'due_date' in record:
+            due_date = parse_date(str(record['due_date']))
+            if due_date is None:
+                errors.append('due_date is not a valid date')
+        try:
+            order = float(record.get('order', ORDER_STEP * number))
+        except (TypeError, ValueError):
+            errors.append('order must be a number')
+        created_at = _timestamp(record, errors)
+        if errors:
+            chunk.error(number, '; '.join(errors))
+            return
+        chunk.tasks.append((number, Task(
+            id=object_id(self.job, 'task', record.get('ref', f'#{number}')),
+            project_id=self.job.project_id,
+            title=title[:255],
+            description=str(record.get('description', '')),
+            status=status,
+            priority=priority,
+            assignee_id=self._user(chunk, number, record, 'assignee', users),
+            reporter_id=self._user(chunk, number, record, 'reporter', users, self.job.created_by_id),
+            due_date=due_date,
+            order=order,
+            created_at=created_at,
+        )))
+
+    def _build_comment(self, chunk, number, record, users):
+        errors = []
+        body = str(record.get('body', ''))
+        if not body.strip():
+            errors.append('body is required')
+        created_at = _timestamp(record, errors)
+        if errors:
+            chunk.error(number, '; '.join(errors))
+            return
+        comment = Comment(
+            id=object_id(self.job, 'comment', record.get('ref', f'#{number}')),
+            project_id=self.job.project_id,
+            task_id=object_id(self.job, 'task', record['task']) if 'task' in record else None,
+            parent_id=object_id(self.job, 'comment', record['parent']) if 'parent' in record else None,
+            author_id=self._user(chunk, number, record, 'author', users, self.job.created_by_id),
+            body=body,
+            created_at=created_at,
+        )
+        chunk.comments.append((number, comment))
+
+    def _check_references(self, chunk):
+        """Drop rows whose ids already exist or whose task or parent is
+        neither in this chunk nor imported earlier"""
+        task_ids = {task.id for _, task in chunk.tasks}
+        referenced_tasks = {comment.task_id for _, comment in chunk.comments if comment.task_id}
+        existing_tasks = set(Task.objects.filter(
+            id__in=task_ids | referenced_tasks
+        ).values_list('id', flat=True)) if task_ids or referenced_tasks else set()
+
+        tasks, seen = [], set()
+        for number, task in chunk.tasks:
+            if task.id in existing_tasks or task.id in seen:
+                chunk.error(number, 'Duplicate task ref')
+                continue
+            seen.add(task.id)
+            tasks.append((number, task))
+        chunk.tasks = tasks
+        known_tasks = seen | (existing_tasks & referenced_tasks)
+
+        comment_ids = {comment.id for _, comment in chunk.comments}
+        parent_ids = {comment.parent_id for _, comment in chunk.comments if comment.parent_id}
+        existing = {
+            pk: (root_id or pk, depth, task_id)
+            for pk, root_id, depth, task_id in Comment.objects.filter(
+                id__in=comment_ids | parent_ids, project_id=self.job.project_id
+            ).values_list('id', 'root_id', 'depth', 'task_id')
+        } if comment_ids else {}
+
+        comments = []
+        threads = {}
+        for number, comment in chunk.comments:
+            if comment.id in existing or comment.id in threads:
+                chunk.error(number, 'Duplicate comment ref')
+                continue
+            if comment.task_id and comment.task_id not in known_tasks:
+                chunk.error(number, 'Unknown task ref')
+                continue
+            if comment.parent_id:
+                # Parents come before their replies in the input
+                parent = threads.get(comment.parent_id) or (
+                    existing.get(comment.parent_id) if comment.parent_id not in comment_ids else None
+                )
+                if parent is None:
+                    chunk.error(number, 'Unknown parent comment ref')
+                    continue
+                root_id, depth, task_id = parent
+                comment.root_id, comment.depth = root_id, depth + 1
+                comment.task_id = comment.task_id or task_id
+            threads[comment.id] = (comment.root_id or comment.id, comment.depth, comment.task_id)
+            comments.append((number, comment))
+        chunk.comments = comments
+
+    def _write(self, chunk):
+        job = self.job
+        if job.project_id is None:
+            return
+        members = chunk.members
+        if members:
+            existing = set(ProjectMember.objects.filter(
+                project_id=job.project_id, user_id__in=members
+            ).values_list('user_id', flat=True))
+            new = [ProjectMember(project_id=job.project_id, user_id=user_id, role=role)
+                   for user_id, role in members.items() if user_id not in existing]
+            if new:
+                ProjectMember.objects.bulk_create(new)
+                stats.adjust_member_count(job.project_id, len(new))
+                job.members_created += len(new)
+                user_ids = [member.user_id for member in new]
+                transaction.on_commit(lambda: [membership.invalidate(user_id) for user_id in user_ids])
+
+        tasks = [task for _, task in chunk.tasks]
+        comments = [comment for _, comment in chunk.comments]
+        if tasks:
+            Task.objects.bulk_create(tasks)
+            stats.apply_task_deltas(job.project_id, Counter(task.status for task in tasks))
+            # Imported tasks count as created on their own dates; when done ones
+            # were finished is unknown, so they stay out of throughput
+            rollup = analytics.Rollup()
+            for task in tasks:
+                rollup.created(job.project_id, task.status, task.created_at, count_completion=False)
+            rollup.save()
+        if comments:
+            Comment.objects.bulk_create(comments)
+        if tasks or comments:
+            search.index_documents([search.task_document(task) for task in tasks]
+                                   + [search.comment_document(comment) for comment in comments])
+        if tasks or comments or chunk.members:
+            # Only once committed, or a read in between caches the old rows under the new stamp
+            project_id = job.project_id
+            transaction.on_commit(lambda: bump_project_version(project_id))
+        job.tasks_created += len(tasks)
+        job.comments_created += len(comments)
+
+def _claim(job, statuses):
+    """Move the job to running if it is in one of statuses or has stalled;
+    False if another run got there first"""
+    # A stalled job is matched on its old updated_at, which the claim moves
+    # on, so only one of the runs picking it up gets it
+    claimed = ImportJob.objects.filter(Q(status__in=statuses) | _stalled(), id=job.id).update(
+        status='running', failure='', updated_at=timezone.now(),
+    )
+    if claimed:
+        job.status, job.failure = 'running', ''
+    return bool(claimed)
+
+def run_import(job, stream, chunk_size=None, statuses=('pending', 'failed'), progress=None):
+    """Import (or resume importing) a job's input from a binary stream.
+
+    progress, if given, is called with the job after every chunk. Returns
+    False if the job was not in one of `statuses`. Failures are recorded
+    on the job, which can then be resumed.
+    """
+    if not _claim(job, statuses):
+        return False
+    try:
+        if job.rows_processed and job.project_id is None:
+            raise ImportFailed('The imported project no longer exists')
+        Importer(job, chunk_size, progress).run(stream)
+    except Exception as exc:
+        if not isinstance(exc, ImportFailed):
+            logger.exception('Import %s failed', job.id)
+        # Drop what the rolled back chunk left on the instance
+        job.refresh_from_db()
+        job.status = 'failed'
+        job.failure = str(exc) or exc.__class__.__name__
+        job.save(update_fields=['status', 'failure', 'updated_at'])
+        return True
+
+    job.status = 'completed'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at', 'updated_at'])
+    activity.record(activity.build_event(
+        project_id=job.project_id,
+        actor_id=job.created_by_id,
+        verb='imported',
+        target_type='project',
+        target_id=job.project_id,
+        meta={
+            'import_id': str(job.id),
+            'source': job.source_name,
+            'members': job.members_created,
+            'tasks': job.tasks_created,
+            'comments': job.comments_created,
+            'skipped': job.rows_skipped,
+        }
+    ))
+    if job.source:
+        # The upload is only kept for resuming
+        job.source.delete(save=False)
+        job.save(update_fields=['source'])
+    return True
+
+def run_stored_import(job_id):
+    """Run a job from its uploaded source file"""
+    job = ImportJob.objects.filter(id=job_id).first()
+    if job is None or not job.source:
+        return False
+    with job.source.open('rb') as stream:
+        return run_import(job, stream)
+
+class ImportRunner:
+    """Runs uploaded imports on a daemon thread, one at a time.
+
+    Every IMPORT_STALE_SECONDS, and when first started, the thread also
+    queues the uploaded jobs that have stalled, so imports cut short by a
+    crash or restart pick up where they stopped.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='project-importer', daemon=True)
+                self._thread.start()
+
+    def request(self, job_id):
+        with self._lock:
+            self._pending.append(job_id)
+        self.start()
+        self._wakeup.set()
+
+    def queue_stalled(self):
+        stalled = ImportJob.objects.filter(_stalled()).exclude(source='').order_by('updated_at')
+        job_ids = list(stalled.values_list('id', flat=True))
+        with self._lock:
+            self._pending.extend(job_id for job_id in job_ids if job_id not in self._pending)
+        return len(job_ids)
+
+    def run_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    return
+                job_id = self._pending.pop(0)
+            try:
+                run_stored_import(job_id)
+            except Exception:
+                logger.exception('Import %s could not be run', job_id)
+
+    def _run(self):
+        while True:
+            close_old_connections()
+            try:
+                self.queue_stalled()
+            except Exception:
+                logger.exception('Stalled imports could not be looked up')
+            self.run_pending()
+            self._wakeup.wait(import_stale_seconds())
+            self._wakeup.clear()
+
+import_runner = ImportRunner()
+
+def start_import_runner():
+    """Start the background runner with the server, to pick up stalled imports"""
+    if getattr(settings, 'IMPORT_BACKGROUND', True):
+        import_runner.start()
+
+def schedule_import(job):
+    """Run an uploaded job after the current transaction commits"""
+    if getattr(settings, 'IMPORT_BACKGROUND', True):
+        transaction.on_commit(lambda: import_runner.request(job.id))
+    else:
+        run_stored_import(job.id)
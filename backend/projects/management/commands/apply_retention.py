@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from projects.retention import apply_retention
+
+class Command(BaseCommand):
+    help = 'Delete old read notifications and move old activity into daily summaries and archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--activity-days', type=int, default=None,
+                            help='Keep this many days of activity (default: ACTIVITY_RETENTION_DAYS)')
+        parser.add_argument('--notification-days', type=int, default=None,
+                            help='Keep read notifications this many days (default: NOTIFICATION_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per transaction (default: RETENTION_BATCH_SIZE)')
+        parser.add_argument('--no-archive', action='store_true',
+                            help='Only summarize old activity, without writing archive files')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        result = apply_retention(
+            activity_days=options['activity_days'],
+            notification_days=options['notification_days'],
+            batch_size=options['batch_size'],
+            archive=False if options['no_archive'] else None,
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {result['notifications']} notification(s), retired {result['activity']} activity event(s)"
+        ))
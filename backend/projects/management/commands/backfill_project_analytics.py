@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from projects.analytics import backfill
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily analytics rollups by replaying the activity history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', help='Only rebuild these projects')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Activity events read per query')
+
+    def handle(self, *args, **options):
+        rows = backfill(options['project_ids'] or None, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} daily rollup row(s)'))
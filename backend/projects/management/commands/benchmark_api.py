@@ -0,0 +1,63 @@
+import json
+import shutil
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from projects import benchmark
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database, exercise every API route and enforce per-endpoint query budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(benchmark.SCALES), default='small')
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument('--only', action='append', default=[], help='Only run scenarios for this route name')
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file as JSON')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the benchmark database between runs')
+
+    def handle(self, *args, **options):
+        missing = benchmark.uncovered_routes()
+        if missing:
+            raise CommandError(f"Routes without a benchmark scenario: {', '.join(missing)}")
+
+        scenarios = [s for s in benchmark.SCENARIOS if not options['only'] or s.route in options['only']]
+
+        setup_test_environment()
+        # Write activity and run imports inline so they are counted against
+        # the request that caused them; archive files go to a scratch directory
+        archive_dir = tempfile.mkdtemp(prefix='benchmark-archive-')
+        activity_override = override_settings(ACTIVITY_LOG_MODE='sync', IMPORT_BACKGROUND=False,
+                                              ACTIVITY_ARCHIVE_DIR=archive_dir)
+        activity_override.enable()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            self.stdout.write(f"Seeding '{options['scale']}' data set...")
+            ctx = benchmark.seed(options['scale'])
+            results = [benchmark.run_scenario(s, ctx, options['iterations']) for s in scenarios]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            activity_override.disable()
+            teardown_test_environment()
+            shutil.rmtree(archive_dir, ignore_errors=True)
+
+        self.stdout.write(f"{'scenario':<34} {'queries':>8} {'budget':>7} {'p50 ms':>9} {'p99 ms':>9} {'bytes':>10}")
+        for result in results:
+            line = (f"{result.scenario.name:<34} {result.queries:>8} {result.scenario.budget:>7} "
+                    f"{result.p50_ms:>9.1f} {result.p99_ms:>9.1f} {result.payload_bytes:>10}")
+            if result.errored:
+                line += f"  HTTP {sorted(result.status_codes)}"
+            self.stdout.write(self.style.ERROR(line) if result.over_budget or result.errored else line)
+            if result.over_budget:
+                for count, sql in result.repeated_sql:
+                    self.stdout.write(f"    {count}x {sql[:150]}")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump([r.as_dict() for r in results], fh, indent=2)
+
+        failed = [r.scenario.name for r in results if r.over_budget or r.errored]
+        if failed:
+            raise CommandError(f"Query budget exceeded or request failed: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} scenario(s) within budget'))
@@ -0,0 +1,37 @@
+import sys
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from projects.export import EXPORTS, FORMATS, export_stream
+from projects.models import Project
+
+class Command(BaseCommand):
+    help = "Stream a project's tasks, comments or activity history as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id')
+        parser.add_argument('--kind', choices=list(EXPORTS), default='tasks')
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--chunk-size', type=int, help='Rows per chunk (default: EXPORT_CHUNK_SIZE)')
+        parser.add_argument('--output', '-o', default='-', help='File to write; - for stdout')
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.filter(id=options['project_id']).first()
+        except ValidationError:
+            project = None
+        if project is None:
+            raise CommandError(f"Project {options['project_id']} does not exist")
+
+        stream = export_stream(project.id, options['kind'], options['format'], options['gzip'], options['chunk_size'])
+        if options['output'] == '-':
+            for block in stream:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
+            return
+        written = 0
+        with open(options['output'], 'wb') as out:
+            for block in stream:
+                out.write(block)
+                written += len(block)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
@@ -0,0 +1,72 @@
+import os
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from projects.importer import guess_format, run_import
+from projects.models import ImportJob, Project
+
+class Command(BaseCommand):
+    help = 'Import members, tasks and comments from a CSV or NDJSON file (format in projects.importer)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', help='Email of the importing user (required unless resuming)')
+        parser.add_argument('--project', help='Import into this existing project instead of creating one')
+        parser.add_argument('--format', choices=[choice[0] for choice in ImportJob.FORMAT_CHOICES])
+        parser.add_argument('--chunk-size', type=int, help='Records per transaction (default: IMPORT_CHUNK_SIZE)')
+        parser.add_argument('--resume', metavar='JOB_ID',
+                            help='Continue a failed import of the same file, or one left running by a crashed process')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'{path} is not a file')
+
+        if options['resume']:
+            try:
+                job = ImportJob.objects.filter(id=options['resume']).first()
+            except ValidationError:
+                job = None
+            if job is None:
+                raise CommandError(f"Import {options['resume']} does not exist")
+            statuses = ('pending', 'failed', 'running')
+        else:
+            job = self._create_job(path, options)
+            statuses = ('pending',)
+
+        self.stdout.write(f'Import {job.id}: {job.source_name}')
+        with open(path, 'rb') as stream:
+            run_import(job, stream, chunk_size=options['chunk_size'], statuses=statuses,
+                       progress=lambda job: self.stdout.write(f'  {job.rows_processed} record(s) processed'))
+        job.refresh_from_db()
+        if job.status != 'completed':
+            raise CommandError(
+                f'Import {job.id} {job.status} after {job.rows_processed} record(s): {job.failure}. '
+                f'Fix the cause and rerun with --resume {job.id}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {job.members_created} member(s), {job.tasks_created} task(s) and '
+            f'{job.comments_created} comment(s) into project {job.project_id}; {job.rows_skipped} record(s) skipped'
+        ))
+        for error in job.errors:
+            self.stdout.write(f"  record {error['record']}: {error['error']}")
+
+    def _create_job(self, path, options):
+        User = get_user_model()
+        user = User.objects.filter(email=options['user']).first() if options['user'] else None
+        if user is None:
+            raise CommandError('--user must be the email of an existing user')
+        project = None
+        if options['project']:
+            try:
+                project = Project.objects.filter(id=options['project']).first()
+            except ValidationError:
+                project = None
+            if project is None:
+                raise CommandError(f"Project {options['project']} does not exist")
+        format = options['format'] or guess_format(path)
+        if format is None:
+            raise CommandError('--format is required for files not named .csv or .ndjson')
+        return ImportJob.objects.create(
+            created_by=user, project=project, format=format, source_name=os.path.basename(path)[:255],
+        )
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from projects.activity import drain_queue
+
+class Command(BaseCommand):
+    help = 'Move queued activity events from the ActivityQueue outbox into ActivityLog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling')
+
+    def handle(self, *args, **options):
+        moved = 0
+        while True:
+            count = drain_queue(options['batch_size'])
+            moved += count
+            if count:
+                continue
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} activity event(s)'))
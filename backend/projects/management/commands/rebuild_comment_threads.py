@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from projects.models import Comment
+
+class Command(BaseCommand):
+    help = 'Backfill Comment.root and Comment.depth for existing threads, one nesting level at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        Comment.objects.filter(parent__isnull=True).exclude(root=None, depth=0).update(root=None, depth=0)
+
+        depth = 0
+        level = Comment.objects.filter(parent__isnull=True)
+        updated = 0
+        while True:
+            replies = Comment.objects.filter(parent__in=level.values('id')).values_list('id', 'parent_id', 'parent__root_id')
+            batch = []
+            for reply_id, parent_id, parent_root_id in replies.iterator(chunk_size=batch_size):
+                batch.append(Comment(id=reply_id, root_id=parent_root_id or parent_id, depth=depth + 1))
+            if not batch:
+                break
+            with transaction.atomic():
+                Comment.objects.bulk_update(batch, ['root', 'depth'], batch_size=batch_size)
+            updated += len(batch)
+            depth += 1
+            level = Comment.objects.filter(depth=depth, root__isnull=False)
+
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} repl(ies) across {depth} level(s)'))
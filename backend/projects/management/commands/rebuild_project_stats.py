@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from projects.models import Project
+from projects.stats import rebuild_project_stats
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized per-project task and member counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', help='Only rebuild these projects')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        project_ids = options['project_ids']
+        if not project_ids:
+            project_ids = Project.objects.values_list('id', flat=True).iterator(chunk_size=options['chunk_size'])
+
+        total = 0
+        chunk = []
+        for project_id in project_ids:
+            chunk.append(project_id)
+            if len(chunk) >= options['chunk_size']:
+                total += rebuild_project_stats(chunk)
+                chunk = []
+        if chunk:
+            total += rebuild_project_stats(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {total} project(s)'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from projects.search import get_backend, rebuild_documents
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search documents and index from projects, tasks and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_documents(batch_size=options['batch_size'])
+        backend = type(get_backend()).__name__
+        self.stdout.write(self.style.SUCCESS(f'Indexed {written} document(s) with {backend}'))
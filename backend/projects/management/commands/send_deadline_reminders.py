@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from projects.reminders import reminder_windows, send_deadline_reminders
+
+class Command(BaseCommand):
+    help = 'Send deadline_soon notifications for open tasks due within the reminder windows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--windows', help='Comma-separated days before the due date (default: DEADLINE_REMINDER_WINDOWS)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=0, help='Seconds between scans; 0 scans once and exits')
+
+    def handle(self, *args, **options):
+        windows = reminder_windows()
+        if options['windows']:
+            try:
+                windows = [int(days) for days in options['windows'].split(',')]
+            except ValueError:
+                raise CommandError('--windows must be a comma-separated list of days')
+        if not windows or min(windows) < 0:
+            raise CommandError('Reminder windows must be zero or more days')
+
+        while True:
+            sent = send_deadline_reminders(windows=windows, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Sent {sent} deadline reminder(s)'))
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,85 @@
+"""
+Cached project membership lookups.
+
+Each user's memberships are loaded once as a {project_id: role} map,
+memoized on the request and cached across requests under a per-user
+version stamp. Saving or deleting a ProjectMember bumps the version
+(see projects.signals), so a changed role is never served stale. Without
+an atomic cache incr (see projects.cache) the map is only memoized.
+"""
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from .cache import versioned_caching
+from .models import ProjectMember
+
+def membership_cache_timeout():
+    return getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', 600)
+
+def _version_key(user_id):
+    return f'membership-version:{user_id}'
+
+def _roles_key(user_id, version):
+    return f'membership-roles:{user_id}:{version}'
+
+def normalize_project_id(project_id):
+    """Canonical string form of a project id, or None if it is not a UUID"""
+    try:
+        return str(project_id if isinstance(project_id, uuid.UUID) else uuid.UUID(str(project_id)))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def invalidate(user_id):
+    """Drop every cached membership map of a user"""
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+def _load_roles(user_id):
+    if not versioned_caching():
+        return {
+            str(project_id): role for project_id, role in
+            ProjectMember.objects.filter(user_id=user_id).values_list('project_id', 'role')
+        }
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_version_key(user_id), version, None):
+            version = cache.get(_version_key(user_id), version)
+    key = _roles_key(user_id, version)
+    roles = cache.get(key)
+    if roles is None:
+        roles = {
+            str(project_id): role for project_id, role in
+            ProjectMember.objects.filter(user_id=user_id).values_list('project_id', 'role')
+        }
+        cache.set(key, roles, membership_cache_timeout())
+    return roles
+
+def project_roles(user_id, request=None):
+    """Map of project id (as a string) to the user's role in that project"""
+    memo = getattr(request, '_project_roles', None) if request is not None else None
+    if memo is None:
+        memo = {}
+        if request is not None:
+            request._project_roles = memo
+    if user_id not in memo:
+        memo[user_id] = _load_roles(user_id)
+    return memo[user_id]
+
+def role_in(user_id, project_id, request=None):
+    if not user_id:
+        return None
+    project_id = normalize_project_id(project_id)
+    if project_id is None:
+        return None
+    return project_roles(user_id, request).get(project_id)
+
+def is_member(user_id, project_id, request=None):
+    return role_in(user_id, project_id, request) is not None
+
+def is_admin(user_id, project_id, request=None):
+    return role_in(user_id, project_id, request) == 'admin'
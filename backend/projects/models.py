@@ -25,19 +25,116 @@ class Project(models.Model):
     def __str__(self):
         return self.name
         
+    def get_stats(self):
+        """Return the denormalized counters row, or None if it was never built"""
+        try:
+            return self.stats
+        except ProjectStats.DoesNotExist:
+            return None
+        
     @property 
     def members_count(self):
+        stats = self.get_stats()
+        if stats is not None:
+            return stats.members_count
         return self.members.count()
         
     @property
     def progress(self):
         """Calculate project progress based on task completion"""
+        stats = self.get_stats()
+        if stats is not None:
+            return stats.progress
         total_tasks = self.tasks.count()
         if total_tasks == 0:
             return 0
         completed_tasks = self.tasks.filter(status='done').count()
         return int((completed_tasks / total_tasks) * 100)
 
+class ProjectStats(models.Model):
+    """Denormalized task and member counters, maintained by projects.signals"""
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_tasks = models.IntegerField(default=0)
+    todo_tasks = models.IntegerField(default=0)
+    in_progress_tasks = models.IntegerField(default=0)
+    done_tasks = models.IntegerField(default=0)
+    blocked_tasks = models.IntegerField(default=0)
+    members_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'projects_projectstats'
+        
+    def __str__(self):
+        return f"Stats for {self.project_id}"
+        
+    @staticmethod
+    def status_field(status):
+        """Name of the counter column holding tasks in the given status"""
+        return f'{status}_tasks'
+        
+    @property
+    def progress(self):
+        if self.total_tasks <= 0:
+            return 0
+        return int((self.done_tasks / self.total_tasks) * 100)
+
+class ProjectDailyStats(models.Model):
+    """A project's task activity on one day, folded in as it happens (see
+    projects.analytics).
+
+    The *_delta columns are net changes in the number of tasks per status,
+    so the counts at the end of any day follow from ProjectStats and the
+    deltas of the days after it. Cycle time runs from a task's creation to
+    its completion; each completion lands in one cycle_* bucket.
+    """
+    # Upper bounds, in days, of the cycle time buckets; cycle_over holds the rest
+    CYCLE_TIME_BUCKETS = [1, 2, 4, 7, 14, 30]
+    
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    created = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    reopened = models.IntegerField(default=0)
+    todo_delta = models.IntegerField(default=0)
+    in_progress_delta = models.IntegerField(default=0)
+    done_delta = models.IntegerField(default=0)
+    blocked_delta = models.IntegerField(default=0)
+    # Seconds, summed over the day's completions
+    cycle_time_total = models.FloatField(default=0)
+    cycle_1d = models.IntegerField(default=0)
+    cycle_2d = models.IntegerField(default=0)
+    cycle_4d = models.IntegerField(default=0)
+    cycle_7d = models.IntegerField(default=0)
+    cycle_14d = models.IntegerField(default=0)
+    cycle_30d = models.IntegerField(default=0)
+    cycle_over = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'projects_projectdailystats'
+        unique_together = ['project', 'date']
+    
+    def __str__(self):
+        return f"Stats for {self.project_id} on {self.date}"
+    
+    @staticmethod
+    def delta_field(status):
+        """Name of the column holding the day's net change in tasks of a status"""
+        return f'{status}_delta'
+    
+    @classmethod
+    def cycle_field(cls, seconds):
+        """Name of the bucket column counting a completion with this cycle time"""
+        days = seconds / 86400
+        for bound in cls.CYCLE_TIME_BUCKETS:
+            if days <= bound:
+                return f'cycle_{bound}d'
+        return 'cycle_over'
+    
+    @classmethod
+    def cycle_fields(cls):
+        return [f'cycle_{bound}d' for bound in cls.CYCLE_TIME_BUCKETS] + ['cycle_over']
+
 class ProjectMember(models.Model):
     """Project membership with roles"""
     ROLE_CHOICES = [
@@ -84,6 +181,7 @@ class Task(models.Model):
     reporter = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reported_tasks')
     due_date = models.DateField(null=True, blank=True)
     order = models.FloatField(default=0)
+    watchers = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='watched_tasks')
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -95,10 +193,19 @@ class Task(models.Model):
             models.Index(fields=['assignee', 'status']),
             models.Index(fields=['project', 'due_date']),
             models.Index(fields=['order']),
+            models.Index(fields=['project', 'order', '-created_at', 'id']),
         ]
         
     def __str__(self):
         return f"{self.project.name} - {self.title}"
+        
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Keep the loaded values so signal handlers can diff against them
+        # without re-reading the row.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
 class Comment(models.Model):
     """Comments for tasks and projects"""
@@ -107,6 +214,10 @@ class Comment(models.Model):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, null=True, blank=True, related_name='comments')
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Top-level comment of the thread (null for top-level comments) and the
+    # nesting depth, so a whole thread can be loaded with a single query.
+    root = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='thread_comments')
+    depth = models.PositiveIntegerField(default=0)
     body = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
@@ -114,9 +225,19 @@ class Comment(models.Model):
     class Meta:
         db_table = 'projects_comment'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['root', 'created_at']),
+        ]
         
     def __str__(self):
         return f"Comment by {self.author.email} on {self.project.name}"
+        
+    def save(self, *args, **kwargs):
+        if self.parent_id and self.root_id is None:
+            parent = self.parent
+            self.root_id = parent.root_id or parent.id
+            self.depth = parent.depth + 1
+        super().save(*args, **kwargs)
 
 class Notification(models.Model):
     """Notifications for users"""
@@ -135,6 +256,8 @@ class Notification(models.Model):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, null=True, blank=True)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
     message = models.CharField(max_length=255)
+    # Number of events coalesced into this row by projects.notifications
+    count = models.PositiveIntegerField(default=1)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
     
@@ -144,6 +267,8 @@ class Notification(models.Model):
         indexes = [
             models.Index(fields=['user', 'is_read']),
             models.Index(fields=['-created_at']),
+            models.Index(fields=['user', '-created_at', '-id']),
+            models.Index(fields=['task', 'type', 'is_read']),
         ]
         
     def __str__(self):
@@ -157,12 +282,158 @@ class ActivityLog(models.Model):
     verb = models.CharField(max_length=50)  # created, updated, deleted, etc.
     target_type = models.CharField(max_length=50)  # task, comment, project
     target_id = models.CharField(max_length=100)
+    # The field an 'updated' event changed, with its old and new values in
+    # meta; a write changing several fields logs one event per field
+    field = models.CharField(max_length=50, blank=True, default='')
     meta = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         db_table = 'projects_activitylog'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['project', '-created_at', '-id']),
+            # The feed filtered by target (and field), or by verb (and field)
+            models.Index(fields=['project', 'target_type', 'target_id', 'field', '-created_at', '-id']),
+            models.Index(fields=['project', 'verb', 'field', '-created_at', '-id']),
+        ]
+        
+    def __str__(self):
+        return f"{self.actor.email} {self.verb} {self.target_type}"
+
+class ActivityQueue(models.Model):
+    """Outbox of activity events waiting for the process_activity_queue worker"""
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'projects_activityqueue'
+        ordering = ['id']
+        
+    def __str__(self):
+        return f"Queued {self.payload.get('verb')} {self.payload.get('target_type')}"
+
+class ActivitySummary(models.Model):
+    """Daily counts of activity that retention has removed from ActivityLog
+    (see projects.retention)"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='activity_summaries')
+    date = models.DateField()
+    verb = models.CharField(max_length=50)
+    target_type = models.CharField(max_length=50)
+    field = models.CharField(max_length=50, blank=True, default='')
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'projects_activitysummary'
+        unique_together = ['project', 'date', 'verb', 'target_type', 'field']
+        
+    def __str__(self):
+        return f"{self.count} {self.verb} {self.target_type} on {self.date}"
+
+class ActivityArchive(models.Model):
+    """One day of a project's activity moved out of ActivityLog into a
+    gzipped NDJSON file (see projects.retention)"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='activity_archives')
+    date = models.DateField()
+    events = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'projects_activityarchive'
+        unique_together = ['project', 'date']
+        
+    def __str__(self):
+        return f"Archived activity of {self.project_id} on {self.date}"
+
+class ImportJob(models.Model):
+    """A project import (see projects.importer) and how far it has got.
+
+    rows_processed counts the input records already committed, so a
+    failed import resumes from the first record after them.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+        ('completed', 'Completed'),
+    ]
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('ndjson', 'NDJSON'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='import_jobs')
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True, related_name='import_jobs')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    source = models.FileField(upload_to='imports/', blank=True)
+    source_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    rows_processed = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    members_created = models.PositiveIntegerField(default=0)
+    tasks_created = models.PositiveIntegerField(default=0)
+    comments_created = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    failure = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'projects_importjob'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', '-created_at', '-id']),
+        ]
+        
+    def __str__(self):
+        return f"Import {self.source_name or self.id} ({self.status})"
+
+class DeadlineReminder(models.Model):
+    """A deadline_soon reminder that has been sent (see projects.reminders).
+
+    Rows only matter until the due date passes, when the scheduler prunes
+    them, so task_id is a plain column rather than a foreign key that
+    every task delete would have to cascade through.
+    """
+    task_id = models.UUIDField()
+    due_date = models.DateField()
+    window_days = models.PositiveIntegerField()
+    sent_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'projects_deadlinereminder'
+        unique_together = ['task_id', 'due_date', 'window_days']
+        indexes = [
+            models.Index(fields=['due_date']),
+        ]
+        
+    def __str__(self):
+        return f"Reminder for {self.task_id} ({self.window_days}d before {self.due_date})"
+
+class SearchDocument(models.Model):
+    """Searchable text of a project, task or comment (see projects.search)"""
+    KIND_CHOICES = [
+        ('project', 'Project'),
+        ('task', 'Task'),
+        ('comment', 'Comment'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.UUIDField(unique=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='+')
+    # Set for task and comment documents, so deleting a task drops them all
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    
+    class Meta:
+        db_table = 'projects_searchdocument'
+        indexes = [
+            models.Index(fields=['project', 'kind']),
+        ]
         
     def __str__(self):
-        return f"{self.actor.email} {self.verb} {self.target_type}"
\ No newline at end of file
+        return f"{self.kind} {self.object_id}"
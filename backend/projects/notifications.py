@@ -0,0 +1,177 @@
+"""
+Notification fan-out.
+
+Views describe what happened with notify(); this module works out who
+should hear about it, folds repeats into existing unread rows and writes
+the rest with a single bulk_create. notify_many() does the same for a
+batch of events, e.g. from the bulk task endpoints.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F
+from django.utils import timezone
+from .cache import versioned_caching
+from .models import Comment, Notification, ProjectMember, Task
+from .realtime import publish, user_channel
+
+# Types where a burst of events about the same task collapses into one row
+COALESCED_TYPES = {'task_updated', 'comment_added'}
+
+def coalesce_window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 600))
+
+def unread_cache_timeout():
+    return getattr(settings, 'NOTIFICATION_UNREAD_CACHE_TIMEOUT', 3600)
+
+def _unread_key(user_id):
+    return f'notifications-unread:{user_id}'
+
+def unread_count(user_id):
+    """Unread notifications for a user, served from cache after the first call"""
+    if not versioned_caching():
+        return Notification.objects.filter(user_id=user_id, is_read=False).count()
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        cache.set(key, count, unread_cache_timeout())
+    return max(count, 0)
+
+def adjust_unread(user_ids, delta):
+    """Shift cached unread counters; users without a cached value are left
+    to be recounted on their next read"""
+    for user_id in user_ids:
+        try:
+            cache.incr(_unread_key(user_id), delta)
+        except ValueError:
+            pass
+
+def reset_unread(user_id, count=0):
+    cache.set(_unread_key(user_id), count, unread_cache_timeout())
+
+def unread_by_user(notifications):
+    """(user id, count) of the unread rows among notifications; taken
+    before a delete that cascades to them, for discount_unread() after it"""
+    return list(notifications.filter(is_read=False).order_by().values('user_id')
+                .annotate(n=Count('id')).values_list('user_id', 'n'))
+
+def discount_unread(unread):
+    for user_id, count in unread:
+        adjust_unread([user_id], -count)
+
+def interested_users(task):
+    """Ids of the project members following a task: assignee, reporter,
+    commenters and watchers"""
+    return interested_users_many([task])[task.id]
+
+def interested_users_many(tasks):
+    """interested_users() for a batch of tasks, with two queries for all of them"""
+    users = {}
+    projects = {}
+    for task in tasks:
+        users[task.id] = {task.reporter_id}
+        projects[task.id] = task.project_id
+        if task.assignee_id:
+            users[task.id].add(task.assignee_id)
+    if not users:
+        return users
+    commenters = Comment.objects.filter(task_id__in=users).order_by().values_list('task_id', 'author_id')
+    watchers = Task.watchers.through.objects.filter(task_id__in=users).order_by().values_list('task_id', 'user_id')
+    for task_id, user_id in commenters.union(watchers):
+        users[task_id].add(user_id)
+
+    # Followers removed from a project stop hearing about its tasks
+    members = set(ProjectMember.objects.filter(
+        project_id__in=set(projects.values()), user_id__in=set().union(*users.values())
+    ).values_list('project_id', 'user_id'))
+    return {task_id: {user_id for user_id in followers if (projects[task_id], user_id) in members}
+            for task_id, followers in users.items()}
+
+def notify(type, message, project=None, task=None, comment=None, recipients=None, actor=None):
+    """Notify recipients (user ids) of an event.
+
+    When recipients is None everyone interested in the task is notified.
+    The acting user is never notified of their own change. Returns the
+    number of users notified.
+    """
+    if recipients is None:
+        recipients = interested_users(task) if task is not None else set()
+    return notify_many([(type, message, project, task, comment, recipients)], actor=actor)
+
+def notify_many(events, actor=None):
+    """Deliver a batch of (type, message, project, task, comment, recipients)
+    events with one coalescing lookup and one bulk_create. Events of a
+    coalesced type about the same task reach each recipient as one row,
+    whose count says how many it stands for.
+
+    Returns the number of notifications delivered.
+    """
+    now = timezone.now()
+    pending = []
+    for type, message, project, task, comment, recipients in events:
+        recipients = {user_id for user_id in recipients if user_id}
+        if actor is not None:
+            recipients.discard(actor.id)
+        if recipients:
+            pending.append(({
+                'type': type,
+                'message': message[:255],
+                'project_id': project.id if project else (task.project_id if task else None),
+                'task_id': task.id if task else None,
+                'comment_id': comment.id if comment else None,
+            }, recipients))
+    if not pending:
+        return 0
+
+    # Repeats within the batch are merged first: one entry per (recipient,
+    # task, type) of a coalesced type, keeping the latest event's fields
+    # and how many events it stands for
+    merged = {}
+    rows = []
+    for fields, recipients in pending:
+        for user_id in recipients:
+            if fields['task_id'] and fields['type'] in COALESCED_TYPES:
+                key = (user_id, fields['task_id'], fields['type'])
+                merged[key] = (fields, merged[key][1] + 1 if key in merged else 1)
+            else:
+                rows.append(Notification(user_id=user_id, created_at=now, **fields))
+
+    existing = {}
+    if merged:
+        found = Notification.objects.filter(
+            user_id__in={user_id for user_id, _, _ in merged},
+            task_id__in={task_id for _, task_id, _ in merged},
+            type__in={type for _, _, type in merged},
+            is_read=False, created_at__gte=now - coalesce_window(),
+        ).values_list('user_id', 'task_id', 'type', 'id')
+        existing = {(user_id, task_id, type): pk for user_id, task_id, type, pk in found}
+
+    updates = defaultdict(list)
+    for key, (fields, count) in merged.items():
+        pk = existing.get(key)
+        if pk is not None:
+            updates[(count, fields['message'], fields['comment_id'])].append(pk)
+        else:
+            rows.append(Notification(user_id=key[0], created_at=now, count=count, **fields))
+    for (count, message, comment_id), pks in updates.items():
+        Notification.objects.filter(id__in=pks).update(
+            count=F('count') + count, message=message, comment_id=comment_id, created_at=now,
+        )
+
+    if len(rows) == 1:
+        rows[0].save(force_insert=True)
+    elif rows:
+        Notification.objects.bulk_create(rows)
+    for user_id, count in Counter(row.user_id for row in rows).items():
+        adjust_unread([user_id], count)
+    
+    notified = 0
+    for fields, recipients in pending:
+        event = {key: str(value) if value else None for key, value in fields.items() if key.endswith('_id')}
+        event.update(type=fields['type'], message=fields['message'])
+        for user_id in recipients:
+            publish(user_channel(user_id), 'notification', event)
+        notified += len(recipients)
+    return notified
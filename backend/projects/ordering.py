@@ -0,0 +1,214 @@
+"""
+Server-side ordering of tasks within a board column.
+
+A move places a task between two neighbours by giving it the midpoint of
+their `order` values, so it writes only the moved row. Repeated moves
+into the same gap halve it each time. Once a gap is within ~20 halvings
+of running out of float precision, only the few tasks around it are
+respaced ("rebalanced"); by default that runs on a background thread
+after the move commits. If a gap has already run out by the time a move
+needs it, or the neighbours share a key, the window is rebalanced inline
+first.
+
+Positions follow the board's ordering (order, -created_at, id), so tasks
+that share a key (e.g. the default 0) still have well-defined neighbours.
+"""
+import logging
+import threading
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers
+from . import realtime
+from .cache import bump_project_version
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+BOARD_ORDERING = ('order', '-created_at', 'id')
+REVERSE_BOARD_ORDERING = ('-order', 'created_at', '-id')
+# Spacing between tasks placed at either end of a column or respaced
+ORDER_STEP = 1024.0
+# Gaps narrower than this fraction of the keys they separate get respaced
+MIN_GAP_RATIO = 2 ** -30
+
+def rebalance_window():
+    return getattr(settings, 'TASK_REORDER_WINDOW', 20)
+
+def _column(project_id, status, exclude_id=None):
+    scope = Task.objects.filter(project_id=project_id, status=status)
+    scope = scope.only('id', 'project_id', 'status', 'order', 'created_at')
+    if exclude_id is not None:
+        scope = scope.exclude(id=exclude_id)
+    return scope
+
+def _past(task, forward=True):
+    """Tasks strictly after (forward) or before task in board order"""
+    order, created, pk = ('gt', 'lt', 'gt') if forward else ('lt', 'gt', 'lt')
+    return (Q(**{f'order__{order}': task.order})
+            | Q(order=task.order, **{f'created_at__{created}': task.created_at})
+            | Q(order=task.order, created_at=task.created_at, **{f'id__{pk}': task.id}))
+
+def _precedes(a, b):
+    """True if task a comes before task b in board order"""
+    if a.order != b.order:
+        return a.order < b.order
+    if a.created_at != b.created_at:
+        return a.created_at > b.created_at
+    return a.id < b.id
+
+def _between(lower, upper):
+    """An order key strictly between two neighbours, or None if there is no room"""
+    if lower is None and upper is None:
+        return 0.0
+    if lower is None:
+        return upper.order - ORDER_STEP
+    if upper is None:
+        return lower.order + ORDER_STEP
+    middle = (lower.order + upper.order) / 2
+    return middle if lower.order < middle < upper.order else None
+
+def _is_tight(lower, upper):
+    if lower is None or upper is None:
+        return False
+    return upper - lower < max(abs(lower), abs(upper), 1.0) * MIN_GAP_RATIO
+
+def _neighbours(scope, after, before):
+    """The tasks the moved task will sit between (either may be None)"""
+    if after is not None and before is not None:
+        return after, before
+    if after is not None:
+        return after, scope.filter(_past(after)).order_by(*BOARD_ORDERING).first()
+    if before is not None:
+        return scope.filter(_past(before, forward=False)).order_by(*REVERSE_BOARD_ORDERING).first(), before
+    # No neighbour given: the end of the column
+    return scope.order_by(*REVERSE_BOARD_ORDERING).first(), None
+
+def rebalance(pivot, exclude_id=None, window=None):
+    """Respace the tasks of pivot's column around the pivot task.
+
+    The pivot and up to `window` tasks on either side of it are spread
+    evenly between the keys of the first tasks outside that range. The
+    window doubles while those keys leave no room, which only reaches
+    the whole column when it is uniformly packed (e.g. every task still
+    at order 0). Returns the number of tasks rewritten.
+    """
+    window = window or rebalance_window()
+    scope = _column(pivot.project_id, pivot.status, exclude_id)
+    while True:
+        below = list(scope.filter(Q(id=pivot.id) | _past(pivot, forward=False))
+                     .order_by(*REVERSE_BOARD_ORDERING).values_list('id', 'order')[:window + 1])
+        above = list(scope.filter(_past(pivot)).order_by(*BOARD_ORDERING).values_list('id', 'order')[:window + 1])
+        lower = below[window][1] if len(below) > window else None
+        upper = above[window][1] if len(above) > window else None
+        ids = [pk for pk, _ in reversed(below[:window])] + [pk for pk, _ in above[:window]]
+        count = len(ids)
+        if lower is not None and upper is not None:
+            spacing = (upper - lower) / (count + 1)
+            if spacing > 0 and not _is_tight(lower, lower + spacing):
+                keys = [lower + spacing * (i + 1) for i in range(count)]
+                break
+            window *= 2
+            continue
+        if lower is not None:
+            keys = [lower + ORDER_STEP * (i + 1) for i in range(count)]
+        elif upper is not None:
+            keys = [upper - ORDER_STEP * (count - i) for i in range(count)]
+        else:
+            keys = [ORDER_STEP * i for i in range(count)]
+        break
+
+    now = timezone.now()
+    tasks = [Task(id=pk, order=key, updated_at=now) for pk, key in zip(ids, keys)]
+    with transaction.atomic():
+        Task.objects.bulk_update(tasks, ['order', 'updated_at'])
+        # Only once committed, or a read in between caches the old order under the new stamp
+        transaction.on_commit(lambda: bump_project_version(pivot.project_id))
+        realtime.publish(realtime.project_channel(pivot.project_id), 'tasks.reordered', {
+            'status': pivot.status,
+            'orders': {str(task.id): task.order for task in tasks},
+        })
+    return len(tasks)
+
+class Rebalancer:
+    """Runs requested rebalances on a daemon thread, the latest one per column"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def request(self, task):
+        with self._lock:
+            self._pending[(task.project_id, task.status)] = task.id
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='task-rebalancer', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def run_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for (project_id, status), task_id in pending.items():
+            # The pivot may have moved or gone since the request
+            pivot = Task.objects.filter(id=task_id, project_id=project_id, status=status).first()
+            if pivot is None:
+                continue
+            try:
+                rebalance(pivot)
+            except Exception:
+                logger.exception('Rebalancing around task %s failed', task_id)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            close_old_connections()
+            self.run_pending()
+
+rebalancer = Rebalancer()
+
+def _schedule_rebalance(task):
+    if getattr(settings, 'TASK_REORDER_BACKGROUND', True):
+        transaction.on_commit(lambda: rebalancer.request(task))
+    else:
+        rebalance(task)
+
+def move_task(task, after=None, before=None, status=None):
+    """Place task between `after` and `before` (tasks of the same project).
+
+    Either neighbour may be omitted to mean "right after" or "right before"
+    the other; with neither the task goes to the end of the column. The
+    column is `status`, else the neighbours' status, else the task's own.
+    """
+    given = [t for t in (after, before) if t is not None]
+    if any(t.id == task.id for t in given):
+        raise serializers.ValidationError("A task cannot be placed next to itself")
+    if any(t.project_id != task.project_id for t in given):
+        raise serializers.ValidationError("Neighbouring tasks must belong to the same project")
+    status = status or (given[0].status if given else task.status)
+    if any(t.status != status for t in given):
+        raise serializers.ValidationError("Neighbouring tasks must be in the target column")
+    if after is not None and before is not None and not _precedes(after, before):
+        raise serializers.ValidationError("'after' must come before 'before'")
+
+    scope = _column(task.project_id, status, exclude_id=task.id)
+    lower, upper = _neighbours(scope, after, before)
+    key = _between(lower, upper)
+    if key is None:
+        # Out of precision, or the neighbours share a key: make room first
+        rebalance(lower, exclude_id=task.id)
+        for neighbour in (lower, upper):
+            neighbour.refresh_from_db(fields=['order'])
+        key = _between(lower, upper)
+
+    task.order = key
+    task.status = status
+    task.save(update_fields=['order', 'status', 'updated_at'])
+    lower_key = lower.order if lower is not None else None
+    upper_key = upper.order if upper is not None else None
+    if _is_tight(lower_key, key) or _is_tight(key, upper_key):
+        _schedule_rebalance(task)
+    return task
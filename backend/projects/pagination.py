@@ -0,0 +1,172 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+class KeysetPagination(BasePagination):
+    """Keyset (seek) pagination over a composite ordering.
+
+    Unlike PageNumberPagination this never runs COUNT(*) or OFFSET: each
+    page is a range scan starting right after the last row of the previous
+    one. The cursor is an opaque url-safe base64 token carrying the ordering
+    values of the boundary row and the direction, and stays valid while rows
+    are inserted in front of it. The last field of `ordering` must be unique.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset)
+        self.has_next = self.has_previous = False
+
+        if cursor is None:
+            reverse, values = False, None
+        else:
+            reverse, values = cursor
+            queryset = queryset.filter(self._seek(values, reverse))
+
+        ordering = [self._flip(field) for field in self.ordering] if reverse else list(self.ordering)
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = values is not None, has_more
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self._link(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        values = [self._plain(self._value(row, field)) for field in self.ordering]
+        payload = json.dumps({'r': int(reverse), 'v': values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            values = payload['v']
+            reverse = bool(payload['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            # Tokens are client input: check each value against its column
+            values = [self._to_python(queryset, field, value) for field, value in zip(self.ordering, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, values
+
+    def _link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def _seek(self, values, reverse):
+        """Rows strictly after (or before, when reverse) the cursor position"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'gt' if descending == reverse else 'lt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    @staticmethod
+    def _to_python(queryset, field, value):
+        name = field.lstrip('-')
+        annotation = queryset.query.annotations.get(name)
+        model_field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+        if value is None or isinstance(value, (dict, list, bool)):
+            raise TypeError(f'{name} cannot be {value!r}')
+        return model_field.to_python(value)
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _value(row, field):
+        name = field.lstrip('-')
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, name)
+
+    @staticmethod
+    def _plain(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        if isinstance(value, (int, float, str)) or value is None:
+            return value
+        return str(value)
+
+class NotificationPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+class ActivityLogPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+class TaskPagination(KeysetPagination):
+    ordering = ('order', '-created_at', 'id')
+
+class ImportJobPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+class MyTaskPagination(KeysetPagination):
+    # due_sort is the due date with undated tasks sorted last (see TaskViewSet.mine)
+    ordering = ('due_sort', 'id')
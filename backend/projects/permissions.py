@@ -1,52 +1,39 @@
-from rest_framework import permissions
-from .models import ProjectMember
+from rest_framework import permissions, serializers
+from .membership import is_admin, is_member, normalize_project_id
 
 class IsProjectMember(permissions.BasePermission):
     """
     Custom permission to only allow members of a project to access it.
     """
-    
+
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-            
-        project_id = None
-        
-        # Try to get project_id from different sources
-        if hasattr(view, 'get_object'):
-            try:
-                obj = view.get_object()
-                if hasattr(obj, 'project'):
-                    project_id = obj.project.id
-                elif hasattr(obj, 'id'):
-                    project_id = obj.id
-            except:
-                pass
-        
-        if not project_id:
-            project_id = request.query_params.get('project') or request.data.get('project_id')
-        
+
+        # Detail routes are checked against the object's project in
+        # has_object_permission, once the view has loaded it.
+        project_id = request.query_params.get('project') or request.data.get('project_id')
+
         if not project_id:
             return True  # Let the view handle this
-            
-        return ProjectMember.objects.filter(
-            project_id=project_id,
-            user=request.user
-        ).exists()
+        if normalize_project_id(project_id) is None:
+            raise serializers.ValidationError("project must be a project id (UUID)")
+
+        return is_member(request.user.id, project_id, request)
+
+    def has_object_permission(self, request, view, obj):
+        project_id = obj.project_id if hasattr(obj, 'project_id') else obj.id
+        return is_member(request.user.id, project_id, request)
 
 class IsProjectAdmin(permissions.BasePermission):
     """
     Custom permission to only allow project admins.
     """
-    
+
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
-            
-        project = obj if hasattr(obj, 'members') else obj.project
-        
-        return ProjectMember.objects.filter(
-            project=project,
-            user=request.user,
-            role='admin'
-        ).exists()
\ No newline at end of file
+
+        project_id = obj.project_id if hasattr(obj, 'project_id') else obj.id
+
+        return is_admin(request.user.id, project_id, request)
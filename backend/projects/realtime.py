@@ -0,0 +1,180 @@
+"""
+Server-Sent Events push channel for notifications and board changes.
+
+Events are published on named channels: ``user:<id>`` for a user's
+notifications and ``project:<id>`` for task and comment changes. The
+broker is loaded from settings.REALTIME_BROKER. The default
+InProcessBroker only reaches clients connected to the same process, so
+a deployment with several workers should plug in a shared broker that
+implements subscribe/unsubscribe/publish the same way.
+
+The stream view is async and needs ASGI (synergy.asgi), where an open
+stream does not pin a worker thread. Under WSGI (runserver, or `serve
+--interface wsgi`) Django would drain the stream into a list before
+sending anything, so it answers 501 there instead.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from .membership import normalize_project_id, project_roles
+
+class Subscription:
+    """A client's queue of pending events, fed from any thread"""
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The client's event loop is gone
+            self.close()
+
+    def _put(self, message):
+        if self.queue.full():
+            # Slow consumer: drop the oldest event rather than block publishers
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class InProcessBroker:
+    """Fan-out of published events to subscriptions in this process"""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channels, maxsize=100):
+        subscription = Subscription(self, channels, maxsize)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        if not subscribers:
+            return
+        message = {'id': next(self._ids), 'channel': channel, **message}
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'REALTIME_BROKER', 'projects.realtime.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+def project_channel(project_id):
+    return f'project:{project_id}'
+
+def publish(channel, event_type, data):
+    """Publish an event once the current transaction commits"""
+    message = {'type': event_type, 'data': data}
+    transaction.on_commit(lambda: get_broker().publish(channel, message))
+
+def _authenticate(request):
+    """Resolve the user from a SimpleJWT access token.
+
+    EventSource cannot set headers, so the token may also be passed as
+    ?token=. Returns None if the token is missing or invalid.
+    """
+    authentication = JWTAuthentication()
+    raw_token = request.GET.get('token')
+    if not raw_token:
+        header = authentication.get_header(request)
+        raw_token = authentication.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+def _member_projects(user, project_ids):
+    """Channels' project ids, or None unless the user belongs to all of them"""
+    roles = project_roles(user.id)
+    normalized = {normalize_project_id(pid) for pid in project_ids}
+    if not normalized <= roles.keys():
+        return None
+    return sorted(normalized)
+
+def _format(message):
+    payload = json.dumps(message, cls=DjangoJSONEncoder)
+    return f"id: {message['id']}\nevent: {message['type']}\ndata: {payload}\n\n"
+
+async def event_stream(request):
+    """SSE endpoint: /api/stream/?projects=<id>,<id>&token=<access token>"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'The event stream needs a server running synergy.asgi.'}, status=501)
+
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    requested = [pid for pid in request.GET.get('projects', '').split(',') if pid]
+    projects = await sync_to_async(_member_projects)(user, requested)
+    if projects is None:
+        return JsonResponse({'detail': 'You must be a member of every requested project.'}, status=403)
+
+    channels = [user_channel(user.id)] + [project_channel(pid) for pid in projects]
+    heartbeat = getattr(settings, 'REALTIME_HEARTBEAT_SECONDS', 15)
+    subscription = get_broker().subscribe(channels, getattr(settings, 'REALTIME_QUEUE_SIZE', 100))
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    message = await subscription.get(heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _format(message)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
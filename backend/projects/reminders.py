@@ -0,0 +1,111 @@
+"""
+Deadline reminders.
+
+send_deadline_reminders() notifies the assignee (or, for unassigned
+tasks, the reporter) of every open task due within one of the windows in
+settings.DEADLINE_REMINDER_WINDOWS (days before the due date). A task gets
+one reminder per window, e.g. three days out and again the day before.
+
+Projects are visited in keyset chunks. Within a chunk the Task(project,
+due_date) index is walked in keyset batches, so memory stays bounded by
+the batch size however many tasks there are. Sent reminders are recorded
+in DeadlineReminder in the same transaction as their notifications, so a
+rerun never repeats one. Run a single scheduler at a time.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import DeadlineReminder, Project, Task
+from .notifications import notify_many
+
+def reminder_windows():
+    return sorted(set(getattr(settings, 'DEADLINE_REMINDER_WINDOWS', [1, 3])))
+
+def _due_message(title, days):
+    if days == 0:
+        when = 'today'
+    elif days == 1:
+        when = 'tomorrow'
+    else:
+        when = f'in {days} days'
+    return f'Task "{title}" is due {when}'
+
+def _project_chunks(batch_size):
+    last_id = None
+    while True:
+        projects = Project.objects.order_by('id')
+        if last_id is not None:
+            projects = projects.filter(id__gt=last_id)
+        ids = list(projects.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+def _due_tasks(project_ids, start, end, batch_size):
+    """Open tasks of the projects due from start to end, in keyset batches
+    over (project, due_date, id)"""
+    tasks = Task.objects.filter(
+        project_id__in=project_ids, due_date__gte=start, due_date__lte=end,
+    ).exclude(status='done').order_by('project_id', 'due_date', 'id').values(
+        'id', 'project_id', 'title', 'due_date', 'assignee_id', 'reporter_id',
+    )
+    position = None
+    while True:
+        batch = tasks
+        if position is not None:
+            project_id, due_date, task_id = position
+            batch = batch.filter(
+                Q(project_id__gt=project_id)
+                | Q(project_id=project_id, due_date__gt=due_date)
+                | Q(project_id=project_id, due_date=due_date, id__gt=task_id)
+            )
+        rows = list(batch[:batch_size])
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1]
+        position = (last['project_id'], last['due_date'], last['id'])
+
+def _send(rows, today, windows):
+    due = []
+    for row in rows:
+        days = (row['due_date'] - today).days
+        due.append((row, days, next(window for window in windows if days <= window)))
+    sent = set(DeadlineReminder.objects.filter(
+        task_id__in=[row['id'] for row in rows]
+    ).values_list('task_id', 'due_date', 'window_days'))
+    pending = [(row, days, window) for row, days, window in due
+               if (row['id'], row['due_date'], window) not in sent]
+    if not pending:
+        return 0
+
+    with transaction.atomic():
+        DeadlineReminder.objects.bulk_create([
+            DeadlineReminder(task_id=row['id'], due_date=row['due_date'], window_days=window)
+            for row, _, window in pending
+        ], ignore_conflicts=True)
+        notify_many([
+            ('deadline_soon', _due_message(row['title'], days), None,
+             Task(id=row['id'], project_id=row['project_id'], title=row['title']), None,
+             {row['assignee_id'] or row['reporter_id']})
+            for row, days, _ in pending
+        ])
+    return len(pending)
+
+def send_deadline_reminders(today=None, windows=None, batch_size=500):
+    """Send the reminders that are due today; returns how many were sent"""
+    today = today or timezone.localdate()
+    windows = sorted(set(windows or reminder_windows()))
+    # Reminders for dates that have passed can never be sent again
+    DeadlineReminder.objects.filter(due_date__lt=today).delete()
+
+    end = today + timedelta(days=windows[-1])
+    sent = 0
+    for project_ids in _project_chunks(batch_size):
+        for rows in _due_tasks(project_ids, today, end, batch_size):
+            sent += _send(rows, today, windows)
+    return sent
@@ -0,0 +1,210 @@
+"""
+Retention for the activity log and notifications.
+
+apply_retention() keeps the hot tables small:
+
+* read notifications older than settings.NOTIFICATION_RETENTION_DAYS are
+  deleted
+* activity older than settings.ACTIVITY_RETENTION_DAYS is counted into
+  daily ActivitySummary rows and deleted, after being appended to gzipped
+  NDJSON files under settings.ACTIVITY_ARCHIVE_DIR when that is set
+
+Rows go in batches of settings.RETENTION_BATCH_SIZE, each batch in its own
+transaction, so no statement holds locks for long. Activity is walked per
+project over the (project, -created_at, -id) index.
+
+An archive file holds one day of one project and grows by a gzip member
+per batch; ActivityArchive lists the days a project has on file, which
+the API reads back with read_archive(). Each append writes a new copy of
+the file and renames it over the old one, so a crash mid-write leaves the
+previous file; a file torn anyway is read up to its last complete member.
+A batch whose delete fails after its file was written is archived again
+by the next run, and readers drop the duplicate ids. Run one retention
+job at a time.
+"""
+import gzip
+import json
+import logging
+import os
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from . import activity
+from .cache import bump_project_version
+from .models import ActivityArchive, ActivityLog, ActivitySummary, Notification, Project
+
+logger = logging.getLogger(__name__)
+
+def retention_batch_size():
+    return getattr(settings, 'RETENTION_BATCH_SIZE', 1000)
+
+def archive_dir():
+    return getattr(settings, 'ACTIVITY_ARCHIVE_DIR', None)
+
+def archive_path(project_id, day):
+    return os.path.join(archive_dir(), str(project_id), f'{day.isoformat()}.ndjson.gz')
+
+def _complete_members(data):
+    """(contents, length) of the complete gzip members data starts with"""
+    view = memoryview(data)
+    contents, end = [], 0
+    while end < len(data):
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            content = decompressor.decompress(view[end:])
+        except zlib.error:
+            break
+        if not decompressor.eof:
+            break
+        contents.append(content)
+        end = len(data) - len(decompressor.unused_data)
+    return b''.join(contents), end
+
+def _read_file(path):
+    try:
+        with open(path, 'rb') as archive:
+            return archive.read()
+    except FileNotFoundError:
+        return b''
+
+def read_archive(project_id, day):
+    """The archived events of one day of a project, newest first"""
+    if archive_dir() is None:
+        return []
+    path = archive_path(project_id, day)
+    data = _read_file(path)
+    content, end = _complete_members(data)
+    if end < len(data):
+        logger.warning('Ignoring %d byte(s) after the last complete gzip member of %s', len(data) - end, path)
+    payloads = {}
+    for line in content.decode('utf-8').splitlines():
+        payload = json.loads(line)
+        payloads[payload['id']] = payload
+    events = [activity.from_payload(payload) for payload in payloads.values()]
+    events.sort(key=lambda event: (event.created_at, str(event.id)), reverse=True)
+    return events
+
+def archived_events(project_id):
+    """All archived events of a project, oldest first"""
+    days = ActivityArchive.objects.filter(project_id=project_id).order_by('date').values_list('date', flat=True)
+    for day in list(days):
+        yield from reversed(read_archive(project_id, day))
+
+def remove_archive(project_id, day):
+    if archive_dir() is None:
+        return
+    path = archive_path(project_id, day)
+    try:
+        os.remove(path)
+        # Drops the project's directory with its last day
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+def _append_archive(project_id, day, events):
+    path = archive_path(project_id, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    existing = _read_file(path)
+    # A torn tail would hide every member appended after it
+    _, end = _complete_members(existing)
+    data = ''.join(json.dumps(activity.to_payload(event)) + '\n' for event in events)
+    partial = f'{path}.tmp'
+    with open(partial, 'wb') as archive:
+        archive.write(existing[:end])
+        archive.write(gzip.compress(data.encode()))
+        archive.flush()
+        os.fsync(archive.fileno())
+    os.replace(partial, path)
+
+def _add(model, counter, key, n):
+    if not model.objects.filter(**key).update(**{counter: F(counter) + n}):
+        model.objects.create(**key, **{counter: n})
+
+def _retire_batch(project_id, events, archive):
+    """Summarize, optionally archive, and delete one batch of a project's events"""
+    days = defaultdict(list)
+    for event in events:
+        days[timezone.localdate(event.created_at)].append(event)
+    if archive:
+        for day, day_events in days.items():
+            _append_archive(project_id, day, day_events)
+
+    kinds = Counter((timezone.localdate(event.created_at), event.verb, event.target_type, event.field)
+                    for event in events)
+    with transaction.atomic():
+        for (day, verb, target_type, field), n in kinds.items():
+            _add(ActivitySummary, 'count', {'project_id': project_id, 'date': day, 'verb': verb,
+                                            'target_type': target_type, 'field': field}, n)
+        if archive:
+            for day, day_events in days.items():
+                _add(ActivityArchive, 'events', {'project_id': project_id, 'date': day}, len(day_events))
+        ActivityLog.objects.filter(id__in=[event.id for event in events]).delete()
+
+def retire_activity(cutoff, batch_size=None, archive=None, pause=0):
+    """Move activity older than cutoff out of ActivityLog; returns how many
+    events were moved"""
+    batch_size = batch_size or retention_batch_size()
+    if archive is None:
+        archive = archive_dir() is not None
+    moved = 0
+    for project_id in list(Project.objects.order_by('id').values_list('id', flat=True)):
+        retired = 0
+        while True:
+            events = list(ActivityLog.objects.filter(
+                project_id=project_id, created_at__lt=cutoff
+            ).order_by('created_at', 'id')[:batch_size])
+            if not events:
+                break
+            _retire_batch(project_id, events, archive)
+            retired += len(events)
+            if len(events) < batch_size:
+                break
+            time.sleep(pause)
+        if retired:
+            bump_project_version(project_id)
+            moved += retired
+    return moved
+
+def prune_notifications(cutoff, batch_size=None, pause=0):
+    """Delete read notifications older than cutoff; returns how many"""
+    batch_size = batch_size or retention_batch_size()
+    deleted = 0
+    position = None
+    while True:
+        rows = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+        if position is not None:
+            # Skip past the unread rows earlier batches walked over
+            rows = rows.filter(created_at__gte=position)
+        batch = list(rows.order_by('created_at').values_list('id', 'created_at')[:batch_size])
+        if not batch:
+            break
+        Notification.objects.filter(id__in=[pk for pk, _ in batch]).delete()
+        deleted += len(batch)
+        if len(batch) < batch_size:
+            break
+        position = batch[-1][1]
+        time.sleep(pause)
+    return deleted
+
+def apply_retention(now=None, activity_days=None, notification_days=None, batch_size=None,
+                    archive=None, pause=0):
+    """Apply both retention policies; a policy whose days are None is skipped.
+
+    Days default to the settings. Returns {'notifications': n, 'activity': n}.
+    """
+    now = now or timezone.now()
+    if activity_days is None:
+        activity_days = getattr(settings, 'ACTIVITY_RETENTION_DAYS', None)
+    if notification_days is None:
+        notification_days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', None)
+    result = {'notifications': 0, 'activity': 0}
+    if notification_days is not None:
+        result['notifications'] = prune_notifications(now - timedelta(days=notification_days), batch_size, pause)
+    if activity_days is not None:
+        result['activity'] = retire_activity(now - timedelta(days=activity_days), batch_size, archive, pause)
+    return result
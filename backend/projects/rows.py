@@ -0,0 +1,194 @@
+"""
+Fast, field-selectable rendering of read-only task and project lists.
+
+A RowMapper renders .values() rows into the JSON the list serializer
+would produce, from a table of output fields declared once: each field
+names the columns it reads and a plain function building its value, so no
+serializer or field objects are created per row. The plan for a field
+selection is compiled on first use and reused.
+
+RowListMixin serves a viewset's list through its row_mapper, with:
+
+* ?fields=id,title,status - only these fields (sparse fieldset)
+* ?users=map              - embedded users replaced by their ids, each
+                            user sent once in a side-loaded "users" map
+
+SparseFieldsMixin gives the other serializers of those viewsets ?fields=.
+"""
+from django.contrib.auth import get_user_model
+from rest_framework import serializers
+from rest_framework.response import Response
+from synergy.metrics import timed_serialization
+from .models import ProjectMember, Task
+
+User = get_user_model()
+
+USER_COLUMNS = ['username', 'email', 'full_name', 'avatar']
+
+_datetime = serializers.DateTimeField().to_representation
+
+def requested_fields(request, available):
+    """The names in ?fields= in the order of available, or None without it"""
+    value = request.query_params.get('fields') if request is not None else None
+    if not value:
+        return None
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    if not names or names - set(available):
+        raise serializers.ValidationError(f"fields must be a comma-separated list of: {', '.join(available)}")
+    return [name for name in available if name in names]
+
+def _file_url(name, context):
+    # Same output as DRF's FileField for a stored file
+    if not name:
+        return None
+    url = User._meta.get_field('avatar').storage.url(name)
+    request = context.get('request')
+    return request.build_absolute_uri(url) if request is not None else url
+
+class Value:
+    """An output field built from the columns of a row"""
+
+    def __init__(self, columns, render):
+        self.columns = columns
+        self.render = render
+
+def column(name, convert=None):
+    if convert is None:
+        return Value([name], lambda row, context: row[name])
+    return Value([name], lambda row, context: None if row[name] is None else convert(row[name]))
+
+class UserValue(Value):
+    """A related user, rendered like UserBasicSerializer"""
+
+    def __init__(self, prefix):
+        self.id_column = f'{prefix}_id'
+        self.prefix = prefix
+        super().__init__([self.id_column] + [f'{prefix}__{name}' for name in USER_COLUMNS], self.render_user)
+
+    def render_user(self, row, context):
+        user_id = row[self.id_column]
+        if user_id is None:
+            return None
+        prefix = self.prefix
+        username = row[f'{prefix}__username']
+        full_name = row[f'{prefix}__full_name']
+        return {
+            'id': user_id,
+            'username': username,
+            'email': row[f'{prefix}__email'],
+            'full_name': full_name,
+            'display_name': full_name or username,
+            'avatar': _file_url(row[f'{prefix}__avatar'], context),
+        }
+
+class RowMapper:
+    def __init__(self, fields):
+        self.fields = fields
+        self._plans = {}
+
+    def plan(self, names, user_map):
+        """(columns, [(name, render)], [user values]) for a field selection"""
+        key = (tuple(names), user_map)
+        plan = self._plans.get(key)
+        if plan is None:
+            columns, renders, users = [], [], []
+            for name in names:
+                value = self.fields[name]
+                columns.extend(column for column in value.columns if column not in columns)
+                if user_map and isinstance(value, UserValue):
+                    users.append(value)
+                    renders.append((name, lambda row, context, id_column=value.id_column: row[id_column]))
+                else:
+                    renders.append((name, value.render))
+            plan = self._plans[key] = (columns, renders, users)
+        return plan
+
+    def render(self, rows, names, context, user_map=False):
+        """The rendered rows and, with user_map, the {id: user} map they refer to"""
+        return timed_serialization(self._render, rows, names, context, user_map)
+
+    def _render(self, rows, names, context, user_map):
+        _, renders, user_values = self.plan(names, user_map)
+        data = [{name: render(row, context) for name, render in renders} for row in rows]
+        users = {}
+        for row in rows:
+            for value in user_values:
+                user_id = row[value.id_column]
+                if user_id is not None and str(user_id) not in users:
+                    users[str(user_id)] = value.render_user(row, context)
+        return data, users
+
+class RowListMixin:
+    """Serve list GETs of a viewset through its row_mapper"""
+    row_mapper = None
+
+    def list(self, request, *args, **kwargs):
+        mapper = self.row_mapper
+        names = requested_fields(request, list(mapper.fields)) or list(mapper.fields)
+        user_map = request.query_params.get('users') == 'map'
+        columns, _, _ = mapper.plan(names, user_map)
+        # Keyset pagination reads its ordering columns from the rows
+        ordering = [field.lstrip('-') for field in getattr(self.paginator, 'ordering', ())]
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values(*columns, *(field for field in ordering if field not in columns))
+
+        page = self.paginate_queryset(rows)
+        data, users = mapper.render(rows if page is None else page, names, self.get_serializer_context(), user_map)
+        response = Response(data) if page is None else self.get_paginated_response(data)
+        if user_map:
+            if page is None:
+                response.data = {'results': data}
+            response.data['users'] = users
+        return response
+
+class SparseFieldsMixin:
+    """Drop the fields a request's ?fields= leaves out"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        names = requested_fields(self.context.get('request'), list(self.fields))
+        if names is not None:
+            for name in list(self.fields):
+                if name not in names:
+                    self.fields.pop(name)
+
+def _progress(row, context):
+    if row['stats__total_tasks'] is None:
+        # No counters row yet: count like Project.progress does
+        tasks = Task.objects.filter(project_id=row['id'])
+        total, done = tasks.count(), tasks.filter(status='done').count()
+    else:
+        total, done = row['stats__total_tasks'], row['stats__done_tasks']
+    return int((done / total) * 100) if total > 0 else 0
+
+def _members_count(row, context):
+    if row['stats__members_count'] is None:
+        return ProjectMember.objects.filter(project_id=row['id']).count()
+    return row['stats__members_count']
+
+# TaskListSerializer's output
+TASK_ROWS = RowMapper({
+    'id': column('id', str),
+    'title': column('title'),
+    'description': column('description'),
+    'status': column('status'),
+    'priority': column('priority'),
+    'assignee': UserValue('assignee'),
+    'reporter': UserValue('reporter'),
+    'due_date': column('due_date', lambda value: value.isoformat()),
+    'order': column('order', float),
+    'created_at': column('created_at', _datetime),
+    'updated_at': column('updated_at', _datetime),
+})
+
+# ProjectListSerializer's output
+PROJECT_ROWS = RowMapper({
+    'id': column('id', str),
+    'name': column('name'),
+    'description': column('description'),
+    'owner': UserValue('owner'),
+    'members_count': Value(['id', 'stats__members_count'], _members_count),
+    'progress': Value(['id', 'stats__total_tasks', 'stats__done_tasks'], _progress),
+    'created_at': column('created_at', _datetime),
+    'updated_at': column('updated_at', _datetime),
+})
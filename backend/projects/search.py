@@ -0,0 +1,258 @@
+"""
+Full-text search over projects, tasks and comments.
+
+The searchable text of every object lives in a SearchDocument row. The
+signal handlers in projects.signals (and the batch writers in
+projects.bulk) keep those rows up to date, and deletes cascade through
+the document's foreign keys. A backend, chosen by settings.SEARCH_BACKEND
+or from the database vendor, answers queries against the documents:
+
+* SQLiteFTSBackend - an FTS5 external-content table over the documents,
+  kept in sync by triggers and ranked with bm25().
+* BasicBackend     - icontains over the documents, for any database.
+
+A Postgres backend would implement the same interface, e.g. with a
+SearchVectorField and GIN index on SearchDocument ranked by ts_rank.
+"""
+import re
+import threading
+import uuid
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.module_loading import import_string
+from .models import SearchDocument
+
+KINDS = [choice[0] for choice in SearchDocument.KIND_CHOICES]
+MAX_TERMS = 10
+SNIPPET_LENGTH = 160
+
+def project_document(project):
+    return SearchDocument(kind='project', object_id=project.id, project_id=project.id,
+                          title=project.name, body=project.description)
+
+def task_document(task):
+    return SearchDocument(kind='task', object_id=task.id, project_id=task.project_id, task_id=task.id,
+                          title=task.title, body=task.description)
+
+def comment_document(comment):
+    return SearchDocument(kind='comment', object_id=comment.id, project_id=comment.project_id,
+                          task_id=comment.task_id, comment_id=comment.id, body=comment.body)
+
+def index_document(document, created=False):
+    """Write one document: an INSERT for a new object, otherwise an UPDATE
+    (falling back to an INSERT if the object was never indexed)"""
+    if not created:
+        updated = SearchDocument.objects.filter(object_id=document.object_id).update(
+            project_id=document.project_id, task_id=document.task_id,
+            title=document.title, body=document.body,
+        )
+        if updated:
+            return
+    document.save(force_insert=True)
+
+def index_documents(documents):
+    """Insert or refresh a batch of documents with one statement"""
+    if documents:
+        SearchDocument.objects.bulk_create(
+            documents, update_conflicts=True, unique_fields=['object_id'],
+            update_fields=['project', 'task', 'title', 'body'],
+        )
+
+def search_terms(query):
+    return re.findall(r'\w+', query or '')[:MAX_TERMS]
+
+class SearchBackend:
+    """Interface of a search backend. Hits are dicts with kind, object_id,
+    project_id, task_id, title, snippet and rank (lower ranks first)."""
+
+    def setup(self, using=DEFAULT_DB_ALIAS):
+        """Create whatever the backend needs beyond the SearchDocument table.
+        Returns True if it had to be created."""
+        return False
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        """Re-derive the backend's index from the SearchDocument table"""
+
+    def search(self, query, project_ids=None, kinds=None, limit=20, offset=0):
+        raise NotImplementedError
+
+class BasicBackend(SearchBackend):
+    """Substring matching on the documents; every term must match"""
+
+    def search(self, query, project_ids=None, kinds=None, limit=20, offset=0):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        documents = SearchDocument.objects.all()
+        if project_ids is not None:
+            documents = documents.filter(project_id__in=project_ids)
+        if kinds:
+            documents = documents.filter(kind__in=kinds)
+        for term in terms:
+            documents = documents.filter(Q(title__icontains=term) | Q(body__icontains=term))
+        documents = documents.annotate(rank=Case(
+            When(title__icontains=terms[0], then=Value(0)), default=Value(1), output_field=IntegerField(),
+        )).order_by('rank', '-id')
+        return [{
+            'kind': document.kind,
+            'object_id': document.object_id,
+            'project_id': document.project_id,
+            'task_id': document.task_id,
+            'title': document.title,
+            'snippet': document.body[:SNIPPET_LENGTH],
+            'rank': document.rank,
+        } for document in documents[offset:offset + limit]]
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 index over SearchDocument (external content, trigger maintained)"""
+    table = 'projects_search'
+    documents = SearchDocument._meta.db_table
+    # bm25 column weights: a hit in the title counts for ten in the body
+    weights = (10.0, 1.0)
+
+    @classmethod
+    def available(cls, using=DEFAULT_DB_ALIAS):
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            return bool(cursor.fetchone()[0])
+
+    def setup(self, using=DEFAULT_DB_ALIAS):
+        t, d = self.table, self.documents
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [t])
+            exists = cursor.fetchone() is not None
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {t} USING fts5("
+                f"title, body, content='{d}', content_rowid='id', tokenize='unicode61', prefix='2 3')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {t}_ai AFTER INSERT ON {d} BEGIN "
+                f"INSERT INTO {t}(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {t}_ad AFTER DELETE ON {d} BEGIN "
+                f"INSERT INTO {t}({t}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {t}_au AFTER UPDATE OF title, body ON {d} BEGIN "
+                f"INSERT INTO {t}({t}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+                f"INSERT INTO {t}(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+            )
+            if not exists:
+                # Documents written before the index existed
+                cursor.execute(f"INSERT INTO {t}({t}) VALUES ('rebuild')")
+        return not exists
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        if self.setup(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    @staticmethod
+    def match_expression(terms):
+        """Every term as a quoted prefix query, so user input is never parsed
+        as FTS syntax and partial words match while the user types"""
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+    def search(self, query, project_ids=None, kinds=None, limit=20, offset=0):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        t, d = self.table, self.documents
+        where = [f'{t} MATCH %s']
+        params = [self.match_expression(terms)]
+        if project_ids is not None:
+            if not project_ids:
+                return []
+            where.append(f"d.project_id IN ({', '.join(['%s'] * len(project_ids))})")
+            params.extend(uuid.UUID(str(pid)).hex for pid in project_ids)
+        if kinds:
+            where.append(f"d.kind IN ({', '.join(['%s'] * len(kinds))})")
+            params.extend(kinds)
+        sql = (
+            f"SELECT d.kind, d.object_id, d.project_id, d.task_id, d.title, "
+            f"snippet({t}, -1, '<mark>', '</mark>', '…', 16), bm25({t}, {', '.join(map(str, self.weights))}) AS rank "
+            f"FROM {t} JOIN {d} d ON d.id = {t}.rowid "
+            f"WHERE {' AND '.join(where)} ORDER BY rank LIMIT %s OFFSET %s"
+        )
+        params.extend([limit, offset])
+        try:
+            rows = self._fetch(sql, params)
+        except OperationalError:
+            # The index has not been created yet (e.g. a database migrated
+            # before search existed); create it and try once more.
+            self.setup()
+            rows = self._fetch(sql, params)
+        return [{
+            'kind': kind,
+            'object_id': uuid.UUID(object_id),
+            'project_id': uuid.UUID(project_id),
+            'task_id': uuid.UUID(task_id) if task_id else None,
+            'title': title,
+            'snippet': snippet,
+            'rank': rank,
+        } for kind, object_id, project_id, task_id, title, snippet, rank in rows]
+
+    @staticmethod
+    def _fetch(sql, params):
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'SEARCH_BACKEND', None)
+                if path:
+                    _backend = import_string(path)()
+                elif SQLiteFTSBackend.available():
+                    _backend = SQLiteFTSBackend()
+                else:
+                    _backend = BasicBackend()
+    return _backend
+
+def search(query, project_ids=None, kinds=None, limit=20, offset=0):
+    return get_backend().search(query, project_ids=project_ids, kinds=kinds, limit=limit, offset=offset)
+
+def matching_ids(kind, query, limit=1000):
+    """Ids of objects of one kind matching query, best first (unscoped, for the admin)"""
+    return [hit['object_id'] for hit in search(query, kinds=[kind], limit=limit)]
+
+def setup_index(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate hook creating the backend's index structures"""
+    get_backend().setup(using)
+
+def rebuild_documents(batch_size=1000):
+    """Rewrite every SearchDocument from the source tables and rebuild the
+    backend's index. Returns the number of documents written."""
+    from .models import Comment, Project, Task
+    sources = [
+        (Project.objects.only('id', 'name', 'description'), project_document),
+        (Task.objects.only('id', 'project_id', 'title', 'description'), task_document),
+        (Comment.objects.only('id', 'project_id', 'task_id', 'body'), comment_document),
+    ]
+    written = 0
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for queryset, document in sources:
+            batch = []
+            for instance in queryset.iterator(chunk_size=batch_size):
+                batch.append(document(instance))
+                if len(batch) >= batch_size:
+                    SearchDocument.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            SearchDocument.objects.bulk_create(batch)
+            written += len(batch)
+        get_backend().rebuild()
+    return written
@@ -1,24 +1,28 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Project, ProjectMember, Task, Comment, Notification, ActivityLog
+from synergy.metrics import TimedSerializerMixin
+from .models import Project, ProjectMember, Task, Comment, Notification, ActivityLog, ActivitySummary, ImportJob
+from .membership import is_admin, is_member
+from .importer import guess_format
+from .rows import SparseFieldsMixin
 
 User = get_user_model()
 
-class UserBasicSerializer(serializers.ModelSerializer):
+class UserBasicSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'full_name', 'display_name', 'avatar']
 
-class ProjectMemberSerializer(serializers.ModelSerializer):
+class ProjectMemberSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserBasicSerializer(read_only=True)
-    user_id = serializers.UUIDField(write_only=True)
+    user_id = serializers.IntegerField(write_only=True)
     
     class Meta:
         model = ProjectMember
         fields = ['id', 'user', 'user_id', 'role', 'joined_at']
         read_only_fields = ['id', 'joined_at']
 
-class ProjectListSerializer(serializers.ModelSerializer):
+class ProjectListSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     owner = UserBasicSerializer(read_only=True)
     members_count = serializers.ReadOnlyField()
     progress = serializers.ReadOnlyField()
@@ -27,7 +31,7 @@ class ProjectListSerializer(serializers.ModelSerializer):
         model = Project
         fields = ['id', 'name', 'description', 'owner', 'members_count', 'progress', 'created_at', 'updated_at']
 
-class ProjectDetailSerializer(serializers.ModelSerializer):
+class ProjectDetailSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     owner = UserBasicSerializer(read_only=True)
     members = ProjectMemberSerializer(many=True, read_only=True)
     members_count = serializers.ReadOnlyField()
@@ -38,7 +42,7 @@ class ProjectDetailSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'owner', 'members', 'members_count', 'progress', 'is_archived', 'created_at', 'updated_at']
         read_only_fields = ['id', 'owner', 'created_at', 'updated_at']
 
-class ProjectCreateSerializer(serializers.ModelSerializer):
+class ProjectCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = ['name', 'description']
@@ -50,7 +54,7 @@ class ProjectCreateSerializer(serializers.ModelSerializer):
         ProjectMember.objects.create(project=project, user=user, role='admin')
         return project
 
-class TaskListSerializer(serializers.ModelSerializer):
+class TaskListSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     assignee = UserBasicSerializer(read_only=True)
     reporter = UserBasicSerializer(read_only=True)
     
@@ -58,8 +62,26 @@ class TaskListSerializer(serializers.ModelSerializer):
         model = Task
         fields = ['id', 'title', 'description', 'status', 'priority', 'assignee', 'reporter', 'due_date', 'order', 'created_at', 'updated_at']
 
-class TaskCreateUpdateSerializer(serializers.ModelSerializer):
-    assignee_id = serializers.UUIDField(required=False, allow_null=True)
+class MyTaskSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Row of the cross-project "my tasks" feed.
+
+    Project names come from the `project_names` map in the serializer
+    context, looked up once per page.
+    """
+    project_id = serializers.UUIDField(read_only=True)
+    project_name = serializers.SerializerMethodField()
+    reporter = UserBasicSerializer(read_only=True)
+    
+    class Meta:
+        model = Task
+        fields = ['id', 'project_id', 'project_name', 'title', 'description', 'status', 'priority', 'reporter',
+                  'due_date', 'order', 'created_at', 'updated_at']
+        
+    def get_project_name(self, obj):
+        return self.context.get('project_names', {}).get(obj.project_id)
+
+class TaskCreateUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    assignee_id = serializers.IntegerField(required=False, allow_null=True)
     
     class Meta:
         model = Task
@@ -67,48 +89,135 @@ class TaskCreateUpdateSerializer(serializers.ModelSerializer):
         
     def validate_assignee_id(self, value):
         if value:
-            try:
-                user = User.objects.get(id=value)
-                # Check if user is member of the project
-                project = self.context.get('project')
-                if project and not ProjectMember.objects.filter(project=project, user=user).exists():
+            # Batch writers resolve the project's members once up front
+            project_members = self.context.get('project_members')
+            if project_members is not None:
+                if value not in project_members:
                     raise serializers.ValidationError("User must be a member of the project")
                 return value
-            except User.DoesNotExist:
+            # Check if user is member of the project; a membership also
+            # proves the user exists, so the common case needs no query.
+            project_id = self.context.get('project_id')
+            if project_id and is_member(value, project_id, self.context.get('request')):
+                return value
+            if not User.objects.filter(id=value).exists():
                 raise serializers.ValidationError("User does not exist")
+            if project_id:
+                raise serializers.ValidationError("User must be a member of the project")
         return value
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Comment with its replies nested.
+
+    Replies come from the `thread_children` map in the serializer context
+    (built by projects.threads.load_threads), so rendering a thread never
+    queries the database per comment.
+    """
     author = UserBasicSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
+    thread_size = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
-        fields = ['id', 'body', 'author', 'parent', 'task', 'replies', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'author', 'created_at', 'updated_at']
+        fields = ['id', 'body', 'author', 'parent', 'task', 'depth', 'replies', 'thread_size', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'author', 'depth', 'created_at', 'updated_at']
         
     def get_replies(self, obj):
-        if obj.replies.exists():
-            return CommentSerializer(obj.replies.all(), many=True).data
-        return []
+        children = self.context.get('thread_children', {}).get(obj.id)
+        if not children:
+            return []
+        return CommentSerializer(children, many=True, context=self.context).data
+        
+    def get_thread_size(self, obj):
+        if obj.parent_id:
+            return None
+        return self.context.get('thread_sizes', {}).get(obj.id, 0)
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     project = ProjectListSerializer(read_only=True)
     task = TaskListSerializer(read_only=True)
     
     class Meta:
         model = Notification
-        fields = ['id', 'type', 'message', 'project', 'task', 'is_read', 'created_at']
+        fields = ['id', 'type', 'message', 'count', 'project', 'task', 'is_read', 'created_at']
         read_only_fields = ['id', 'created_at']
 
-class ActivityLogSerializer(serializers.ModelSerializer):
+class NotificationCompactSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Inbox row carrying only ids and display names of related objects"""
+    project_id = serializers.UUIDField(read_only=True)
+    project_name = serializers.CharField(source='project.name', read_only=True, default=None)
+    task_id = serializers.UUIDField(read_only=True)
+    task_title = serializers.CharField(source='task.title', read_only=True, default=None)
+    comment_id = serializers.UUIDField(read_only=True)
+    
+    class Meta:
+        model = Notification
+        fields = ['id', 'type', 'message', 'count', 'project_id', 'project_name', 'task_id', 'task_title',
+                  'comment_id', 'is_read', 'created_at']
+        read_only_fields = fields
+
+class ActivityLogSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     actor = UserBasicSerializer(read_only=True)
     
     class Meta:
         model = ActivityLog
-        fields = ['id', 'actor', 'verb', 'target_type', 'target_id', 'meta', 'created_at']
+        fields = ['id', 'actor', 'verb', 'target_type', 'target_id', 'field', 'meta', 'created_at']
+
+class ActivitySummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ActivitySummary
+        fields = ['date', 'verb', 'target_type', 'field', 'count']
+
+class SearchResultSerializer(TimedSerializerMixin, serializers.Serializer):
+    """One hit from projects.search, with display names resolved by the view"""
+    type = serializers.CharField(source='kind')
+    id = serializers.UUIDField(source='object_id')
+    project_id = serializers.UUIDField()
+    project_name = serializers.CharField(default=None)
+    task_id = serializers.UUIDField(allow_null=True)
+    task_title = serializers.CharField(default=None)
+    title = serializers.CharField()
+    snippet = serializers.CharField()
+    rank = serializers.FloatField()
+
+class ImportJobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    project_id = serializers.UUIDField(read_only=True)
+    
+    class Meta:
+        model = ImportJob
+        fields = ['id', 'project_id', 'format', 'source_name', 'status', 'rows_processed', 'rows_skipped',
+                  'members_created', 'tasks_created', 'comments_created', 'errors', 'failure',
+                  'created_at', 'updated_at', 'finished_at']
+        read_only_fields = fields
+
+class ImportJobCreateSerializer(TimedSerializerMixin, serializers.Serializer):
+    """Upload starting an import into a new project, or into project_id"""
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=ImportJob.FORMAT_CHOICES, required=False)
+    project_id = serializers.UUIDField(required=False)
+    
+    def validate(self, attrs):
+        if 'format' not in attrs:
+            attrs['format'] = guess_format(attrs['file'].name)
+            if attrs['format'] is None:
+                raise serializers.ValidationError({'format': 'Give the format or upload a .csv or .ndjson file.'})
+        request = self.context['request']
+        project_id = attrs.get('project_id')
+        if project_id and not is_admin(request.user.id, project_id, request):
+            raise serializers.ValidationError({'project_id': 'Only project admins can import into a project.'})
+        return attrs
+        
+    def create(self, validated_data):
+        upload = validated_data['file']
+        return ImportJob.objects.create(
+            created_by=self.context['request'].user,
+            project_id=validated_data.get('project_id'),
+            format=validated_data['format'],
+            source=upload,
+            source_name=upload.name[:255],
+        )
 
-class WorkloadSerializer(serializers.Serializer):
+class WorkloadSerializer(TimedSerializerMixin, serializers.Serializer):
     assignee = UserBasicSerializer(read_only=True)
-    assignee_id = serializers.UUIDField()
+    assignee_id = serializers.IntegerField()
     open_tasks = serializers.IntegerField()
\ No newline at end of file
@@ -1,54 +1,311 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from django.db.models import QuerySet
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Task, Comment, Project, ActivityLog, Notification
+from django.utils import timezone
+from .models import Task, Comment, Project, ProjectMember, ProjectStats, ActivityArchive
+from . import activity, analytics, membership, realtime, retention, search, stats
+from .cache import bump_project_version
 
-@receiver(post_save, sender=Task)
-def task_saved(sender, instance, created, **kwargs):
-    """Create activity log when task is created or updated"""
-    verb = 'created' if created else 'updated'
-    ActivityLog.objects.create(
-        project=instance.project,
-        actor=instance.reporter if created else instance.reporter,  # Could be updated by different user
+_muted = ContextVar('projects_signals_muted', default=False)
+
+@contextmanager
+def muted():
+    """Silence the per-row task and comment handlers below.
+
+    For batch writers (see projects.bulk) that apply stats, versions,
+    activity and realtime events for the whole batch themselves.
+    """
+    token = _muted.set(True)
+    try:
+        yield
+    finally:
+        _muted.reset(token)
+
+def _unless_muted(handler):
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        if not _muted.get():
+            return handler(*args, **kwargs)
+    return wrapper
+
+def _deleting_project(origin):
+    """True when a delete cascades from a project, whose stats go with it"""
+    if isinstance(origin, Project):
+        return True
+    return isinstance(origin, QuerySet) and origin.model is Project
+
+def _text(value):
+    return value[:100]
+
+def _date(value):
+    return value.isoformat() if value else None
+
+# Task fields whose changes are logged: attname -> (field name in the log,
+# value type, how values are stored in meta)
+TRACKED_TASK_FIELDS = {
+    'title': ('title', 'text', _text),
+    'description': ('description', 'text', _text),
+    'status': ('status', 'choice', str),
+    'priority': ('priority', 'choice', str),
+    'assignee_id': ('assignee', 'user', lambda value: value),
+    'due_date': ('due_date', 'date', _date),
+}
+
+def task_changes(task):
+    """(attname, old, new) for each tracked field the unsaved changes of a
+    loaded task touch, diffed against the values it was loaded with; None
+    when there is nothing to diff against"""
+    loaded = getattr(task, '_loaded_values', None)
+    if loaded is None:
+        return None
+    changes = []
+    for attname in TRACKED_TASK_FIELDS:
+        if attname in loaded and attname in task.__dict__ and loaded[attname] != task.__dict__[attname]:
+            changes.append((attname, loaded[attname], task.__dict__[attname]))
+    return changes
+
+def task_change_events(task, actor_id, changes):
+    """One 'updated' event per changed field, with typed old and new values"""
+    events = []
+    for attname, old, new in changes:
+        field, kind, store = TRACKED_TASK_FIELDS[attname]
+        events.append(activity.build_event(
+            project_id=task.project_id,
+            actor_id=actor_id,
+            verb='updated',
+            target_type='task',
+            target_id=task.id,
+            field=field,
+            meta={
+                'task_title': task.title,
+                'type': kind,
+                'from': None if old is None else store(old),
+                'to': None if new is None else store(new),
+            }
+        ))
+    return events
+
+def task_activity(task, actor_id, verb):
+    """Activity event for a task write"""
+    return activity.build_event(
+        project_id=task.project_id,
+        actor_id=actor_id,
         verb=verb,
         target_type='task',
-        target_id=str(instance.id),
+        target_id=task.id,
         meta={
-            'task_title': instance.title,
-            'status': instance.status,
-            'priority': instance.priority,
-            'assignee': str(instance.assignee.id) if instance.assignee else None
+            'task_title': task.title,
+            'status': task.status,
+            'priority': task.priority,
+            'assignee': str(task.assignee_id) if task.assignee_id else None
         }
     )
 
+@receiver(post_save, sender=Task)
+@_unless_muted
+def task_saved(sender, instance, created, raw=False, **kwargs):
+    """Log a task's creation, or one event per field an update changed"""
+    if raw:
+        return
+    # Outside a request (admin actions, commands) the reporter stands in
+    actor_id = activity.current_actor() or instance.reporter_id
+    if created:
+        activity.record(task_activity(instance, actor_id, 'created'))
+        return
+    changes = task_changes(instance)
+    if changes is None:
+        # Not loaded from the database, so what changed is unknown
+        activity.record(task_activity(instance, actor_id, 'updated'))
+    else:
+        activity.record(*task_change_events(instance, actor_id, changes))
+
+@receiver(post_save, sender=Task)
+@_unless_muted
+def task_counters_saved(sender, instance, created, raw=False, **kwargs):
+    """Keep ProjectStats task counters and the daily analytics rollups in
+    step with task saves"""
+    if raw:
+        return
+    rollup = analytics.Rollup()
+    if created:
+        stats.adjust_task_counts(instance.project_id, instance.status, 1)
+        rollup.created(instance.project_id, instance.status, instance.created_at)
+    else:
+        loaded = getattr(instance, '_loaded_values', {})
+        old_project_id = loaded.get('project_id', instance.project_id)
+        old_status = loaded.get('status', instance.status)
+        stats.move_task_counts(old_project_id, old_status, instance.project_id, instance.status)
+        now = timezone.now()
+        if old_project_id == instance.project_id:
+            rollup.transition(instance.project_id, old_status, instance.status, now,
+                              created_at=instance.created_at)
+        else:
+            rollup.adjust(old_project_id, old_status, now, -1)
+            rollup.adjust(instance.project_id, instance.status, now, 1)
+    rollup.save()
+
+@receiver(post_delete, sender=Task)
+@_unless_muted
+def task_counters_deleted(sender, instance, origin=None, **kwargs):
+    """Decrement ProjectStats task counters and the day's status count when
+    a task is deleted"""
+    if _deleting_project(origin):
+        return
+    stats.adjust_task_counts(instance.project_id, instance.status, -1)
+    rollup = analytics.Rollup()
+    rollup.adjust(instance.project_id, instance.status, timezone.now(), -1)
+    rollup.save()
+
+@receiver(post_save, sender=ProjectMember)
+def member_counters_saved(sender, instance, created, raw=False, **kwargs):
+    """Increment the member counter when someone joins a project"""
+    if created and not raw:
+        stats.adjust_member_count(instance.project_id, 1)
+
+@receiver(post_delete, sender=ProjectMember)
+def member_counters_deleted(sender, instance, origin=None, **kwargs):
+    """Decrement the member counter when someone leaves a project"""
+    if _deleting_project(origin):
+        return
+    stats.adjust_member_count(instance.project_id, -1)
+
 @receiver(post_save, sender=Comment)
-def comment_created(sender, instance, created, **kwargs):
+@_unless_muted
+def comment_created(sender, instance, created, raw=False, **kwargs):
     """Create activity log when comment is created"""
-    if created:
-        ActivityLog.objects.create(
-            project=instance.project,
-            actor=instance.author,
+    if created and not raw:
+        # Only use the task title if the task is already loaded
+        task = instance.task if Comment.task.is_cached(instance) else None
+        activity.record(activity.build_event(
+            project_id=instance.project_id,
+            actor_id=instance.author_id,
             verb='commented',
             target_type='comment',
-            target_id=str(instance.id),
+            target_id=instance.id,
             meta={
                 'comment_body': instance.body[:100],
-                'task_id': str(instance.task.id) if instance.task else None,
-                'task_title': instance.task.title if instance.task else None
+                'task_id': str(instance.task_id) if instance.task_id else None,
+                'task_title': task.title if task else None
             }
-        )
+        ))
 
 @receiver(post_save, sender=Project)
-def project_created(sender, instance, created, **kwargs):
+def project_created(sender, instance, created, raw=False, **kwargs):
     """Create activity log when project is created"""
-    if created:
-        ActivityLog.objects.create(
-            project=instance,
-            actor=instance.owner,
+    if created and not raw:
+        ProjectStats.objects.get_or_create(project=instance)
+        activity.record(activity.build_event(
+            project_id=instance.id,
+            actor_id=instance.owner_id,
             verb='created',
             target_type='project',
-            target_id=str(instance.id),
+            target_id=instance.id,
             meta={
                 'project_name': instance.name,
                 'project_description': instance.description[:100]
             }
-        )
\ No newline at end of file
+        ))
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=ProjectMember)
+@receiver(post_delete, sender=ProjectMember)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@_unless_muted
+def bump_version(sender, instance, **kwargs):
+    """Invalidate cached per-project aggregates after any change"""
+    bump_project_version(instance.project_id)
+
+@receiver(post_save, sender=Project)
+def bump_project_saved(sender, instance, **kwargs):
+    bump_project_version(instance.id)
+
+
+def task_event(task):
+    return {
+        'id': str(task.id),
+        'title': task.title,
+        'status': task.status,
+        'priority': task.priority,
+        'assignee_id': task.assignee_id,
+        'due_date': task.due_date,
+        'order': task.order,
+    }
+
+@receiver(post_save, sender=Task)
+@_unless_muted
+def push_task_saved(sender, instance, created, raw=False, **kwargs):
+    """Stream task changes to clients watching the project board"""
+    if not raw:
+        event_type = 'task.created' if created else 'task.updated'
+        realtime.publish(realtime.project_channel(instance.project_id), event_type, task_event(instance))
+
+@receiver(post_delete, sender=Task)
+@_unless_muted
+def push_task_deleted(sender, instance, origin=None, **kwargs):
+    if not _deleting_project(origin):
+        realtime.publish(realtime.project_channel(instance.project_id), 'task.deleted', {'id': str(instance.id)})
+
+@receiver(post_save, sender=Comment)
+@_unless_muted
+def push_comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        realtime.publish(realtime.project_channel(instance.project_id), 'comment.created', {
+            'id': str(instance.id),
+            'task_id': str(instance.task_id) if instance.task_id else None,
+            'parent_id': str(instance.parent_id) if instance.parent_id else None,
+            'author_id': instance.author_id,
+            'body': instance.body,
+        })
+
+_UNLOADED = object()
+
+@receiver(post_save, sender=Task)
+@_unless_muted
+def index_task(sender, instance, created, raw=False, **kwargs):
+    """Refresh the task's search document when its text changes"""
+    if raw:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if not created and all(loaded.get(f, _UNLOADED) == getattr(instance, f) for f in ('title', 'description')):
+        return
+    search.index_document(search.task_document(instance), created)
+
+@receiver(post_save, sender=Comment)
+@_unless_muted
+def index_comment(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        search.index_document(search.comment_document(instance), created)
+
+@receiver(post_save, sender=Project)
+def index_project(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        search.index_document(search.project_document(instance), created)
+
+# Deleted objects' documents go with them through SearchDocument's foreign keys
+
+@receiver(post_delete, sender=ActivityArchive)
+def remove_archive_file(sender, instance, **kwargs):
+    """Archived days go with their project"""
+    transaction.on_commit(lambda: retention.remove_archive(instance.project_id, instance.date))
+
+@receiver(post_save, sender=ProjectMember)
+@receiver(post_delete, sender=ProjectMember)
+def invalidate_membership(sender, instance, **kwargs):
+    """Drop the member's cached role map after any membership change"""
+    membership.invalidate(instance.user_id)
+
+@receiver(post_save, sender=Task)
+def remember_task_values(sender, instance, raw=False, **kwargs):
+    """Take the saved values as the new baseline the handlers above diff
+    against. Registered last, so it runs after all of them."""
+    if not raw:
+        instance._loaded_values = {
+            field.attname: instance.__dict__[field.attname]
+            for field in Task._meta.concrete_fields if field.attname in instance.__dict__
+        }
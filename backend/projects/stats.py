@@ -0,0 +1,100 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from .models import Project, ProjectMember, ProjectStats, Task
+
+STATUSES = [choice[0] for choice in Task.STATUS_CHOICES]
+
+def adjust_task_counts(project_id, status, delta):
+    """Add delta to the total and per-status task counters of a project"""
+    if not project_id or not delta:
+        return
+    status_field = ProjectStats.status_field(status)
+    with transaction.atomic():
+        updated = ProjectStats.objects.filter(project_id=project_id).update(
+            total_tasks=F('total_tasks') + delta,
+            **{status_field: F(status_field) + delta}
+        )
+        if not updated:
+            rebuild_project_stats([project_id])
+
+def move_task_counts(old_project_id, old_status, new_project_id, new_status):
+    """Move one task between (project, status) counters"""
+    if old_project_id == new_project_id:
+        if old_status == new_status:
+            return
+        old_field = ProjectStats.status_field(old_status)
+        new_field = ProjectStats.status_field(new_status)
+        with transaction.atomic():
+            updated = ProjectStats.objects.filter(project_id=new_project_id).update(**{
+                old_field: F(old_field) - 1,
+                new_field: F(new_field) + 1,
+            })
+            if not updated:
+                rebuild_project_stats([new_project_id])
+        return
+    with transaction.atomic():
+        adjust_task_counts(old_project_id, old_status, -1)
+        adjust_task_counts(new_project_id, new_status, 1)
+
+def apply_task_deltas(project_id, deltas):
+    """Apply a batch's {status: delta} changes to a project's counters at once"""
+    deltas = {status: delta for status, delta in deltas.items() if delta}
+    if not project_id or not deltas:
+        return
+    fields = {
+        ProjectStats.status_field(status): F(ProjectStats.status_field(status)) + delta
+        for status, delta in deltas.items()
+    }
+    total = sum(deltas.values())
+    if total:
+        fields['total_tasks'] = F('total_tasks') + total
+    with transaction.atomic():
+        updated = ProjectStats.objects.filter(project_id=project_id).update(**fields)
+        if not updated:
+            rebuild_project_stats([project_id])
+
+def adjust_member_count(project_id, delta):
+    """Add delta to the member counter of a project"""
+    with transaction.atomic():
+        updated = ProjectStats.objects.filter(project_id=project_id).update(
+            members_count=F('members_count') + delta
+        )
+        if not updated:
+            rebuild_project_stats([project_id])
+
+def rebuild_project_stats(project_ids=None):
+    """Recompute counters from the tasks and members tables.
+
+    Rebuilds every project when project_ids is None. Returns the number of
+    stats rows written.
+    """
+    projects = Project.objects.all()
+    if project_ids is not None:
+        projects = projects.filter(id__in=project_ids)
+    ids = list(projects.values_list('id', flat=True))
+    if not ids:
+        return 0
+
+    counts = defaultdict(dict)
+    task_rows = Task.objects.filter(project_id__in=ids).values('project_id', 'status').annotate(n=Count('id'))
+    for row in task_rows:
+        counts[row['project_id']][row['status']] = row['n']
+    member_rows = ProjectMember.objects.filter(project_id__in=ids).values('project_id').annotate(n=Count('id'))
+    members = {row['project_id']: row['n'] for row in member_rows}
+
+    rows = []
+    for project_id in ids:
+        by_status = counts.get(project_id, {})
+        fields = {ProjectStats.status_field(s): by_status.get(s, 0) for s in STATUSES}
+        rows.append(ProjectStats(
+            project_id=project_id,
+            total_tasks=sum(by_status.values()),
+            members_count=members.get(project_id, 0),
+            **fields
+        ))
+
+    with transaction.atomic():
+        ProjectStats.objects.filter(project_id__in=ids).delete()
+        ProjectStats.objects.bulk_create(rows)
+    return len(rows)
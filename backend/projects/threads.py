@@ -0,0 +1,63 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from .models import Comment
+
+def thread_max_depth():
+    return getattr(settings, 'COMMENT_THREAD_MAX_DEPTH', 10)
+
+def thread_page_size():
+    return getattr(settings, 'COMMENT_THREAD_REPLIES_PAGE_SIZE', 50)
+
+def subtree_ids(comment):
+    """Ids of a comment and all its replies, nested ones included, with one
+    query over the comment's thread"""
+    thread = Comment.objects.filter(root_id=comment.root_id or comment.id).values_list('id', 'parent_id')
+    children = defaultdict(list)
+    for comment_id, parent_id in thread:
+        children[parent_id].append(comment_id)
+    ids, pending = [], [comment.id]
+    while pending:
+        comment_id = pending.pop()
+        ids.append(comment_id)
+        pending.extend(children[comment_id])
+    return ids
+
+def load_threads(roots, max_depth=None, limit=None, offset=0):
+    """Load the replies of the given top-level comments in bulk.
+
+    Returns (children, sizes): children maps a comment id to its ordered
+    replies, sizes maps each root id to the total number of replies in its
+    thread. At most `limit` replies per thread are loaded, oldest first and
+    starting at `offset`; replies nested deeper than `max_depth` are skipped.
+    Replies whose parent falls outside the loaded window are dropped.
+    """
+    max_depth = thread_max_depth() if max_depth is None else max_depth
+    limit = thread_page_size() if limit is None else limit
+    root_ids = [root.id for root in roots]
+    if not root_ids:
+        return {}, {}
+
+    replies = Comment.objects.filter(
+        root_id__in=root_ids, depth__lte=max_depth
+    ).select_related('author').annotate(
+        position=Window(RowNumber(), partition_by=[F('root_id')], order_by=[F('created_at').asc(), F('id').asc()])
+    ).filter(position__gt=offset, position__lte=offset + limit).order_by('created_at', 'id')
+
+    sizes = dict(
+        Comment.objects.filter(root_id__in=root_ids, depth__lte=max_depth)
+        .values('root_id').annotate(n=Count('id')).values_list('root_id', 'n')
+    )
+
+    children = defaultdict(list)
+    loaded = set(root_ids)
+    for reply in replies:
+        # With an offset, the first loaded replies hang off comments that
+        # belong to an earlier page; attach them to the root instead.
+        parent_id = reply.parent_id if reply.parent_id in loaded or not offset else reply.root_id
+        if parent_id not in loaded:
+            continue
+        children[parent_id].append(reply)
+        loaded.add(reply.id)
+    return dict(children), sizes
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, realtime
 
 router = DefaultRouter()
 router.register(r'projects', views.ProjectViewSet, basename='project')
@@ -8,7 +8,10 @@ router.register(r'tasks', views.TaskViewSet, basename='task')
 router.register(r'comments', views.CommentViewSet, basename='comment')
 router.register(r'notifications', views.NotificationViewSet, basename='notification')
 router.register(r'activities', views.ActivityLogViewSet, basename='activity')
+router.register(r'imports', views.ImportJobViewSet, basename='import')
 
 urlpatterns = [
+    path('stream/', realtime.event_stream, name='event-stream'),
+    path('search/', views.SearchView.as_view(), name='search'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
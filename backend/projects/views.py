@@ -1,24 +1,88 @@
-from rest_framework import generics, viewsets, permissions, status
+from rest_framework import generics, mixins, viewsets, permissions, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, NotFound
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from datetime import date, timedelta
+from django.db.models import Count, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib.auth import get_user_model
-from .models import Project, ProjectMember, Task, Comment, Notification, ActivityLog
+from .models import (
+    Project, ProjectMember, Task, Comment, Notification, ActivityLog, ActivityArchive, ActivitySummary, ImportJob
+)
+from . import search
 from .serializers import (
     ProjectListSerializer, ProjectDetailSerializer, ProjectCreateSerializer,
     TaskListSerializer, TaskCreateUpdateSerializer, CommentSerializer,
-    NotificationSerializer, ActivityLogSerializer, ProjectMemberSerializer,
-    WorkloadSerializer, UserBasicSerializer
+    NotificationSerializer, NotificationCompactSerializer, ActivityLogSerializer, ProjectMemberSerializer,
+    SearchResultSerializer, MyTaskSerializer, ImportJobSerializer, ImportJobCreateSerializer,
+    ActivitySummarySerializer
+)
+from .pagination import (
+    TaskPagination, MyTaskPagination, NotificationPagination, ActivityLogPagination, ImportJobPagination
 )
 from .permissions import IsProjectMember, IsProjectAdmin
+from .activity import ActorMixin
+from .cache import CachedResponseMixin
+from .rows import PROJECT_ROWS, TASK_ROWS, RowListMixin
+from .membership import is_admin, is_member, normalize_project_id, project_roles
+from .notifications import notify, unread_count, adjust_unread, reset_unread, unread_by_user, discount_unread
+from .threads import load_threads, subtree_ids, thread_page_size
+from .analytics import analytics_max_days, project_report
+from .board import board_snapshot
+from .retention import read_archive
+from .export import EXPORTS, FORMATS, async_blocks, export_filename, export_stream
+from .bulk import check_batch, create_tasks, update_tasks, delete_tasks
+from .ordering import move_task
+from .importer import is_resumable, schedule_import
+from .workload import cached_project_workload, cached_portfolio_workload
 
 User = get_user_model()
 
-class ProjectViewSet(viewsets.ModelViewSet):
-    """ViewSet for managing projects"""
+def _date_param(request, param):
+    """The date in query parameter param, or None when it is absent"""
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise serializers.ValidationError(f"{param} must be a date (YYYY-MM-DD)")
+    return day
+
+def _project_ids_param(request, param):
+    """Sorted, de-duplicated project ids in query parameter param (comma
+    separated), or an empty list when it is absent"""
+    values = [value.strip() for value in request.query_params.get(param, '').split(',') if value.strip()]
+    project_ids = {normalize_project_id(value) for value in values}
+    if None in project_ids:
+        raise serializers.ValidationError(f"{param} must be project ids (UUIDs)")
+    return sorted(project_ids)
+
+class ProjectViewSet(ActorMixin, CachedResponseMixin, RowListMixin, viewsets.ModelViewSet):
+    """ViewSet for managing projects.
+
+    Lists and details take ?fields= (a sparse fieldset); lists also take
+    ?users=map to send owners once, in a side-loaded map.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    row_mapper = PROJECT_ROWS
+    
+    def cache_scope(self):
+        user_id = self.request.user.id
+        if self.action == 'list':
+            # The project set is part of the key, so joining or leaving a
+            # project changes it too
+            return list(project_roles(user_id, self.request)), [user_id]
+        if is_member(user_id, self.kwargs.get('pk'), self.request):
+            return [self.kwargs['pk']], []
+        return None
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -31,7 +95,11 @@ class ProjectViewSet(viewsets.ModelViewSet):
         user = self.request.user
         queryset = Project.objects.filter(
             Q(owner=user) | Q(members__user=user)
-        ).distinct().select_related('owner').prefetch_related('members__user')
+        ).distinct().select_related('owner', 'stats')
+        
+        # Only the detail serializer renders the member roster
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related('members__user')
         
         # Filter by mine parameter
         if self.request.query_params.get('mine') == 'true':
@@ -46,13 +114,19 @@ class ProjectViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
     
+    def perform_destroy(self, instance):
+        # Unread notifications go with the project
+        unread = unread_by_user(Notification.objects.filter(project=instance))
+        instance.delete()
+        discount_unread(unread)
+    
     @action(detail=True, methods=['post'])
     def add_member(self, request, pk=None):
         """Add a member to the project"""
         project = self.get_object()
         
         # Check if user is admin
-        if not ProjectMember.objects.filter(project=project, user=request.user, role='admin').exists():
+        if not is_admin(request.user.id, project.id, request):
             raise PermissionDenied("Only admins can add members")
         
         serializer = ProjectMemberSerializer(data=request.data)
@@ -72,19 +146,84 @@ class ProjectViewSet(viewsets.ModelViewSet):
         if not created:
             return Response({'error': 'User is already a member'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create notification
-        Notification.objects.create(
-            user=user,
-            type='project_invite',
+        notify(
+            'project_invite',
+            f'You were added to project "{project.name}"',
             project=project,
-            message=f'You were added to project "{project.name}"'
+            recipients={user.id},
         )
         
         return Response(ProjectMemberSerializer(member).data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """Stream the project's tasks, comments or activity history.
 
-class TaskViewSet(viewsets.ModelViewSet):
-    """ViewSet for managing tasks"""
+        ?kind=tasks|comments|activity (default tasks), ?output=csv|ndjson
+        (default csv) and ?gzip=true for a gzipped download.
+        """
+        project = self.get_object()
+        kind = request.query_params.get('kind', 'tasks')
+        output = request.query_params.get('output', 'csv')
+        if kind not in EXPORTS:
+            raise serializers.ValidationError(f"kind must be one of: {', '.join(EXPORTS)}")
+        if output not in FORMATS:
+            raise serializers.ValidationError(f"output must be one of: {', '.join(FORMATS)}")
+        compress = request.query_params.get('gzip') == 'true'
+        
+        stream = export_stream(project.id, kind, output, compress)
+        if isinstance(request._request, ASGIRequest):
+            stream = async_blocks(stream)
+        response = StreamingHttpResponse(stream, content_type='application/gzip' if compress else FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(project, kind, output, compress)}"'
+        return response
+    
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        """Burndown, throughput and cycle times from the daily rollups.
+
+        Covers the ?days (default 30) days up to ?until (default today).
+        """
+        project = self.get_object()
+        end = _date_param(request, 'until') or timezone.localdate()
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = 0
+        max_days = analytics_max_days()
+        if not 1 <= days <= max_days:
+            raise serializers.ValidationError(f"days must be a number from 1 to {max_days}")
+        
+        return Response(project_report(project, end - timedelta(days=days - 1), end))
+    
+    @action(detail=True, methods=['get'])
+    def board(self, request, pk=None):
+        """The whole board: project, members, tasks by status, workload and
+        recent activity, with users side-loaded once.
+
+        ?since=<version> (the version of an earlier response) sends only
+        the tasks changed since, plus the ordered task ids of each column.
+        """
+        project_id = normalize_project_id(pk)
+        if project_id is None or not is_member(request.user.id, project_id, request):
+            raise NotFound()
+        return Response(board_snapshot(project_id, request.query_params.get('since'), request))
+
+class TaskViewSet(ActorMixin, CachedResponseMixin, RowListMixin, viewsets.ModelViewSet):
+    """ViewSet for managing tasks.
+
+    Lists and details take ?fields= (a sparse fieldset); lists also take
+    ?users=map to send assignees and reporters once, in a side-loaded map.
+    """
     permission_classes = [permissions.IsAuthenticated, IsProjectMember]
+    pagination_class = TaskPagination
+    row_mapper = TASK_ROWS
+    
+    def cache_scope(self):
+        # IsProjectMember has already checked the caller against ?project=,
+        # and the queryset only holds that project's tasks
+        project_id = normalize_project_id(self.request.query_params.get('project'))
+        return ([project_id], []) if project_id else None
     
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -98,100 +237,198 @@ class TaskViewSet(viewsets.ModelViewSet):
             
         return Task.objects.filter(project_id=project_id).select_related(
             'assignee', 'reporter', 'project'
-        ).order_by('order', '-created_at')
+        ).order_by('order', '-created_at', 'id')
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Lets the serializer check the assignee against the project's members
+        context['project_id'] = self.request.data.get('project_id') or self.request.query_params.get('project')
+        return context
     
     def perform_create(self, serializer):
         project_id = self.request.data.get('project_id')
         if not project_id:
             raise serializers.ValidationError("project_id is required")
-            
-        project = get_object_or_404(Project, id=project_id)
         
         # Check if user is project member
-        if not ProjectMember.objects.filter(project=project, user=self.request.user).exists():
+        if not is_member(self.request.user.id, project_id, self.request):
             raise PermissionDenied("You must be a project member")
         
-        assignee_id = serializer.validated_data.get('assignee_id')
-        assignee = None
-        if assignee_id:
-            assignee = get_object_or_404(User, id=assignee_id)
-        
-        task = serializer.save(
-            project=project,
-            reporter=self.request.user,
-            assignee=assignee
-        )
+        project = get_object_or_404(Project, id=project_id)
+        task = serializer.save(project=project, reporter=self.request.user)
         
-        # Create notification for assignee
-        if assignee and assignee != self.request.user:
-            Notification.objects.create(
-                user=assignee,
-                type='task_assigned',
-                project=project,
-                task=task,
-                message=f'You were assigned task "{task.title}" in project "{project.name}"'
+        if task.assignee_id:
+            notify(
+                'task_assigned',
+                f'You were assigned task "{task.title}" in project "{project.name}"',
+                project=project, task=task, recipients={task.assignee_id}, actor=self.request.user,
             )
     
     def perform_update(self, serializer):
-        task = self.get_object()
-        old_assignee = task.assignee
-        old_status = task.status
+        old_assignee_id = serializer.instance.assignee_id
+        old_status = serializer.instance.status
         
-        assignee_id = serializer.validated_data.get('assignee_id')
-        new_assignee = None
-        if assignee_id:
-            new_assignee = get_object_or_404(User, id=assignee_id)
-            
-        task = serializer.save(assignee=new_assignee)
-        
-        # Create notifications
-        if new_assignee and new_assignee != old_assignee and new_assignee != self.request.user:
-            Notification.objects.create(
-                user=new_assignee,
-                type='task_assigned',
-                project=task.project,
-                task=task,
-                message=f'You were assigned task "{task.title}" in project "{task.project.name}"'
+        task = serializer.save()
+        
+        if task.assignee_id and task.assignee_id != old_assignee_id:
+            notify(
+                'task_assigned',
+                f'You were assigned task "{task.title}" in project "{task.project.name}"',
+                task=task, recipients={task.assignee_id}, actor=self.request.user,
             )
         
-        # Notify about status change
-        if task.status != old_status and task.assignee and task.assignee != self.request.user:
-            Notification.objects.create(
-                user=task.assignee,
-                type='task_updated',
-                project=task.project,
-                task=task,
-                message=f'Task "{task.title}" status changed to {task.get_status_display()}'
+        # Everyone following the task hears about status changes
+        if task.status != old_status:
+            notify(
+                'task_updated',
+                f'Task "{task.title}" status changed to {task.get_status_display()}',
+                task=task, actor=self.request.user,
             )
     
+    def perform_destroy(self, instance):
+        # Unread notifications about the task go with it
+        unread = unread_by_user(Notification.objects.filter(task=instance))
+        instance.delete()
+        discount_unread(unread)
+    
     @action(detail=False, methods=['get'])
     def workload(self, request):
-        """Get workload information for project members"""
-        project_id = request.query_params.get('project')
-        if not project_id:
+        """Get workload information for project members.
+
+        ?project=<id> covers one project, ?projects=<id>,<id> a set of the
+        caller's projects, and ?portfolio=true the caller's own tasks across
+        all of their projects, broken down by project.
+        """
+        member_of = project_roles(request.user.id, request)
+        
+        if request.query_params.get('portfolio') == 'true':
+            return Response(cached_portfolio_workload(request.user, sorted(member_of)))
+        
+        # IsProjectMember has already checked ?project= is an id the caller may see
+        project_id = normalize_project_id(request.query_params.get('project'))
+        if project_id:
+            return Response(cached_project_workload([project_id]))
+        
+        requested = _project_ids_param(request, 'projects')
+        if not requested:
             return Response({'error': 'project parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        project_ids = [pid for pid in requested if is_member(request.user.id, pid, request)]
+        return Response(cached_project_workload(project_ids))
+
+    @action(detail=False, methods=['get'])
+    def mine(self, request):
+        """Tasks assigned to the caller across all of their projects, soonest due first.
+
+        Filters: ?status=todo,in_progress ?priority=high,urgent and
+        ?due_after=/?due_before= (YYYY-MM-DD, inclusive). Undated tasks come
+        last and are left out by either due date filter.
+        """
+        filters = Q(assignee=request.user, project_id__in=list(project_roles(request.user.id, request)))
+        for param, choices in (('status', Task.STATUS_CHOICES), ('priority', Task.PRIORITY_CHOICES)):
+            values = [value for value in request.query_params.get(param, '').split(',') if value]
+            if values:
+                if any(value not in dict(choices) for value in values):
+                    raise serializers.ValidationError(f"{param} must be one of: {', '.join(dict(choices))}")
+                filters &= Q(**{f'{param}__in': values})
+        for param, lookup in (('due_after', 'due_date__gte'), ('due_before', 'due_date__lte')):
+            day = _date_param(request, param)
+            if day:
+                filters &= Q(**{lookup: day})
         
-        # Get open tasks count per assignee
-        workload_data = Task.objects.filter(
-            project_id=project_id,
-            status__in=['todo', 'in_progress', 'blocked']
-        ).values('assignee').annotate(
-            open_tasks=Count('id')
-        ).exclude(assignee__isnull=True)
-        
-        # Get user data
-        result = []
-        for item in workload_data:
-            user = User.objects.get(id=item['assignee'])
-            result.append({
-                'assignee': UserBasicSerializer(user).data,
-                'assignee_id': str(user.id),
-                'open_tasks': item['open_tasks']
-            })
-        
-        return Response(result)
+        # Served by the (assignee, status) index; undated tasks sort after every real date
+        queryset = Task.objects.filter(filters).select_related('reporter').annotate(
+            due_sort=Coalesce('due_date', Value(date.max))
+        )
+        paginator = MyTaskPagination()
+        tasks = paginator.paginate_queryset(queryset, request, view=self)
+        project_ids = {task.project_id for task in tasks}
+        project_names = dict(Project.objects.filter(id__in=project_ids).values_list('id', 'name')) if project_ids else {}
+        serializer = MyTaskSerializer(tasks, many=True, context={**self.get_serializer_context(),
+                                                                  'project_names': project_names})
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def bulk(self, request):
+        """Create (POST), update or move (PATCH) or delete (DELETE) tasks in one batch.
+
+        POST and PATCH take {"project_id", "tasks": [...]}, where PATCH items
+        carry the task "id"; DELETE takes {"project_id", "ids": [...]}. Valid
+        items are written even if others fail unless "atomic" is true.
+        """
+        project_id = request.data.get('project_id')
+        if not project_id:
+            raise serializers.ValidationError("project_id is required")
+        if not is_member(request.user.id, project_id, request):
+            raise PermissionDenied("You must be a project member")
+        project = get_object_or_404(Project, id=project_id)
+        atomic = request.data.get('atomic') in (True, 'true')
+        
+        if request.method == 'DELETE':
+            ids = request.data.get('ids')
+            check_batch(ids, 'ids')
+            written, errors = delete_tasks(project, ids, atomic=atomic)
+        else:
+            items = request.data.get('tasks')
+            check_batch(items, 'tasks')
+            write = create_tasks if request.method == 'POST' else update_tasks
+            written, errors = write(project, request.user, items, request=request, atomic=atomic)
+        
+        if errors and not written:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif request.method == 'POST':
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_200_OK
+        results = [{'index': index, 'id': str(task.id)} for index, task in written]
+        return Response({'results': results, 'errors': errors}, status=response_status)
 
-class CommentViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'])
+    def reorder(self, request, pk=None):
+        """Move a task on the board: {"after": <task id>, "before": <task id>, "status": ...}
+
+        Either neighbour may be omitted; with neither the task goes to the
+        end of the column. The server allocates the new order key.
+        """
+        task = self.get_object()
+        old_status = task.status
+        
+        neighbour_ids = {key: request.data.get(key) for key in ('after', 'before') if request.data.get(key)}
+        if not all(normalize_project_id(pk) for pk in neighbour_ids.values()):
+            raise serializers.ValidationError("after and before must be task ids")
+        found = Task.objects.filter(project_id=task.project_id, id__in=neighbour_ids.values()).in_bulk()
+        found = {str(pk): neighbour for pk, neighbour in found.items()}
+        neighbours = {}
+        for key, neighbour_id in neighbour_ids.items():
+            neighbour = found.get(normalize_project_id(neighbour_id))
+            if neighbour is None:
+                raise NotFound(f"'{key}' task not found in this project")
+            neighbours[key] = neighbour
+        
+        new_status = request.data.get('status')
+        if new_status and new_status not in dict(Task.STATUS_CHOICES):
+            raise serializers.ValidationError(f'"{new_status}" is not a valid status')
+        
+        task = move_task(task, status=new_status, **neighbours)
+        
+        if task.status != old_status:
+            notify(
+                'task_updated',
+                f'Task "{task.title}" status changed to {task.get_status_display()}',
+                task=task, actor=request.user,
+            )
+        return Response(TaskListSerializer(task).data)
+
+    @action(detail=True, methods=['post', 'delete'])
+    def watch(self, request, pk=None):
+        """Follow (POST) or stop following (DELETE) a task's notifications"""
+        task = self.get_object()
+        if request.method == 'POST':
+            task.watchers.add(request.user)
+        else:
+            task.watchers.remove(request.user)
+        return Response({'watching': request.method == 'POST'})
+
+class CommentViewSet(ActorMixin, viewsets.ModelViewSet):
     """ViewSet for managing comments"""
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated, IsProjectMember]
@@ -200,15 +437,45 @@ class CommentViewSet(viewsets.ModelViewSet):
         project_id = self.request.query_params.get('project')
         task_id = self.request.query_params.get('task')
         
-        queryset = Comment.objects.select_related('author', 'project', 'task').prefetch_related('replies')
+        queryset = Comment.objects.select_related('author')
         
         if project_id:
             queryset = queryset.filter(project_id=project_id)
         if task_id:
             queryset = queryset.filter(task_id=task_id)
             
-        # Only get top-level comments (replies are included via serializer)
-        return queryset.filter(parent__isnull=True).order_by('-created_at')
+        # Only get top-level comments (replies are loaded per page by load_threads)
+        if self.action == 'list':
+            queryset = queryset.filter(parent__isnull=True)
+        return queryset.order_by('-created_at')
+    
+    def _thread_context(self, roots, offset=0):
+        try:
+            limit = int(self.request.query_params.get('replies_limit', thread_page_size()))
+            offset = int(self.request.query_params.get('replies_offset', offset))
+        except ValueError:
+            raise serializers.ValidationError("replies_limit and replies_offset must be integers")
+        limit = max(0, min(limit, thread_page_size()))
+        children, sizes = load_threads(roots, limit=limit, offset=max(0, offset))
+        context = self.get_serializer_context()
+        context.update(thread_children=children, thread_sizes=sizes)
+        return context
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        roots = page if page is not None else list(queryset)
+        serializer = self.get_serializer_class()(roots, many=True, context=self._thread_context(roots))
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        comment = self.get_object()
+        # Threads are loaded by their root; only this comment's subtree is rendered
+        root = comment if comment.root_id is None else Comment(id=comment.root_id)
+        serializer = self.get_serializer_class()(comment, context=self._thread_context([root]))
+        return Response(serializer.data)
     
     def perform_create(self, serializer):
         project_id = self.request.data.get('project_id')
@@ -228,37 +495,80 @@ class CommentViewSet(viewsets.ModelViewSet):
             task=task
         )
         
-        # Create notification for task assignee
-        if task and task.assignee and task.assignee != self.request.user:
-            Notification.objects.create(
-                user=task.assignee,
-                type='comment_added',
-                project=project,
-                task=task,
-                comment=comment,
-                message=f'New comment on task "{task.title}" by {self.request.user.display_name}'
+        # Fan out to the task's assignee, reporter, watchers and earlier commenters
+        if task:
+            notify(
+                'comment_added',
+                f'New comment on task "{task.title}" by {self.request.user.display_name}',
+                project=project, task=task, comment=comment, actor=self.request.user,
             )
+    
+    def perform_destroy(self, instance):
+        # Unread notifications about the comment and its replies go with them
+        unread = unread_by_user(Notification.objects.filter(comment_id__in=subtree_ids(instance)))
+        instance.delete()
+        discount_unread(unread)
 
 class NotificationViewSet(viewsets.ModelViewSet):
     """ViewSet for managing notifications"""
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationPagination
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return NotificationCompactSerializer
+        return NotificationSerializer
     
     def get_queryset(self):
-        return Notification.objects.filter(
-            user=self.request.user
-        ).select_related('project', 'task').order_by('-created_at')
+        queryset = Notification.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            queryset = queryset.select_related('project', 'task').only(
+                'id', 'type', 'message', 'count', 'is_read', 'created_at', 'user_id', 'comment_id',
+                'project__id', 'project__name', 'task__id', 'task__title',
+            )
+        else:
+            queryset = queryset.select_related(
+                'project__owner', 'project__stats', 'task__assignee', 'task__reporter'
+            )
+        return queryset.order_by('-created_at', '-id')
+    
+    def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
+        notification = serializer.save()
+        if notification.is_read != was_read:
+            adjust_unread([notification.user_id], -1 if notification.is_read else 1)
+    
+    def perform_destroy(self, instance):
+        instance.delete()
+        if not instance.is_read:
+            adjust_unread([instance.user_id], -1)
+    
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """Number of unread notifications, for the inbox badge"""
+        return Response({'unread_count': unread_count(request.user.id)})
     
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
         Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        reset_unread(request.user.id)
         return Response({'message': 'All notifications marked as read'})
 
-class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
-    """ViewSet for project activity logs"""
+class ActivityLogViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
+    """ViewSet for project activity logs.
+
+    Filter with ?verb=, ?target_type=, ?target_id= and ?field= (the field
+    an 'updated' event changed), e.g. the status changes of one task.
+    """
     serializer_class = ActivityLogSerializer
     permission_classes = [permissions.IsAuthenticated, IsProjectMember]
+    pagination_class = ActivityLogPagination
+    
+    def cache_scope(self):
+        project_id = normalize_project_id(self.request.query_params.get('project'))
+        return ([project_id], []) if project_id else None
     
     def get_queryset(self):
         project_id = self.request.query_params.get('project')
@@ -266,5 +576,144 @@ class ActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
             return ActivityLog.objects.none()
             
         return ActivityLog.objects.filter(
-            project_id=project_id
-        ).select_related('actor', 'project').order_by('-created_at')
\ No newline at end of file
+            project_id=project_id, **self.event_filters()
+        ).select_related('actor', 'project').order_by('-created_at', '-id')
+    
+    def event_filters(self):
+        filters = {
+            param: self.request.query_params[param]
+            for param in ('verb', 'target_type', 'target_id', 'field') if param in self.request.query_params
+        }
+        if 'field' in filters:
+            # Only updates carry a field; saying so lets the verb index serve it
+            filters.setdefault('verb', 'updated')
+        return filters
+    
+    @action(detail=False, methods=['get'])
+    def archive(self, request):
+        """One archived day (?date=) of the project's activity, newest first,
+        with the same filters as the list"""
+        day = _date_param(request, 'date')
+        if day is None:
+            raise serializers.ValidationError("date is required")
+        project_id = normalize_project_id(request.query_params.get('project'))
+        if project_id is None:
+            raise serializers.ValidationError("project is required")
+        filters = self.event_filters()
+        events = [event for event in read_archive(project_id, day)
+                  if all(getattr(event, name) == value for name, value in filters.items())]
+        actors = User.objects.in_bulk({event.actor_id for event in events})
+        for event in events:
+            event.actor = actors.get(event.actor_id)
+        return Response({'date': day, 'results': ActivityLogSerializer(events, many=True).data})
+    
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Daily counts of the project's retired activity from ?since to
+        ?until, and the days that can be read from the archive"""
+        project_id = normalize_project_id(request.query_params.get('project'))
+        if project_id is None:
+            raise serializers.ValidationError("project is required")
+        dates = {}
+        since = _date_param(request, 'since')
+        until = _date_param(request, 'until')
+        if since:
+            dates['date__gte'] = since
+        if until:
+            dates['date__lte'] = until
+        summaries = ActivitySummary.objects.filter(project_id=project_id, **dates).order_by(
+            'date', 'verb', 'target_type', 'field'
+        )
+        archives = ActivityArchive.objects.filter(project_id=project_id, **dates).order_by('date')
+        return Response({
+            'summaries': ActivitySummarySerializer(summaries, many=True).data,
+            'archived_days': [{'date': archive.date, 'events': archive.events} for archive in archives],
+        })
+
+class ImportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """Project imports started by the caller (input format in projects.importer).
+
+    POST a multipart upload to start one; poll the job for its progress.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ImportJobPagination
+    
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return ImportJobCreateSerializer
+        return ImportJobSerializer
+    
+    def get_queryset(self):
+        return ImportJob.objects.filter(created_by=self.request.user)
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save()
+        schedule_import(job)
+        job.refresh_from_db()
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['post'])
+    def resume(self, request, pk=None):
+        """Continue a failed or stalled import after the records it already committed"""
+        job = self.get_object()
+        if not is_resumable(job):
+            return Response({'error': 'Only failed or stalled imports can be resumed'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not job.source:
+            return Response({'error': 'The upload of this import is no longer available'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        schedule_import(job)
+        job.refresh_from_db()
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+class SearchView(generics.GenericAPIView):
+    """Full-text search across the caller's projects, best matches first.
+
+    ?q=<text> is required. ?type=task,comment,project narrows the kinds of
+    object, ?project=<id> a single project, and ?limit/?offset page
+    through the ranked hits.
+    """
+    serializer_class = SearchResultSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    max_limit = 50
+    
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        if any(kind not in search.KINDS for kind in kinds):
+            raise serializers.ValidationError(f"type must be one of: {', '.join(search.KINDS)}")
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), self.max_limit))
+            offset = max(0, int(request.query_params.get('offset', 0)))
+        except ValueError:
+            raise serializers.ValidationError("limit and offset must be integers")
+        
+        project_ids = list(project_roles(request.user.id, request))
+        project_id = request.query_params.get('project')
+        if project_id:
+            if not is_member(request.user.id, project_id, request):
+                raise PermissionDenied("You must be a project member")
+            project_ids = [normalize_project_id(project_id)]
+        
+        hits = search.search(query, project_ids=project_ids, kinds=kinds, limit=limit, offset=offset)
+        
+        # Display names for the page of hits, one query per kind of name
+        project_names = dict(Project.objects.filter(
+            id__in={hit['project_id'] for hit in hits}
+        ).values_list('id', 'name')) if hits else {}
+        task_ids = {hit['task_id'] for hit in hits if hit['kind'] == 'comment' and hit['task_id']}
+        task_titles = dict(Task.objects.filter(id__in=task_ids).values_list('id', 'title')) if task_ids else {}
+        for hit in hits:
+            hit['project_name'] = project_names.get(hit['project_id'])
+            hit['task_title'] = hit['title'] if hit['kind'] == 'task' else task_titles.get(hit['task_id'])
+        
+        return Response({
+            'results': self.get_serializer(hits, many=True).data,
+            'next_offset': offset + limit if len(hits) == limit else None,
+        })
@@ -0,0 +1,100 @@
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from .cache import versioned_caching, versioned_key
+from .models import Project, Task
+from .serializers import UserBasicSerializer
+
+User = get_user_model()
+
+OPEN_STATUSES = ['todo', 'in_progress', 'blocked']
+STATUSES = [choice[0] for choice in Task.STATUS_CHOICES]
+PRIORITIES = [choice[0] for choice in Task.PRIORITY_CHOICES]
+
+def workload_cache_timeout():
+    return getattr(settings, 'WORKLOAD_CACHE_TIMEOUT', 300)
+
+def _aggregates(today):
+    """Conditional counts computed in a single GROUP BY"""
+    is_open = Q(status__in=OPEN_STATUSES)
+    week_end = today + timedelta(days=6 - today.weekday())
+    aggregates = {
+        'total_tasks': Count('id'),
+        'open_tasks': Count('id', filter=is_open),
+        'overdue': Count('id', filter=is_open & Q(due_date__lt=today)),
+        'due_this_week': Count('id', filter=is_open & Q(due_date__gte=today, due_date__lte=week_end)),
+    }
+    for status in STATUSES:
+        aggregates[f'status_{status}'] = Count('id', filter=Q(status=status))
+    for priority in PRIORITIES:
+        aggregates[f'priority_{priority}'] = Count('id', filter=is_open & Q(priority=priority))
+    return aggregates
+
+def _shape(row):
+    return {
+        'open_tasks': row['open_tasks'],
+        'total_tasks': row['total_tasks'],
+        'overdue': row['overdue'],
+        'due_this_week': row['due_this_week'],
+        'by_status': {status: row[f'status_{status}'] for status in STATUSES},
+        'by_priority': {priority: row[f'priority_{priority}'] for priority in PRIORITIES},
+    }
+
+def project_workload(project_ids, today=None):
+    """Per-assignee workload across the given projects, in two queries"""
+    today = today or timezone.localdate()
+    rows = list(
+        Task.objects.filter(project_id__in=project_ids, assignee__isnull=False)
+        .values('assignee_id').annotate(**_aggregates(today)).order_by('assignee_id')
+    )
+    users = User.objects.in_bulk([row['assignee_id'] for row in rows])
+    result = []
+    for row in rows:
+        user = users.get(row['assignee_id'])
+        if user is None:
+            continue
+        result.append({
+            'assignee': UserBasicSerializer(user).data,
+            'assignee_id': user.id,
+            **_shape(row),
+        })
+    result.sort(key=lambda item: -item['open_tasks'])
+    return result
+
+def portfolio_workload(user, project_ids, today=None):
+    """One user's workload broken down by project, in two queries"""
+    today = today or timezone.localdate()
+    rows = list(
+        Task.objects.filter(project_id__in=project_ids, assignee=user)
+        .values('project_id').annotate(**_aggregates(today)).order_by('project_id')
+    )
+    names = dict(Project.objects.filter(id__in=[row['project_id'] for row in rows]).values_list('id', 'name'))
+    return [
+        {'project_id': str(row['project_id']), 'project_name': names.get(row['project_id']), **_shape(row)}
+        for row in rows
+    ]
+
+def cached_project_workload(project_ids):
+    today = timezone.localdate()
+    if not versioned_caching():
+        return project_workload(project_ids, today)
+    key = versioned_key('workload', project_ids, today)
+    result = cache.get(key)
+    if result is None:
+        result = project_workload(project_ids, today)
+        cache.set(key, result, workload_cache_timeout())
+    return result
+
+def cached_portfolio_workload(user, project_ids):
+    today = timezone.localdate()
+    if not versioned_caching():
+        return portfolio_workload(user, project_ids, today)
+    key = versioned_key('portfolio', project_ids, user.id, today)
+    result = cache.get(key)
+    if result is None:
+        result = portfolio_workload(user, project_ids, today)
+        cache.set(key, result, workload_cache_timeout())
+    return result
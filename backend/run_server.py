@@ -1,32 +1,138 @@
 #!/usr/bin/env python
 """
 SynergySphere Backend Server
-Run this script to start the Django development server
+
+    python run_server.py             development server (migrates, then runserver)
+    python run_server.py migrate     apply model changes and migrations, then exit
+    python run_server.py serve       production server (run `migrate` first)
+
+`serve` runs under the production settings profile (SYNERGY_ENV=production,
+so SECRET_KEY must be set) with a pool of worker processes:
+
+    --interface wsgi  gunicorn with threaded (gthread) workers, one pool
+                      sized to the cores (the default)
+    --interface asgi  gunicorn with uvicorn workers; needed for the
+                      /api/stream/ push channel, which answers 501 under
+                      WSGI (the dev server included)
+
+Worker and thread counts default to WEB_CONCURRENCY (else 2 x cores + 1)
+and SERVER_THREADS; threads only apply to wsgi, as Django gives every
+ASGI request its own thread for sync views.
+With more than one worker, use a shared cache and realtime broker (see
+CACHES and REALTIME_BROKER in synergy/settings.py). The default in-process
+broker only reaches streams open on the same worker, so asgi runs a single
+worker, and refuses more, unless REALTIME_BROKER names a shared one.
+Activity is logged through the ActivityQueue outbox in production; run
+`python manage.py process_activity_queue` alongside the server.
 """
+import argparse
 import os
+import shutil
 import sys
 import subprocess
+from decouple import UndefinedValueError, config
 
-def main():
-    """Run the Django development server"""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'synergy.settings')
-    
-    # Run migrations first
+IN_PROCESS_BROKER = 'projects.realtime.InProcessBroker'
+
+def migrate():
+    """Create and apply migrations for model changes"""
     print("Running database migrations...")
     subprocess.run([sys.executable, 'manage.py', 'makemigrations'], check=True)
     subprocess.run([sys.executable, 'manage.py', 'migrate'], check=True)
-    
+
+def develop(args):
+    """Run the Django development server"""
+    migrate()
+
     # Create superuser if needed (optional)
     # subprocess.run([sys.executable, 'manage.py', 'createsuperuser', '--noinput'], check=False)
-    
+
     print("Starting SynergySphere backend server...")
-    print("Server will be available at: http://127.0.0.1:8000")
-    print("API endpoints available at: http://127.0.0.1:8000/api/")
-    print("Admin panel available at: http://127.0.0.1:8000/admin/")
+    print(f"Server will be available at: http://{args.bind}")
+    print(f"API endpoints available at: http://{args.bind}/api/")
+    print(f"Admin panel available at: http://{args.bind}/admin/")
     print("\nPress Ctrl+C to stop the server\n")
-    
+
     # Start the server
-    subprocess.run([sys.executable, 'manage.py', 'runserver', '127.0.0.1:8000'])
+    subprocess.run([sys.executable, 'manage.py', 'runserver', args.bind])
+
+def shared_broker():
+    """Whether the configured realtime broker reaches every worker"""
+    from django.conf import settings
+    return settings.REALTIME_BROKER != IN_PROCESS_BROKER
+
+def serve(args):
+    """Replace this process with a gunicorn worker pool"""
+    os.environ.setdefault('SYNERGY_ENV', 'production')
+    gunicorn = shutil.which('gunicorn')
+    if gunicorn is None:
+        sys.exit("gunicorn is not installed: pip install -r requirements.txt")
+
+    # Checked here, as the settings (and every worker) would fail on it
+    # with a traceback
+    try:
+        config('SECRET_KEY')
+    except UndefinedValueError:
+        sys.exit("SECRET_KEY is not set: export it or add it to .env before running serve")
+
+    if args.interface == 'asgi' and not shared_broker():
+        if args.workers is not None and args.workers > 1:
+            sys.exit("--workers must be 1 under asgi while REALTIME_BROKER is the in-process broker: "
+                     "events published on one worker would never reach streams open on another")
+        args.workers = 1
+    elif args.workers is None:
+        args.workers = 2 * (os.cpu_count() or 1) + 1
+
+    command = [
+        gunicorn,
+        '--bind', args.bind,
+        '--workers', str(args.workers),
+        '--timeout', str(args.timeout),
+        # Recycle workers now and then, staggered, to bound memory growth
+        '--max-requests', str(args.max_requests),
+        '--max-requests-jitter', str(args.max_requests // 10),
+        '--access-logfile', '-',
+    ]
+    if args.interface == 'asgi':
+        command += ['--worker-class', 'uvicorn.workers.UvicornWorker', 'synergy.asgi:application']
+        pool = f"{args.workers} worker(s)"
+    else:
+        command += ['--worker-class', 'gthread', '--threads', str(args.threads), 'synergy.wsgi:application']
+        pool = f"{args.workers} worker(s) x {args.threads} thread(s)"
+
+    print(f"Starting SynergySphere ({args.interface}, {pool}) on http://{args.bind}")
+    os.execv(gunicorn, command)
+
+def main():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'synergy.settings')
+
+    parser = argparse.ArgumentParser(description='Run the SynergySphere backend')
+    commands = parser.add_subparsers(dest='command')
+
+    dev = commands.add_parser('dev', help='Development server (the default)')
+    dev.add_argument('--bind', default='127.0.0.1:8000')
+
+    commands.add_parser('migrate', help='Apply migrations and exit')
+
+    production = commands.add_parser('serve', help='Production server with a worker pool')
+    production.add_argument('--bind', default=os.environ.get('BIND', '0.0.0.0:8000'))
+    production.add_argument('--interface', choices=['wsgi', 'asgi'], default=os.environ.get('SERVER_INTERFACE', 'wsgi'))
+    production.add_argument('--workers', type=int,
+                            default=int(os.environ['WEB_CONCURRENCY']) if 'WEB_CONCURRENCY' in os.environ else None)
+    production.add_argument('--threads', type=int, default=int(os.environ.get('SERVER_THREADS', 4)))
+    production.add_argument('--timeout', type=int, default=int(os.environ.get('SERVER_TIMEOUT', 60)))
+    production.add_argument('--max-requests', type=int, default=int(os.environ.get('SERVER_MAX_REQUESTS', 10000)))
+
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        migrate()
+    elif args.command == 'serve':
+        serve(args)
+    else:
+        if args.command is None:
+            args = dev.parse_args([])
+        develop(args)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,15 @@
+"""
+ASGI config for SynergySphere project.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'synergy.settings')
+
+application = get_asgi_application()
+
+# Resume imports a previous server process left unfinished
+from projects.importer import start_import_runner
+start_import_runner()
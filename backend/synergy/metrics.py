@@ -0,0 +1,252 @@
+"""
+Request metrics and the Prometheus /metrics endpoint.
+
+MetricsMiddleware records, per view (its URL name) and method:
+
+* total latency, and the number of requests by status code
+* SQL query count and time, captured by an execute_wrapper installed on
+  every database connection, which charges queries to the request in the
+  current context; under ASGI that includes the thread sync views run on
+* time spent rendering serializers that use TimedSerializerMixin, and
+  row mappers (projects.rows), counting only the outermost call
+* response size (not for streaming responses, whose body and queries
+  come after the middleware has returned)
+
+into in-process histograms served by metrics_view in the Prometheus text
+format. Each worker process keeps and reports its own series. /metrics
+is off until settings.METRICS_TOKEN is set, and then answers scrapers
+sending it as a bearer token ("Authorization: Bearer <token>"); the
+client address is no use for this behind a reverse proxy.
+
+With settings.METRICS_SLOW_REQUEST_SECONDS set, requests at least that
+slow are logged with their most repeated SQL statements, which is where
+N+1 query patterns show up.
+"""
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Thread-safe histogram with one series per combination of labels"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one for +Inf), then sum and count
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0, 0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), values):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labels, labels, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {_number(values[-2])}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {values[-1]}'
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            series = dict(self._series)
+        for labels, value in sorted(series.items()):
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+REQUESTS = Counter('http_requests_total', 'Requests handled', ('view', 'method', 'status'))
+LATENCY = Histogram('http_request_duration_seconds', 'Time to produce the response',
+                    ('view', 'method'), LATENCY_BUCKETS)
+QUERIES = Histogram('http_request_db_queries', 'SQL queries per request', ('view', 'method'), QUERY_COUNT_BUCKETS)
+QUERY_TIME = Histogram('http_request_db_duration_seconds', 'Time spent in SQL per request',
+                       ('view', 'method'), LATENCY_BUCKETS)
+SERIALIZER_TIME = Histogram('http_request_serializer_duration_seconds', 'Time spent in serializers per request',
+                            ('view', 'method'), LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Size of non-streaming response bodies',
+                          ('view', 'method'), SIZE_BUCKETS)
+METRICS = [REQUESTS, LATENCY, QUERIES, QUERY_TIME, SERIALIZER_TIME, RESPONSE_SIZE]
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+def metrics_view(request):
+    """The metrics in the Prometheus text format, for holders of the token only"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        raise Http404
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.strip().encode(), token.encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+_current = ContextVar('metrics_request', default=None)
+
+class RequestMetrics:
+    """What one request spent, gathered while it runs"""
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = {}
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._token = _current.set(self)
+        for connection in connections.all():
+            _instrument(connection=connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        _current.reset(self._token)
+        self.elapsed = time.perf_counter() - self.started
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.query_time += elapsed
+        count, total = self.statements.get(sql, (0, 0.0))
+        self.statements[sql] = (count + 1, total + elapsed)
+
+def _execute(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+def _instrument(sender=None, connection=None, **kwargs):
+    """Install _execute on a connection, once. Connections belong to a
+    thread, so this also runs as each one connects (connection_created)"""
+    if not getattr(connection, 'metrics_instrumented', False):
+        connection.execute_wrappers.append(_execute)
+        connection.metrics_instrumented = True
+
+def timed_serialization(render, *args, **kwargs):
+    """Call render, charging its time to the current request's serializers"""
+    metrics = _current.get()
+    if metrics is None or metrics.serializer_depth:
+        # Outside a request, or nested in a serializer already timed
+        return render(*args, **kwargs)
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        return render(*args, **kwargs)
+    finally:
+        metrics.serializer_depth -= 1
+        metrics.serializer_time += time.perf_counter() - started
+
+class TimedSerializerMixin:
+    """Count a serializer's to_representation in the request metrics"""
+
+    def to_representation(self, instance):
+        return timed_serialization(super().to_representation, instance)
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(_instrument)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with RequestMetrics() as metrics:
+            response = self.get_response(request)
+        self.record(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        with RequestMetrics() as metrics:
+            response = await self.get_response(request)
+        self.record(request, response, metrics)
+        return response
+
+    def record(self, request, response, metrics):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.route) if match else 'unmatched'
+        labels = (view, request.method)
+        REQUESTS.inc(*labels, str(response.status_code))
+        LATENCY.observe(metrics.elapsed, *labels)
+        QUERIES.observe(metrics.queries, *labels)
+        QUERY_TIME.observe(metrics.query_time, *labels)
+        SERIALIZER_TIME.observe(metrics.serializer_time, *labels)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(len(response.content), *labels)
+
+        threshold = getattr(settings, 'METRICS_SLOW_REQUEST_SECONDS', None)
+        if threshold is not None and metrics.elapsed >= threshold:
+            self.log_slow(request, response, view, metrics)
+
+    def log_slow(self, request, response, view, metrics):
+        top = getattr(settings, 'METRICS_SLOW_REQUEST_TOP_SQL', 5)
+        repeated = sorted(((count, total, sql) for sql, (count, total) in metrics.statements.items() if count > 1),
+                          reverse=True)[:top]
+        logger.warning(
+            'Slow request %s %s (%s) -> %s in %.0f ms: %d queries in %.0f ms, serializers %.0f ms%s',
+            request.method, request.get_full_path(), view, response.status_code, metrics.elapsed * 1000,
+            metrics.queries, metrics.query_time * 1000, metrics.serializer_time * 1000,
+            ''.join(f'\n    {count}x {total * 1000:.1f} ms  {sql}' for count, total, sql in repeated),
+        )
@@ -1,21 +1,33 @@
 """
 Django settings for SynergySphere project.
+
+Values marked config(...) come from the environment or a .env file.
+SYNERGY_ENV picks the profile the defaults follow: 'development' (the
+default) or 'production', which requires SECRET_KEY and turns DEBUG off.
 """
 
 from pathlib import Path
 from datetime import timedelta
 import os
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+ENVIRONMENT = config('SYNERGY_ENV', default='development')
+PRODUCTION = ENVIRONMENT == 'production'
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-your-secret-key-change-in-production'
+if PRODUCTION:
+    SECRET_KEY = config('SECRET_KEY')
+else:
+    SECRET_KEY = config('SECRET_KEY', default='django-insecure-your-secret-key-change-in-production')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DEBUG also keeps every SQL query of a request in memory.
+DEBUG = config('DEBUG', default=not PRODUCTION, cast=bool)
 
-ALLOWED_HOSTS = ['localhost', '127.0.0.1', '0.0.0.0']
+ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1,0.0.0.0', cast=Csv())
 
 # Application definition
 INSTALLED_APPS = [
@@ -38,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    'synergy.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -67,15 +81,31 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'synergy.wsgi.application'
+ASGI_APPLICATION = 'synergy.asgi.application'
 
-# Database
+# Database. CONN_MAX_AGE keeps each worker thread's connection open
+# across requests instead of reconnecting for every one.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': config('DB_ENGINE', default='django.db.backends.sqlite3'),
+        'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+        'USER': config('DB_USER', default=''),
+        'PASSWORD': config('DB_PASSWORD', default=''),
+        'HOST': config('DB_HOST', default=''),
+        'PORT': config('DB_PORT', default=''),
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=600 if PRODUCTION else 0, cast=int),
+        'CONN_HEALTH_CHECKS': config('CONN_HEALTH_CHECKS', default=PRODUCTION, cast=bool),
     }
 }
 
+# SQLite tuning applied to every new connection (projects.database).
+# WAL lets readers run while a worker writes; writers wait up to
+# SQLITE_BUSY_TIMEOUT seconds for the lock instead of failing with
+# "database is locked".
+SQLITE_JOURNAL_MODE = config('SQLITE_JOURNAL_MODE', default='WAL')
+SQLITE_SYNCHRONOUS = config('SQLITE_SYNCHRONOUS', default='NORMAL')
+SQLITE_BUSY_TIMEOUT = config('SQLITE_BUSY_TIMEOUT', default=20.0, cast=float)
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -128,6 +158,125 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Comment threads
+COMMENT_THREAD_MAX_DEPTH = 10
+COMMENT_THREAD_REPLIES_PAGE_SIZE = 50
+
+# Cache for version stamps, membership maps, aggregates and API responses.
+# Local memory is per process, so the production profile defaults to a
+# cache shared by every worker (a directory here; point CACHE_BACKEND at
+# Redis or Memcached where available) so invalidation reaches them all.
+# Version stamps and counters are bumped with cache.incr, which only Redis,
+# Memcached and local memory do atomically; on the file (or database)
+# cache concurrent bumps can be lost, so there payloads, membership maps
+# and unread counts are read from the database instead of cached (see
+# projects.cache.versioned_caching).
+# Set CACHE_BACKEND to Redis or Memcached to cache in production.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default=(
+            'django.core.cache.backends.filebased.FileBasedCache' if PRODUCTION
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        )),
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache') if PRODUCTION else 'synergy'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+# Seconds a cached list/detail payload of the projects API may be served;
+# entries are also invalidated by the project version stamps.
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Seconds a user's cached {project: role} map may be reused; it is also
+# invalidated whenever one of their memberships changes.
+MEMBERSHIP_CACHE_TIMEOUT = 600
+
+# Seconds a workload aggregate may be served from cache; entries are also
+# invalidated as soon as a task in one of the projects changes.
+WORKLOAD_CACHE_TIMEOUT = 300
+
+# Activity log pipeline: 'sync' writes inline, 'thread' buffers and flushes
+# from a background thread, 'queue' uses the ActivityQueue outbox drained
+# by `manage.py process_activity_queue`. Only 'queue' survives the process
+# dying (worker timeouts and recycling included), so production defaults to
+# it and needs that command running; 'thread' there is an explicit opt-in.
+ACTIVITY_LOG_MODE = config('ACTIVITY_LOG_MODE', default='queue' if PRODUCTION else 'thread')
+ACTIVITY_LOG_BATCH_SIZE = 200
+ACTIVITY_LOG_FLUSH_INTERVAL = 1.0
+
+# Repeated task_updated/comment_added notifications for the same user and
+# task within this many seconds are folded into one unread row.
+NOTIFICATION_COALESCE_WINDOW = 600
+NOTIFICATION_UNREAD_CACHE_TIMEOUT = 3600
+
+# Push channel (/api/stream/), served over ASGI only (it answers 501 under
+# WSGI). Replace the broker with a shared one when running more than one
+# server process.
+REALTIME_BROKER = config('REALTIME_BROKER', default='projects.realtime.InProcessBroker')
+REALTIME_HEARTBEAT_SECONDS = 15
+REALTIME_QUEUE_SIZE = 100
+
+# Largest batch accepted by the bulk task endpoints (/api/tasks/bulk/)
+TASK_BULK_MAX_ITEMS = 500
+
+# Task reordering: tasks respaced around a gap that is running out of
+# float precision, and whether that happens on a background thread.
+TASK_REORDER_WINDOW = 20
+TASK_REORDER_BACKGROUND = True
+
+# Full-text search backend (projects.search). None picks SQLite FTS5 when
+# available and falls back to substring matching on other databases.
+SEARCH_BACKEND = None
+
+# Deadline reminders (manage.py send_deadline_reminders): a deadline_soon
+# notification goes out when an open task is this many days from due.
+DEADLINE_REMINDER_WINDOWS = [1, 3]
+
+# Rows fetched (and users resolved) per chunk by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Longest range, in days, one /api/projects/{id}/analytics/ request may cover
+ANALYTICS_MAX_DAYS = 365
+
+# Retention (`manage.py apply_retention`, projects.retention): read
+# notifications and activity older than these many days leave the hot
+# tables (None keeps them), RETENTION_BATCH_SIZE rows per transaction.
+# Retired activity is kept as daily counts, and as gzipped NDJSON files
+# under ACTIVITY_ARCHIVE_DIR (empty to skip) readable at
+# /api/activities/archive/.
+NOTIFICATION_RETENTION_DAYS = 30
+ACTIVITY_RETENTION_DAYS = 90
+RETENTION_BATCH_SIZE = 1000
+ACTIVITY_ARCHIVE_DIR = config('ACTIVITY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'activity')) or None
+
+# Project imports (projects.importer): records written per transaction,
+# errors kept on the job, and whether uploads run on a background thread.
+# A pending or running import that has made no progress for
+# IMPORT_STALE_SECONDS (far longer than one chunk takes) is treated as left
+# behind by a dead process: the API can resume it and the background
+# runner picks it up again.
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_ERRORS = 100
+IMPORT_BACKGROUND = True
+IMPORT_STALE_SECONDS = 600
+
+# Request metrics (synergy.metrics): the bearer token scrapers send to read
+# /metrics (unset turns the endpoint off), and the latency from which a
+# request is logged with its top repeated SQL statements (None disables
+# the slow-request log).
+METRICS_TOKEN = config('METRICS_TOKEN', default=None)
+METRICS_SLOW_REQUEST_SECONDS = config('METRICS_SLOW_REQUEST_SECONDS', default=None,
+                                      cast=lambda value: None if value is None else float(value))
+METRICS_SLOW_REQUEST_TOP_SQL = 5
+
+# Board snapshots (/api/projects/{id}/board/): how many recent activity
+# events they carry, how long a version stays usable as ?since=, and how
+# many seconds before that version a delta starts, to catch writes still
+# in flight when it was served
+BOARD_ACTIVITY_LIMIT = 20
+BOARD_VERSION_TIMEOUT = 86400
+BOARD_DELTA_OVERLAP_SECONDS = 30
+
 # Simple JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),